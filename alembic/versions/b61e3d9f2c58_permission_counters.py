@@ -0,0 +1,78 @@
+"""permission counters
+
+Revision ID: b61e3d9f2c58
+Revises: 8d2b6f0c4a17
+Create Date: 2026-10-19 13:05:41.209117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b61e3d9f2c58'
+down_revision = '8d2b6f0c4a17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # counters are rebuilt by the reconcile job, no data to migrate
+    op.drop_table('resource_counter')
+    op.drop_table('archive_counter')
+    op.create_table(
+        'resource_counter',
+        sa.Column('folder_url', sa.String(length=255), nullable=False),
+        sa.Column('tag_id', sa.Integer(), nullable=False,
+                  comment='0 for folder total'),
+        sa.Column('public_only', sa.Boolean(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('folder_url', 'tag_id', 'public_only')
+    )
+    op.create_table(
+        'archive_counter',
+        sa.Column('folder_url', sa.String(length=255), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('month', sa.Integer(), nullable=False),
+        sa.Column('public_only', sa.Boolean(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('folder_url', 'year', 'month', 'public_only')
+    )
+    op.create_index(
+        op.f('ix_resource_owner_id'), 'resource',
+        ['owner_id'], unique=False
+    )
+    op.create_index(
+        op.f('ix_resource_group_id'), 'resource',
+        ['group_id'], unique=False
+    )
+    op.create_index(
+        'ix_resource_parent_url_updated_time', 'resource',
+        ['parent_url', 'updated_time'], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        'ix_resource_parent_url_updated_time', table_name='resource'
+    )
+    op.drop_index(op.f('ix_resource_group_id'), table_name='resource')
+    op.drop_index(op.f('ix_resource_owner_id'), table_name='resource')
+    op.drop_table('archive_counter')
+    op.drop_table('resource_counter')
+    op.create_table(
+        'resource_counter',
+        sa.Column('folder_url', sa.String(length=255), nullable=False),
+        sa.Column('tag_id', sa.Integer(), nullable=False,
+                  comment='0 for folder total'),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('folder_url', 'tag_id')
+    )
+    op.create_table(
+        'archive_counter',
+        sa.Column('folder_url', sa.String(length=255), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('month', sa.Integer(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('folder_url', 'year', 'month')
+    )
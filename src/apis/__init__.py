@@ -6,6 +6,7 @@ from .content_controller import content_router
 from .default_controller import default_router
 from .file_controller import file_router
 from .folder_controller import folder_router
+from .search_controller import search_router
 from .tag_controller import tag_router
 from .user_controller import user_router
 
@@ -16,6 +17,7 @@ router.include_router(content_router)
 router.include_router(default_router)
 router.include_router(file_router)
 router.include_router(folder_router)
+router.include_router(search_router)
 router.include_router(tag_router)
 router.include_router(user_router)
 
@@ -1,4 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Response,
+    status
+)
 from fastapi.security import OAuth2PasswordRequestForm
 
 from config import CustomHeaders, Status
@@ -81,6 +88,18 @@ async def login_2fa(
     return SecurityService.create_access_tokens(user_output)
 
 
+@auth_router.post(
+    '/logout', response_model=bool,
+    dependencies=[Depends(SecurityService.login_required)]
+)
+async def logout(
+    access_token: str = Depends(SecurityService.oauth2_scheme),
+    refresh_token: str | None = Header(default=None)
+):
+    await SecurityService.revoke_tokens(access_token, refresh_token)
+    return True
+
+
 @auth_router.post('/refresh', response_model=TokenResponse)
 async def refresh(
     response: Response,
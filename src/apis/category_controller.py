@@ -1,9 +1,15 @@
 from fastapi import APIRouter, Depends
 
 from dao import AsyncDatabase
-from schemas import TagSchema
-from service import RoleRequired, TagService
-from models import PostCategory, Tag
+from schemas import TagCount, TagSchema, UserOutput
+from service import (
+    CounterService,
+    ResourceService,
+    RoleRequired,
+    SecurityService,
+    TagService
+)
+from models import Folder, PostCategory, Tag
 
 
 category_router = APIRouter(
@@ -31,6 +37,21 @@ async def get_category(category: TagSchema = Depends()):
     return [TagSchema.init(x) for x in tags]
 
 
+@category_router.get('/cloud/{url:path}', response_model=list[TagCount])
+async def get_category_cloud(
+    url: str = '',
+    cur_user: UserOutput = Depends(SecurityService.optional_login_required)
+):
+    if len(url) > 0 and url[0] != '/':
+        url = f'/{url}'
+    folders = await ResourceService.find_resources(Folder(url=url))
+    assert len(folders) == 1
+    ResourceService.check_permission(folders[0], cur_user, 1)
+    return await CounterService.find_tag_counts(
+        url, PostCategory, ResourceService.read_scope(cur_user)
+    )
+
+
 @category_router.put(
     '', response_model=TagSchema,
     dependencies=[Depends(RoleRequired('admin'))]
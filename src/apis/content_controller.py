@@ -1,16 +1,17 @@
-import asyncio
 import pickle
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, Response
 
 from dao import AsyncDatabase, AsyncRedis, RedisKey
 from models import Content, Resource
 from schemas import AlgoliaPostIndex, ContentInput, ContentOutput, UserOutput
 from service import (
     AlgoliaService,
+    CodecService,
     RoleRequired,
     ResourceService,
-    SecurityService
+    SecurityService,
+    TaskService
 )
 
 
@@ -33,13 +34,12 @@ async def add_content(
     content.parent_url = '/draft'
 
     content = await ResourceService.add_resource(content)
-    for task in (
-        redis.set(RedisKey.content(content.id), pickle.dumps(content)),
-        redis.delete(RedisKey.COUNT_DICT),
-        redis.delete(RedisKey.PREVIEW_DICT)
-    ):
-        asyncio.create_task(task)
-
+    await redis.delete(
+        RedisKey.ARCHIVE_DICT, RedisKey.COUNT_DICT, RedisKey.PREVIEW_DICT
+    )
+    TaskService.submit(
+        redis.set(RedisKey.content(content.id), pickle.dumps(content))
+    )
     return content.id
 
 
@@ -49,17 +49,36 @@ async def get_content(
     cur_user: UserOutput = Depends(SecurityService.optional_login_required),
     redis: AsyncRedis = Depends(AsyncRedis.get_connection)
 ):
-    contents_str = await redis.get(RedisKey.content(content_id))
-    if contents_str is not None:
-        contents = [pickle.loads(contents_str)]
+    content = await find_content(content_id, redis)
+    ResourceService.check_permission(content, cur_user, 1)
+    return content_output(content)
+
+
+@content_router.get('/{content_id}/html', response_class=Response)
+async def get_content_html(
+    content_id: int,
+    accept_encoding: str | None = Header(default=None),
+    cur_user: UserOutput = Depends(SecurityService.optional_login_required),
+    redis: AsyncRedis = Depends(AsyncRedis.get_connection)
+):
+    """
+    Serve the stored zstd frame untouched to clients accepting zstd,
+    frames compressed with a trained dictionary are not decodable
+    by clients and thus always decompressed here.
+    """
+    content = await find_content(content_id, redis)
+    ResourceService.check_permission(content, cur_user, 1)
+    headers = {'Vary': 'Accept-Encoding'}
+    body = content.content if content.content is not None else b''
+    if (
+        CodecService.is_encoded(body) and
+        CodecService.is_dictless(body) and
+        CodecService.accepts(accept_encoding)
+    ):
+        headers['Content-Encoding'] = CodecService.ENCODING
     else:
-        contents = await ResourceService.find_resources(Content(id=content_id))
-        asyncio.create_task(redis.set(
-            RedisKey.content(content_id), pickle.dumps(contents[0])
-        ))
-    assert len(contents) == 1
-    ResourceService.check_permission(contents[0], cur_user, 1)
-    return ContentOutput.init(contents[0])
+        body = CodecService.decode(body)
+    return Response(content=body, media_type='text/html', headers=headers)
 
 
 @content_router.put(
@@ -74,19 +93,21 @@ async def modify_content(
     content = await ResourceService.modify_resource(
         Content(**content_input.dict())
     )
-    for task in (
-        AlgoliaService.save_contents(
-            [AlgoliaPostIndex.parse_content(content)]
-        ) if content.parent_url == '/post'  # algolia save/delete task
-        else AlgoliaService.delete_contents([content.id]),
-        ResourceService.trim_files(content_input.id, content_input.files),
-        redis.set(RedisKey.content(content.id), pickle.dumps(content)),
-        redis.delete(RedisKey.COUNT_DICT),
-        redis.delete(RedisKey.PREVIEW_DICT)
-    ):
-        asyncio.create_task(task)
-
-    return ContentOutput.init(content)
+    # a stale cache must not outlive the request, the index may lag
+    await redis.delete(
+        RedisKey.content(content.id),
+        RedisKey.ARCHIVE_DICT,
+        RedisKey.COUNT_DICT,
+        RedisKey.PREVIEW_DICT
+    )
+    await TaskService.enqueue(AlgoliaService.sync, operations={
+        str(content.id): AlgoliaPostIndex.parse_content(content).dict()
+        if content.parent_url == '/post' else None  # save or delete
+    })
+    TaskService.submit(
+        redis.set(RedisKey.content(content.id), pickle.dumps(content))
+    )
+    return content_output(content)
 
 
 @content_router.delete(
@@ -97,12 +118,34 @@ async def delete_content(
     content_id: int,
     redis: AsyncRedis = Depends(AsyncRedis.get_connection)
 ):
-    for task in (
-        AlgoliaService.delete_contents([content_id]),
-        ResourceService.trim_files(content_id, set()),
-        redis.delete(RedisKey.content(content_id)),
-        redis.delete(RedisKey.COUNT_DICT),
-        redis.delete(RedisKey.PREVIEW_DICT)
-    ):
-        asyncio.create_task(task)
-    return await ResourceService.remove_resource(Resource(id=content_id))
+    count = await ResourceService.remove_resource(Resource(id=content_id))
+    await redis.delete(
+        RedisKey.content(content_id),
+        RedisKey.ARCHIVE_DICT,
+        RedisKey.COUNT_DICT,
+        RedisKey.PREVIEW_DICT
+    )
+    await TaskService.enqueue(
+        AlgoliaService.sync, operations={str(content_id): None}
+    )
+    return count
+
+
+async def find_content(content_id: int, redis: AsyncRedis) -> Content:
+    # cached content keeps its body as the encoded frame
+    contents_str = await redis.get(RedisKey.content(content_id))
+    if contents_str is not None:
+        contents = [pickle.loads(contents_str)]
+    else:
+        contents = await ResourceService.find_resources(Content(id=content_id))
+        TaskService.submit(redis.set(
+            RedisKey.content(content_id), pickle.dumps(contents[0])
+        ))
+    assert len(contents) == 1
+    return contents[0]
+
+
+def content_output(content: Content) -> ContentOutput:
+    output = ContentOutput.init(content)
+    output.content = CodecService.decode(output.content)
+    return output
@@ -1,8 +1,17 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, status
 
 from config import Config
-from dao import AsyncRedis, RedisKey
-from service import AlgoliaService, APIThrottle, HTTPService
+from service import (
+    AlgoliaService,
+    APIThrottle,
+    CodecService,
+    HTTPService,
+    MailService,
+    RenderService,
+    RevocationService,
+    SchedulerService,
+    TaskService
+)
 
 
 default_router = APIRouter(prefix='/default', tags=['default'])
@@ -12,10 +21,14 @@ default_router = APIRouter(prefix='/default', tags=['default'])
     '/bing', response_model=str,
     dependencies=[Depends(APIThrottle(60))]
 )
-async def bing_url(redis: AsyncRedis = Depends(AsyncRedis.get_connection)):
-    if (url := await redis.get(RedisKey.BING_IMAGE_URL)) is None:
-        return await HTTPService.parse_bing_image_url()
-    return url.decode()
+async def bing_url():
+    try:
+        return await HTTPService.bing_image_url()
+    except Exception as e:  # nothing cached to fall back to
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f'bing image url unavailable: {e!r}'
+        )
 
 
 @default_router.get(
@@ -23,7 +36,38 @@ async def bing_url(redis: AsyncRedis = Depends(AsyncRedis.get_connection)):
     response_model=int,
     dependencies=[Depends(APIThrottle(60))]
 )
-async def refresh_algolia_index(passcode: str):
+async def refresh_algolia_index(passcode: str, incremental: bool = False):
     if passcode != Config.admin.password:
         return 0
-    return await AlgoliaService.refresh_all_contents()
+    return await AlgoliaService.reindex(incremental)
+
+
+@default_router.get(
+    '/recompress_contents',
+    response_model=dict,
+    dependencies=[Depends(APIThrottle(60))]
+)
+async def recompress_contents(passcode: str, train: bool = False):
+    if passcode != Config.admin.password:
+        return dict()
+    return await CodecService.reencode_contents(train)
+
+
+@default_router.get(
+    '/metrics',
+    response_model=dict,
+    dependencies=[Depends(APIThrottle(60))]
+)
+async def metrics(passcode: str):
+    if passcode != Config.admin.password:
+        return dict()
+    return {
+        'algolia': AlgoliaService.stats(),
+        'codec': CodecService.stats(),
+        'http': HTTPService.stats(),
+        'mail': MailService.stats(),
+        'render': RenderService.stats(),
+        'revocation': RevocationService.stats(),
+        'scheduler': await SchedulerService.stats(),
+        'task': await TaskService.stats()
+    }
@@ -1,7 +1,6 @@
 import asyncio
-import hashlib
 
-from anyio import Path
+import aiohttp
 from fastapi import (
     APIRouter,
     Body,
@@ -11,9 +10,17 @@ from fastapi import (
     status,
     UploadFile
 )
+from fastapi.responses import FileResponse
 
-from config import Config, CustomHeaders
-from service import HTTPService, RoleRequired
+from config import CustomHeaders
+from schemas import UrlBatchInput
+from service import (
+    FileService,
+    HTTPService,
+    ImageService,
+    RoleRequired,
+    UploadLimit
+)
 
 
 file_router = APIRouter(prefix='/file', tags=['file'])
@@ -24,69 +31,91 @@ file_router = APIRouter(prefix='/file', tags=['file'])
     dependencies=[Depends(RoleRequired('admin'))]
 )
 async def upload(files: list[UploadFile], request: Request):
-    async_tasks, content_path = [], Path('{path}/{content_id}'.format(
-        path=Config.static.content_path,
-        content_id=request.headers.get(
-            CustomHeaders.CONTENT_ID,
-            default='default'
-        )
-    ))
-    if not await Path.exists(content_path):
-        await Path.mkdir(content_path)
+    limit = UploadLimit()
+    limit.check_request_size(request.headers.get('content-length'))
+    content_path = await FileService.content_path(
+        request.headers.get(CustomHeaders.CONTENT_ID, default='default')
+    )
 
+    async_tasks = []
     for f in files:
-        async_tasks.append(save_file(f, content_path, f.filename))
-    return {'files': await asyncio.gather(*async_tasks)}
+        async_tasks.append(
+            FileService.save_file(f, content_path, f.filename, limit)
+        )
+    return {'files': [
+        ImageService.attach_variants(res)
+        for res in await asyncio.gather(*async_tasks)
+    ]}
 
 
 @file_router.post('/static/url', dependencies=[Depends(RoleRequired('admin'))])
 async def rewrite_url(request: Request, url: str = Body(embed=True)):
     # embed: expect {"url": "str"} instead of "str"
-    content_path = Path('{path}/{content_id}'.format(
-        path=Config.static.content_path,
-        content_id=request.headers.get(
-            CustomHeaders.CONTENT_ID,
-            default='default'
-        )
-    ))
-    if not await Path.exists(content_path):
-        await Path.mkdir(content_path)
-
-    res = await save_file(
-        await HTTPService.get_image(url),
-        content_path,
-        url.split('/')[-1]
+    content_path = await FileService.content_path(
+        request.headers.get(CustomHeaders.CONTENT_ID, default='default')
     )
+
+    try:
+        async with HTTPService.stream(url) as chunks:
+            res = await FileService.save_file(
+                chunks, content_path, url.split('/')[-1]
+            )
+    except FileNotFoundError:  # not 200 upstream
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f'{url} not found'
+        )
+    except ValueError as e:  # response size limit
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    except aiohttp.ClientError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f'failed to fetch {url}: {e}'
+        )
     res.setdefault('url', url)
-    return res
+    return ImageService.attach_variants(res)
 
 
-async def save_file(file: bytes | UploadFile, path: Path, filename: str):
+@file_router.post(
+    '/static/urls',
+    dependencies=[Depends(RoleRequired('admin'))]
+)
+async def rewrite_urls(request: Request, batch: UrlBatchInput):
     """
-    :param file: file payload or UploadFile, read it out if later
-    :param path:
-    Path object of expected parent folder, without leading/tailing slash
-    :param filename: original file name with suffix
-    :return: {
-        "name": "original filename",
-        "path": "real filename with relative path"
-    }
+    Localize many remote images at once, from a url list or
+    every remote img of a html body, which is returned rewritten.
+    Failed urls are reported and left unchanged in html.
     """
-    if not isinstance(file, bytes):
-        file = await file.read()
+    content_path = await FileService.content_path(
+        request.headers.get(CustomHeaders.CONTENT_ID, default='default')
+    )
+    urls = list(batch.urls)
+    if batch.html is not None:
+        urls.extend(FileService.find_image_urls(batch.html))
 
-    file_path = path.joinpath('{real_name}.{suffix}'.format(
-        real_name=hashlib.md5(filename.encode(encoding='utf-8')).hexdigest(),
-        suffix=filename.split('.')[-1]
-    ))
-    await file_path.write_bytes(file)
-    if not await Path.exists(file_path):
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f'failed to upload {filename}'
-        )
-    # Path.__fspath__()/__str__() aka original Path._path
-    return {
-        'name': filename,
-        'path': file_path.__fspath__()
+    saved, failed = await FileService.save_urls(urls, content_path)
+    res = {
+        'files': {
+            url: ImageService.attach_variants(file)
+            for url, file in saved.items()
+        },
+        'failed': failed
     }
+    if batch.html is not None:
+        root_path = request.scope.get('root_path', '')
+        res['html'] = FileService.replace_image_urls(batch.html, {
+            url: f'{root_path}/{file["path"]}' for url, file in saved.items()
+        })
+    return res
+
+
+@file_router.get('/image/{path:path}')
+async def get_image_variant(path: str, width: int, format: str = 'webp'):
+    # variants are immutable as their sources are named by digest
+    return FileResponse(
+        await ImageService.resolve(path, width, format),
+        headers={'Cache-Control': 'public, max-age=86400'}
+    )
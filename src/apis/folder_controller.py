@@ -1,4 +1,3 @@
-import asyncio
 import pickle
 
 from fastapi import APIRouter, Depends
@@ -12,7 +11,13 @@ from schemas import (
     ResourceQuery,
     UserOutput
 )
-from service import RoleRequired, ResourceService, SecurityService
+from service import (
+    CounterService,
+    RoleRequired,
+    ResourceService,
+    SecurityService,
+    TaskService
+)
 
 
 folder_router = APIRouter(
@@ -50,17 +55,24 @@ async def get_sub_count(
         folders = pickle.loads(folders_str)
     else:
         folders = await ResourceService.find_resources(Folder(url=url))
-        asyncio.create_task(redis.set(
+        TaskService.submit(redis.set(
             RedisKey.folder(url), pickle.dumps(folders)
         ))
 
     assert len(folders) == 1
     ResourceService.check_permission(folders[0], cur_user, 1)
 
+    read_scope = ResourceService.read_scope(cur_user)
     field = RedisKey.count_field(
         url,
         resource_query.category_name,
-        resource_query.tag_name
+        resource_query.tag_name,
+        RedisKey.time_range(
+            resource_query.time_field,
+            resource_query.start_time,
+            resource_query.end_time
+        ),
+        read_scope.class_key if read_scope is not None else 'admin'
     )
     count_str = await redis.hget(RedisKey.COUNT_DICT, field)
     if count_str is not None:
@@ -68,12 +80,54 @@ async def get_sub_count(
     count = await ResourceService.find_sub_count(
         folders[0].url,
         resource_query,
-        Content
+        Content,
+        read_scope
     )
-    asyncio.create_task(redis.hset(RedisKey.COUNT_DICT, field, str(count)))
+    TaskService.submit(redis.hset(RedisKey.COUNT_DICT, field, str(count)))
     return count
 
 
+@folder_router.get(
+    '/archive/{url:path}',
+    response_model=dict[int, dict[int, int]]
+)
+async def get_archive(
+    url: str = '',
+    cur_user: UserOutput = Depends(SecurityService.optional_login_required),
+    redis: AsyncRedis = Depends(AsyncRedis.get_connection)
+):
+    """
+    :return: {year: {month: count}} in descending order,
+    use the month as [start_time, end_time) of sub_content
+    """
+    if len(url) > 0 and url[0] != '/':
+        url = f'/{url}'
+
+    if (folders_str := await redis.get(RedisKey.folder(url))) is not None:
+        folders = pickle.loads(folders_str)
+    else:
+        folders = await ResourceService.find_resources(Folder(url=url))
+        TaskService.submit(redis.set(
+            RedisKey.folder(url), pickle.dumps(folders)
+        ))
+
+    assert len(folders) == 1
+    ResourceService.check_permission(folders[0], cur_user, 1)
+
+    read_scope = ResourceService.read_scope(cur_user)
+    field = RedisKey.archive_field(
+        url, read_scope.class_key if read_scope is not None else 'admin'
+    )
+    archive_str = await redis.hget(RedisKey.ARCHIVE_DICT, field)
+    if archive_str is not None:
+        return pickle.loads(archive_str)
+    archive = await CounterService.find_archive(url, read_scope)
+    TaskService.submit(redis.hset(
+        RedisKey.ARCHIVE_DICT, field, pickle.dumps(archive)
+    ))
+    return archive
+
+
 @folder_router.get(
     '/sub_content/{url:path}',
     response_model=list[ResourcePreview]
@@ -91,28 +145,35 @@ async def get_folder(
         folders = pickle.loads(folders_str)
     else:
         folders = await ResourceService.find_resources(Folder(url=url))
-        asyncio.create_task(redis.set(
+        TaskService.submit(redis.set(
             RedisKey.folder(url), pickle.dumps(folders)
         ))
 
     assert len(folders) == 1
     ResourceService.check_permission(folders[0], cur_user, 1)
 
+    read_scope = ResourceService.read_scope(cur_user)
     field = RedisKey.preview_field(
         url,
         resource_query.category_name,
         resource_query.tag_name,
         resource_query.page_idx,
-        resource_query.page_size
+        resource_query.page_size,
+        RedisKey.time_range(
+            resource_query.time_field,
+            resource_query.start_time,
+            resource_query.end_time
+        ),
+        read_scope.class_key if read_scope is not None else 'admin'
     )
     resource_str = await redis.hget(RedisKey.PREVIEW_DICT, field)
     if resource_str is not None:
         return [ResourcePreview.init(x) for x in pickle.loads(resource_str)]
 
     sub_resources = await ResourceService.find_sub_resources(
-        url, resource_query, Content
+        url, resource_query, Content, read_scope
     )
-    asyncio.create_task(redis.hset(
+    TaskService.submit(redis.hset(
         RedisKey.PREVIEW_DICT, field, pickle.dumps(sub_resources)
     ))
     return [ResourcePreview.init(x) for x in sub_resources]
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Query
+
+from service import AlgoliaService
+
+
+search_router = APIRouter(prefix='/search', tags=['search'])
+
+
+@search_router.get('', response_model=dict)
+async def search(
+    keyword: str,
+    page: int = Query(default=0, ge=0),
+    hits_per_page: int = Query(default=20, ge=1, le=100),
+    category: str = None,
+    tag: str = None
+):
+    # hits with facet counts of category and tags, see Algolia search
+    return await AlgoliaService.search_content(
+        keyword, page, hits_per_page, category, tag
+    )
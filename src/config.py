@@ -16,6 +16,15 @@ class CustomHeaders(StrEnum):
     CONTENT_ID: str = 'x-content-id'  # input header use lower case x
     TOKEN_NEED_REFRESH: str = 'X-token-need-refresh'
     TWO_FA_TOKEN: str = 'X-2fa-token'
+    RATE_LIMIT_LIMIT: str = 'X-RateLimit-Limit'
+    RATE_LIMIT_REMAINING: str = 'X-RateLimit-Remaining'
+    RATE_LIMIT_RESET: str = 'X-RateLimit-Reset'
+
+
+@unique
+class RateLimitPolicy(StrEnum):
+    TOKEN_BUCKET: str = 'token_bucket'
+    SLIDING_WINDOW: str = 'sliding_window'
 
 
 @unique
@@ -49,12 +58,40 @@ class AlgoliaConfig:
         app_id: str,
         admin_key: str,
         index_name: str,
-        search_key: str | None = None
+        search_key: str | None = None,
+        debounce: float | None = 2,
+        max_retries: int | None = 5,
+        retry_backoff: float | None = 1,
+        batch_size: int | None = 1000,
+        reindex_concurrency: int | None = 4,
+        cache_size: int | None = 1024,
+        cache_ttl: float | None = 60
     ):
         self.app_id = app_id
         self.admin_key = admin_key
         self.index_name = index_name
         self.search_key = search_key
+        self.debounce = debounce
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.batch_size = batch_size
+        self.reindex_concurrency = reindex_concurrency
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+
+
+class CodecConfig:
+    def __init__(
+        self,
+        level: int | None = 10,
+        dictionary_dir: str | None = 'assets/zstd',
+        dictionary_size: int | None = 112640,
+        batch_size: int | None = 100
+    ):
+        self.level = level
+        self.dictionary_dir = dictionary_dir
+        self.dictionary_size = dictionary_size
+        self.batch_size = batch_size
 
 
 class DatabaseConfig:
@@ -75,6 +112,67 @@ class DatabaseConfig:
         self.database = database
 
 
+class HTTPConfig:
+    def __init__(
+        self,
+        limit: int | None = 100,
+        limit_per_host: int | None = 10,
+        dns_cache_ttl: int | None = 300,
+        keepalive_timeout: int | None = 30,
+        connect_timeout: float | None = 5,
+        read_timeout: float | None = 15,
+        total_timeout: float | None = 60,
+        max_response_size: int | None = 32 * 1024 * 1024,
+        batch_concurrency: int | None = 8,
+        url_timeout: float | None = 30,
+        bing_ttl: int | None = 6 * 3600,
+        weather_ttl: int | None = 1800,
+        stale_ttl: int | None = 7 * 86400,
+        refresh_ahead: float | None = 0.2,
+        source_timeout: float | None = 3,
+        breaker_failures: int | None = 3,
+        breaker_reset: float | None = 60
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.max_response_size = max_response_size
+        self.batch_concurrency = batch_concurrency
+        self.url_timeout = url_timeout
+        # third party data, fresh for its ttl, refreshed in background
+        # once refresh_ahead of it is left, served stale for stale_ttl
+        self.bing_ttl = bing_ttl
+        self.weather_ttl = weather_ttl
+        self.stale_ttl = stale_ttl
+        self.refresh_ahead = refresh_ahead
+        self.source_timeout = source_timeout  # longest wait of a request
+        # failures in a row opening the circuit, seconds it stays open
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+
+
+class ImageConfig:
+    def __init__(
+        self,
+        widths: list[int] | None = (480, 960, 1600),
+        formats: list[str] | None = ('webp', 'avif'),
+        quality: int | None = 80,
+        cache_path: str | None = 'static/derivative',
+        cache_size: int | None = 512 * 1024 * 1024,
+        workers: int | None = 2
+    ):
+        self.widths = widths
+        self.formats = formats
+        self.quality = quality
+        self.cache_path = cache_path
+        self.cache_size = cache_size
+        self.workers = workers
+
+
 class JWTConfig:
     def __init__(
         self,
@@ -83,11 +181,22 @@ class JWTConfig:
         headers: dict | None = MappingProxyType({
             'alg': 'HS256',
             'typ': 'JWT'
-        })
+        }),
+        token_cache_size: int | None = 4096,
+        negative_cache_ttl: int | None = 60,
+        revocation_capacity: int | None = 1 << 20,
+        revocation_error_rate: float | None = 0.001,
+        revocation_rebuild_interval: int | None = 3600
     ):
         self.key = key
         self.algorithm = algorithm
         self.headers = headers
+        self.token_cache_size = token_cache_size
+        self.negative_cache_ttl = negative_cache_ttl
+        # revoked token ids per worker bloom filter
+        self.revocation_capacity = revocation_capacity
+        self.revocation_error_rate = revocation_error_rate
+        self.revocation_rebuild_interval = revocation_rebuild_interval
 
 
 class MailConfig:
@@ -96,12 +205,34 @@ class MailConfig:
         host: str,
         port: int,
         username: str,
-        password: str
+        password: str,
+        start_tls: bool | None = True,
+        pool_size: int | None = 2,
+        queue_size: int | None = 1000,
+        idle_timeout: int | None = 60,
+        timeout: int | None = 30,
+        max_retries: int | None = 3,
+        retry_backoff: int | None = 2,
+        rcpt_batch_size: int | None = 50,
+        digest_page_size: int | None = 500,
+        site_url: str | None = 'https://wwr.icu'
     ):
         self.host = host
         self.port = port
         self.username = username
         self.password = password
+        self.start_tls = start_tls
+        # outbox connections, closed after idling, reopened on demand
+        self.pool_size = pool_size
+        self.queue_size = queue_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        # recipients per bulk message, 1 where the server limits RCPT
+        self.rcpt_batch_size = rcpt_batch_size
+        self.digest_page_size = digest_page_size
+        self.site_url = site_url
 
 
 class MiddlewareConfig:
@@ -114,7 +245,11 @@ class MiddlewareConfig:
         expose_headers: list[str] | None = (
             "X-token-need-refresh",
             "X-content-id",
-            "X-2fa-token"
+            "X-2fa-token",
+            "X-RateLimit-Limit",
+            "X-RateLimit-Remaining",
+            "X-RateLimit-Reset",
+            "Retry-After"
         )
     ):
         self.allow_origin_regex = allow_origin_regex
@@ -134,14 +269,92 @@ class RedisConfig:
         self.port = port
 
 
+class PasswordConfig:
+    def __init__(
+        self,
+        rounds: int | None = 12,
+        workers: int | None = 2,
+        max_pending: int | None = 16
+    ):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+
+
+class RenderConfig:
+    def __init__(
+        self,
+        template_path: str | None = 'templates',
+        cache_path: str | None = None,
+        auto_reload: bool | None = False,
+        slow_render: float | None = 0.01
+    ):
+        self.template_path = template_path
+        # compiled templates, None for a folder in the system temp dir
+        self.cache_path = cache_path
+        self.auto_reload = auto_reload
+        # seconds, templates slower than that are rendered in threads
+        self.slow_render = slow_render
+
+
+class SchedulerConfig:
+    def __init__(
+        self,
+        lock_ttl: int | None = 30,
+        history_size: int | None = 50
+    ):
+        # seconds a dead leader keeps the lock, renewed every third
+        self.lock_ttl = lock_ttl
+        self.history_size = history_size
+
+
+class TaskConfig:
+    def __init__(
+        self,
+        pool_size: int | None = 8,
+        queue_size: int | None = 1000,
+        consumers: int | None = 2,
+        max_retries: int | None = 3,
+        retry_backoff: float | None = 2,
+        claim_idle: int | None = 60
+    ):
+        self.pool_size = pool_size
+        self.queue_size = queue_size
+        self.consumers = consumers  # durable task readers per process
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff  # without redis
+        # seconds a durable task stays pending before it is retried
+        self.claim_idle = claim_idle
+
+
 class StaticResource:
     def __init__(
         self,
         root_path: str | None = 'static',
-        content_path: str | None = 'static/content'
+        content_path: str | None = 'static/content',
+        object_path: str | None = 'static/objects',
+        chunk_size: int | None = 64 * 1024,
+        max_file_size: int | None = 32 * 1024 * 1024,
+        max_request_size: int | None = 128 * 1024 * 1024,
+        max_concurrent_writes: int | None = 4,
+        max_age: int | None = 365 * 24 * 3600,
+        etag_cache_size: int | None = 4096,
+        gc_grace_period: int | None = 24 * 3600,
+        gc_batch_size: int | None = 100,
+        gc_concurrency: int | None = 8
     ):
         self.root_path = root_path
         self.content_path = content_path
+        self.object_path = object_path
+        self.chunk_size = chunk_size
+        self.max_file_size = max_file_size
+        self.max_request_size = max_request_size
+        self.max_concurrent_writes = max_concurrent_writes
+        self.max_age = max_age
+        self.etag_cache_size = etag_cache_size
+        self.gc_grace_period = gc_grace_period
+        self.gc_batch_size = gc_batch_size
+        self.gc_concurrency = gc_concurrency
 
 
 class TwoFAConfig:
@@ -162,9 +375,16 @@ class Config:
     static: StaticResource = None
     # compulsory above
     algolia: AlgoliaConfig = None
+    codec: CodecConfig = None
+    http: HTTPConfig = None
+    image: ImageConfig = None
     mail: MailConfig = None
     middleware: MiddlewareConfig = None
+    password: PasswordConfig = None
     redis: RedisConfig = None
+    render: RenderConfig = None
+    scheduler: SchedulerConfig = None
+    task: TaskConfig = None
     two_fa: TwoFAConfig = None
 
     @classmethod
@@ -194,9 +414,16 @@ class Config:
         static: dict,
         two_fa: dict,
         algolia: dict | None = None,
+        codec: dict | None = MappingProxyType({}),
+        http: dict | None = MappingProxyType({}),
+        image: dict | None = MappingProxyType({}),
         middleware: dict | None = MappingProxyType({}),
         mail: dict | None = None,
+        password: dict | None = MappingProxyType({}),
         redis: dict | None = None,
+        render: dict | None = MappingProxyType({}),
+        scheduler: dict | None = MappingProxyType({}),
+        task: dict | None = MappingProxyType({}),
         *args,
         **kwargs
     ):
@@ -209,10 +436,17 @@ class Config:
 
         if algolia is not None:
             cls.algolia = AlgoliaConfig(**algolia)
+        cls.codec = CodecConfig(**codec)
+        cls.http = HTTPConfig(**http)
+        cls.image = ImageConfig(**image)
         for folder in folders:
             cls.folders.append(Folder(**folder))
         if mail is not None:
             cls.mail = MailConfig(**mail)
         cls.middleware = MiddlewareConfig(**middleware)
+        cls.password = PasswordConfig(**password)
         if redis is not None:
             cls.redis = RedisConfig(**redis)
+        cls.render = RenderConfig(**render)
+        cls.scheduler = SchedulerConfig(**scheduler)
+        cls.task = TaskConfig(**task)
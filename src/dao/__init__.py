@@ -1,12 +1,23 @@
 from .async_database import AsyncDatabase
-from .async_redis import AsyncRedis, RedisKey
+from .async_redis import AsyncRedis, RateLimit, RedisKey
 from .base_dao import BaseDao
-from .resource_dao import ResourceDao
+from .bloom_filter import BloomFilter
+from .counter_dao import ContentState, CounterDao
+from .memory_cache import LRUCache
+from .resource_dao import ReadScope, ResourceDao
+from .subscriber_dao import SubscriberDao
 
 __all__ = [
     'AsyncDatabase',
     'AsyncRedis',
     'BaseDao',
+    'BloomFilter',
+    'ContentState',
+    'CounterDao',
+    'LRUCache',
+    'RateLimit',
+    'ReadScope',
     'RedisKey',
-    'ResourceDao'
+    'ResourceDao',
+    'SubscriberDao'
 ]
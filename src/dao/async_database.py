@@ -49,6 +49,11 @@ class AsyncDatabase:
             ctx_db.set(session)
             yield session
 
+    @classmethod
+    def new_session(cls) -> AsyncSession:
+        # a session of its own, e.g. to hold a cursor across awaits
+        return cls.__session_maker()
+
     @classmethod
     def use_database(cls, method: callable) -> callable:
         @functools.wraps(method)
@@ -118,7 +123,9 @@ class AsyncDatabase:
 
             admin = SysUser(
                 username=Config.admin.username,
-                password_hash=bcrypt.hashpw(password, bcrypt.gensalt()),
+                password_hash=bcrypt.hashpw(
+                    password, bcrypt.gensalt(Config.password.rounds)
+                ),
                 email=Config.admin.email,
                 two_fa_enforced=Config.admin.two_fa_enforced,
                 totp_key=Config.admin.totp_key
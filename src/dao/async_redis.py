@@ -1,15 +1,179 @@
 from __future__ import annotations
 import asyncio
+import hashlib
+import math
+import os
+import tempfile
+import time
+from datetime import datetime
 from threading import Lock
-from typing import Awaitable, cast
+from typing import Awaitable, cast, IO, NamedTuple
 
 from redis.asyncio import ConnectionPool, StrictRedis
+from redis.exceptions import NoScriptError
 
 from config import Config, logger
 
 
+# refill by elapsed time, then take one token if there is one
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - updated, 0) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', now)
+redis.call(
+    'PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000
+)
+return {allowed, tostring(tokens)}
+"""
+
+# the previous window is weighted by its part still inside the period
+SLIDING_WINDOW_SCRIPT = """
+local period = tonumber(ARGV[1])
+local allowance = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = (tonumber(time[1]) + tonumber(time[2]) / 1000000) / period
+local window = math.floor(now)
+local state = redis.call('HMGET', KEYS[1], 'window', 'current', 'previous')
+local last = tonumber(state[1]) or window
+local current = tonumber(state[2]) or 0
+local previous = tonumber(state[3]) or 0
+if last == window - 1 then
+    previous = current
+    current = 0
+elseif last ~= window then
+    previous = 0
+    current = 0
+end
+local elapsed = now - window
+local count = previous * (1 - elapsed) + current
+local allowed = 0
+if count + 1 <= allowance then
+    allowed = 1
+    current = current + 1
+    count = count + 1
+end
+redis.call(
+    'HSET', KEYS[1],
+    'window', window, 'current', current, 'previous', previous
+)
+redis.call('PEXPIRE', KEYS[1], math.ceil(period * 2000))
+return {allowed, tostring(count), current, previous, tostring(elapsed)}
+"""
+
+
+# only the owner may extend or release a lock
+# re-acquiring a lock still held, e.g. after a failed renewal, succeeds
+ACQUIRE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+RENEW_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+try:
+    import fcntl
+
+    def lock_file(file: IO):
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def unlock_file(file: IO):
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+except ImportError:  # windows
+    import msvcrt
+
+    def lock_file(file: IO):
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+
+    def unlock_file(file: IO):
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class RateLimit(NamedTuple):
+    allowed: bool
+    remaining: int
+    reset_after: float  # seconds until fully replenished
+    retry_after: float  # seconds until the next request is allowed
+
+    @classmethod
+    def of_token_bucket(
+        cls,
+        allowed: bool,
+        tokens: float,
+        rate: float,
+        capacity: int
+    ) -> RateLimit:
+        return cls(
+            allowed,
+            math.floor(tokens),
+            (capacity - tokens) / rate,
+            0 if allowed else (1 - tokens) / rate
+        )
+
+    @classmethod
+    def of_sliding_window(
+        cls,
+        allowed: bool,
+        count: float,
+        current: int,
+        previous: int,
+        elapsed: float,
+        period: float,
+        allowance: int
+    ) -> RateLimit:
+        if allowed:
+            retry_after = 0
+        elif previous > 0 and current + 1 <= allowance:
+            # until enough of the previous window slides out
+            retry_after = max(
+                1 - (allowance - 1 - current) / previous - elapsed, 0
+            ) * period
+        else:
+            retry_after = (1 - elapsed) * period
+        if current > 0:
+            reset_after = (2 - elapsed) * period
+        else:
+            reset_after = (1 - elapsed) * period if previous > 0 else 0
+        return cls(
+            allowed,
+            max(math.floor(allowance - count), 0),
+            reset_after,
+            retry_after
+        )
+
+
 class AsyncRedis(StrictRedis):
     __pool: ConnectionPool = None
+    __script_shas: dict[str, str] = dict()
 
     # override two methods below ONLY for type hint
     async def set(self, *args, **kwargs) -> bool | None:
@@ -21,6 +185,68 @@ class AsyncRedis(StrictRedis):
     async def hset(self, *args, **kwargs):
         await cast(Awaitable, super().hset(*args, **kwargs))
 
+    async def run_script(self, script: str, keys: list, args: list):
+        # EVALSHA with the source sent only when the server lacks it
+        if (sha := self.__script_shas.get(script)) is None:
+            sha = self.__script_shas[script] = hashlib.sha1(
+                script.encode()
+            ).hexdigest()
+        try:
+            return await self.evalsha(sha, len(keys), *keys, *args)
+        except NoScriptError:
+            return await self.eval(script, len(keys), *keys, *args)
+
+    async def token_bucket(
+        self,
+        key: str,
+        rate: float,
+        capacity: int
+    ) -> RateLimit:
+        """
+        Take a token atomically in one round trip,
+        :param rate: tokens refilled per second
+        :param capacity: max tokens, i.e. the burst size
+        """
+        allowed, tokens = await self.run_script(
+            TOKEN_BUCKET_SCRIPT, [key], [rate, capacity]
+        )
+        return RateLimit.of_token_bucket(
+            bool(allowed), float(tokens), rate, capacity
+        )
+
+    async def sliding_window(
+        self,
+        key: str,
+        period: float,
+        allowance: int
+    ) -> RateLimit:
+        # at most allowance requests in any period, approximated
+        allowed, count, current, previous, elapsed = await self.run_script(
+            SLIDING_WINDOW_SCRIPT, [key], [period, allowance]
+        )
+        return RateLimit.of_sliding_window(
+            bool(allowed),
+            float(count),
+            int(current),
+            int(previous),
+            float(elapsed),
+            period,
+            allowance
+        )
+
+    async def acquire_lock(self, key: str, owner: str, ttl: float) -> bool:
+        return bool(await self.run_script(
+            ACQUIRE_LOCK_SCRIPT, [key], [owner, int(ttl * 1000)]
+        ))
+
+    async def renew_lock(self, key: str, owner: str, ttl: float) -> bool:
+        return bool(await self.run_script(
+            RENEW_LOCK_SCRIPT, [key], [owner, int(ttl * 1000)]
+        ))
+
+    async def release_lock(self, key: str, owner: str):
+        await self.run_script(RELEASE_LOCK_SCRIPT, [key], [owner])
+
     @classmethod
     async def init_redis(cls):
         try:
@@ -47,6 +273,13 @@ class FakeRedis(AsyncRedis):
     __data: dict[str, bytes | dict | None] = dict()
     __lock: Lock = Lock()
     __instance: FakeRedis = None
+    # key -> (expire time, limiter state), updated without awaiting
+    # in between, so atomic on the event loop without a lock
+    __limits: dict[str, tuple[float, tuple]] = dict()
+    __limits_sweep_size: int = 4096
+    # processes of one host share no memory but the file system,
+    # a file lock is released by the OS when its process dies
+    __lock_files: dict[str, IO] = dict()
 
     @classmethod
     def get_instance(cls) -> AsyncRedis:
@@ -107,20 +340,110 @@ class FakeRedis(AsyncRedis):
         self.__data[key] = hash_map
         self.__lock.release()
 
-    async def delete(self, key: str, *args, **kwargs):
-        _, _ = args, kwargs
+    async def delete(self, *keys: str, **kwargs):
+        _ = kwargs
         with self.__lock:
-            self.__data[key] = None
+            for key in keys:
+                self.__data[key] = None
 
     async def delete_timer(self, key: str, seconds: int):
         await asyncio.sleep(seconds)
         await self.delete(key)
 
+    async def acquire_lock(self, key: str, owner: str, ttl: float) -> bool:
+        if key in self.__lock_files:
+            return True
+        file = open(os.path.join(tempfile.gettempdir(), f'{key}.lock'), 'a+')
+        try:
+            lock_file(file)
+        except OSError:
+            file.close()
+            return False
+        self.__lock_files[key] = file
+        return True
+
+    async def renew_lock(self, key: str, owner: str, ttl: float) -> bool:
+        return key in self.__lock_files
+
+    async def release_lock(self, key: str, owner: str):
+        if (file := self.__lock_files.pop(key, None)) is not None:
+            unlock_file(file)
+            file.close()
+
+    @classmethod
+    def limit_state(cls, key: str, now: float) -> tuple | None:
+        if len(cls.__limits) > cls.__limits_sweep_size:
+            for expired in [
+                k for k, (expire_time, _) in cls.__limits.items()
+                if expire_time < now
+            ]:
+                del cls.__limits[expired]
+            cls.__limits_sweep_size = max(4096, 2 * len(cls.__limits))
+        if (entry := cls.__limits.get(key)) is None or entry[0] < now:
+            return None
+        return entry[1]
+
+    async def token_bucket(
+        self,
+        key: str,
+        rate: float,
+        capacity: int
+    ) -> RateLimit:
+        now = time.monotonic()
+        tokens, updated = self.limit_state(key, now) or (capacity, now)
+        tokens = min(capacity, tokens + max(now - updated, 0) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self.__limits[key] = (
+            now + (capacity - tokens) / rate + 1, (tokens, now)
+        )
+        return RateLimit.of_token_bucket(allowed, tokens, rate, capacity)
+
+    async def sliding_window(
+        self,
+        key: str,
+        period: float,
+        allowance: int
+    ) -> RateLimit:
+        now = time.monotonic() / period
+        window = math.floor(now)
+        last, current, previous = (
+            self.limit_state(key, now * period) or (window, 0, 0)
+        )
+        if last == window - 1:
+            previous, current = current, 0
+        elif last != window:
+            previous, current = 0, 0
+        elapsed = now - window
+        count = previous * (1 - elapsed) + current
+        allowed = count + 1 <= allowance
+        if allowed:
+            current += 1
+            count += 1
+        self.__limits[key] = (
+            now * period + 2 * period, (window, current, previous)
+        )
+        return RateLimit.of_sliding_window(
+            allowed, count, current, previous, elapsed, period, allowance
+        )
+
 
 class RedisKey:
-    BING_IMAGE_URL = 'bing_image_url'
+    ALGOLIA_WATERMARK = 'algolia_watermark'
+    ARCHIVE_DICT = 'archive_dict'
     COUNT_DICT = 'count_dict'
+    DIGEST_CHECKPOINT = 'digest_checkpoint'
+    DIGEST_WATERMARK = 'digest_watermark'
+    JOB_HISTORY = 'job_history'
     PREVIEW_DICT = 'preview_dict'
+    REVOKED_TOKEN_CHANNEL = 'revoked_token_channel'
+    REVOKED_TOKEN_PATTERN = 'revoked_token:jti:*'
+    SCHEDULER_LEADER = 'scheduler_leader'
+    TASK_ATTEMPTS = 'task_attempts'
+    TASK_DEAD_LETTER = 'task_dead_letter'
+    TASK_GROUP = 'task_workers'
+    TASK_STREAM = 'task_stream'
 
     @staticmethod
     def totp_key(username: str) -> str:
@@ -135,8 +458,21 @@ class RedisKey:
         return f'need_2fa:username:{username}'
 
     @staticmethod
-    def throttle(path: str, method: str, ip: str | int) -> str:
-        return f'throttle:url:{path}:method:{method}:ip:{ip}'
+    def throttle(
+        path: str,
+        method: str,
+        ip: str | int,
+        policy: str = 'token_bucket'
+    ) -> str:
+        return f'rate_limit:{policy}:url:{path}:method:{method}:ip:{ip}'
+
+    @staticmethod
+    def revoked_token(jti: str) -> str:
+        return f'revoked_token:jti:{jti}'
+
+    @staticmethod
+    def third_party(source: str) -> str:
+        return f'third_party:{source}'
 
     @staticmethod
     def content(content_id: str | int) -> str:
@@ -152,14 +488,18 @@ class RedisKey:
         category_name: str,
         tag_name: str,
         page_idx: int | str,
-        page_size: int | str
+        page_size: int | str,
+        time_range: str | None = None,
+        permission_class: str = 'admin'
     ) -> str:
         return (
             f'preview:url:{url}:'
             + f'category_name:{category_name}:'
             + f'tag_name:{tag_name}:'
             + f'page_idx:{page_idx}:'
-            + f'page_size:{page_size}'
+            + f'page_size:{page_size}:'
+            + f'time_range:{time_range}:'
+            + f'permission_class:{permission_class}'
         )
 
     @staticmethod
@@ -167,9 +507,27 @@ class RedisKey:
         url: str,
         category_name: str,
         tag_name: str,
+        time_range: str | None = None,
+        permission_class: str = 'admin'
     ) -> str:
-        return 'count:url:{}:category_name:{}:tag_name:{}'.format(
-            url,
-            category_name,
-            tag_name
+        return (
+            f'count:url:{url}:'
+            + f'category_name:{category_name}:'
+            + f'tag_name:{tag_name}:'
+            + f'time_range:{time_range}:'
+            + f'permission_class:{permission_class}'
         )
+
+    @staticmethod
+    def time_range(
+        time_field: str,
+        start_time: datetime | None,
+        end_time: datetime | None
+    ) -> str | None:
+        if start_time is None and end_time is None:
+            return None
+        return f'{time_field}:{start_time}:{end_time}'
+
+    @staticmethod
+    def archive_field(url: str, permission_class: str = 'admin') -> str:
+        return f'archive:url:{url}:permission_class:{permission_class}'
@@ -0,0 +1,49 @@
+import hashlib
+import math
+from typing import Iterator
+
+
+class BloomFilter:
+    """
+    Set membership with false positives at about error_rate
+    up to capacity items and no false negatives, in
+    capacity * 1.44 * log2(1 / error_rate) bits.
+    """
+    def __init__(self, capacity: int = 1 << 20, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2
+        )
+        self.hash_count = max(round(self.size / capacity * math.log(2)), 1)
+        self.count = 0
+        self.__bits = bytearray((self.size + 7) // 8)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def positions(self, item: str | bytes) -> Iterator[int]:
+        # double hashing, two 64 bit halves of one digest
+        if isinstance(item, str):
+            item = item.encode()
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str | bytes):
+        for position in self.positions(item):
+            self.__bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str | bytes) -> bool:
+        bits = self.__bits
+        for position in self.positions(item):  # most misses stop early
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.__bits)
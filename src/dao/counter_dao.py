@@ -0,0 +1,283 @@
+from datetime import datetime
+from typing import NamedTuple, Sequence, Type
+
+from sqlalchemy import (
+    delete,
+    extract,
+    func,
+    literal,
+    or_,
+    Row,
+    select,
+    Select
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.dml import Insert
+
+from .async_database import AsyncDatabase
+from .resource_dao import ReadScope, ResourceDao
+from models import (
+    ArchiveCounter,
+    Content,
+    PostCategory,
+    PostTag,
+    ResourceCounter,
+    ResourceTag,
+    Tag
+)
+from schemas import ResourceQuery
+
+
+class ContentState(NamedTuple):
+    parent_url: str | None
+    category_id: int | None
+    tag_ids: list[int]
+    created_time: datetime | None
+    public: bool = False  # readable by anonymous users
+
+
+class CounterDao:
+    @staticmethod
+    @AsyncDatabase.database_session
+    async def get_content_state(
+        content_id: int,
+        *, session: AsyncSession
+    ) -> ContentState | None:
+        # counted attributes as currently stored
+        row = (await session.execute(
+            select(
+                Content.parent_url,
+                Content.category_id,
+                Content.created_time,
+                Content.permission
+            ).where(Content.id == content_id)
+        )).first()
+        if row is None:
+            return None
+        tag_ids = (await session.scalars(
+            select(ResourceTag.tag_id)
+            .where(ResourceTag.resource_id == content_id)
+        )).all()
+        return ContentState(
+            row.parent_url,
+            row.category_id,
+            list(tag_ids),
+            row.created_time,
+            CounterDao.is_public(row.permission)
+        )
+
+    @staticmethod
+    def is_public(permission: int | None) -> bool:
+        return permission is not None and permission % 10 & 1 != 0
+
+    @staticmethod
+    def upsert_count(
+        session: AsyncSession,
+        counter_class: Type[ResourceCounter | ArchiveCounter],
+        keys: dict[str, str | int | bool],
+        delta: int
+    ) -> Insert:
+        # a single statement, concurrent first deltas of a key both land
+        if session.bind.dialect.name == 'postgresql':
+            stmt = postgresql.insert(counter_class)
+        else:
+            stmt = sqlite.insert(counter_class)
+        return stmt.values(
+            **keys, count=max(delta, 0)
+        ).on_conflict_do_update(
+            index_elements=list(keys),
+            set_={'count': counter_class.count + delta}
+        )
+
+    @staticmethod
+    @AsyncDatabase.database_session
+    async def stage_counts(
+        deltas: dict[tuple[str, int, bool], int],
+        *, session: AsyncSession
+    ):
+        """
+        Counter updates are staged WITHOUT commit, they are committed
+        together with the resource change by the caller's commit
+        on the same request session. Keys are upserted in order so
+        concurrent requests lock the rows in the same order.
+        """
+        for (folder_url, tag_id, public_only), delta in sorted(
+            deltas.items()
+        ):
+            if delta == 0:
+                continue
+            await session.execute(CounterDao.upsert_count(
+                session,
+                ResourceCounter,
+                {
+                    'folder_url': folder_url,
+                    'tag_id': tag_id,
+                    'public_only': public_only
+                },
+                delta
+            ))
+
+    @staticmethod
+    @AsyncDatabase.database_session
+    async def stage_archive_counts(
+        deltas: dict[tuple[str, int, int, bool], int],
+        *, session: AsyncSession
+    ):
+        # staged WITHOUT commit as well, see stage_counts
+        for (folder_url, year, month, public_only), delta in sorted(
+            deltas.items()
+        ):
+            if delta == 0:
+                continue
+            await session.execute(CounterDao.upsert_count(
+                session,
+                ArchiveCounter,
+                {
+                    'folder_url': folder_url,
+                    'year': year,
+                    'month': month,
+                    'public_only': public_only
+                },
+                delta
+            ))
+
+    @staticmethod
+    @AsyncDatabase.database_session
+    async def delete_folder_counts(url: str, *, session: AsyncSession):
+        """
+        Staged WITHOUT commit like stage_counts, the counters go away
+        together with the folder by the caller's commit.
+        """
+        for counter_class in (ResourceCounter, ArchiveCounter):
+            await session.execute(delete(counter_class).where(or_(
+                counter_class.folder_url == url,
+                counter_class.folder_url.startswith(f'{url}/')
+            )))
+
+    @staticmethod
+    @AsyncDatabase.database_session
+    async def get_count(
+        folder_url: str,
+        resource_query: ResourceQuery = ResourceQuery(),
+        public_only: bool = False,
+        *, session: AsyncSession
+    ) -> int:
+        stmt: Select = select(ResourceCounter.count).where(
+            ResourceCounter.folder_url == folder_url,
+            ResourceCounter.public_only == public_only
+        )
+
+        if resource_query.category_name is not None:
+            stmt = stmt.join(
+                PostCategory, PostCategory.id == ResourceCounter.tag_id
+            ).where(PostCategory.name == resource_query.category_name)
+        elif resource_query.tag_name is not None:
+            stmt = stmt.join(
+                PostTag, PostTag.id == ResourceCounter.tag_id
+            ).where(PostTag.name == resource_query.tag_name)
+        else:
+            stmt = stmt.where(ResourceCounter.tag_id == ResourceCounter.TOTAL)
+
+        count = await session.scalar(stmt)
+        return count if count is not None else 0
+
+    @staticmethod
+    @AsyncDatabase.database_session
+    async def get_tag_counts(
+        folder_url: str,
+        tag_class: Type[Tag] = PostTag,
+        public_only: bool = False,
+        *, session: AsyncSession
+    ) -> Sequence[Row]:
+        stmt: Select = select(
+            tag_class.id, tag_class.name, ResourceCounter.count
+        ).join(
+            ResourceCounter, ResourceCounter.tag_id == tag_class.id
+        ).where(
+            ResourceCounter.folder_url == folder_url,
+            ResourceCounter.public_only == public_only,
+            ResourceCounter.count > 0
+        ).order_by(ResourceCounter.count.desc(), tag_class.name)
+        return (await session.execute(stmt)).all()
+
+    @staticmethod
+    @AsyncDatabase.database_session
+    async def get_archive_counts(
+        folder_url: str,
+        public_only: bool = False,
+        *, session: AsyncSession
+    ) -> Sequence[Row]:
+        stmt: Select = select(
+            ArchiveCounter.year, ArchiveCounter.month, ArchiveCounter.count
+        ).where(
+            ArchiveCounter.folder_url == folder_url,
+            ArchiveCounter.public_only == public_only,
+            ArchiveCounter.count > 0
+        ).order_by(ArchiveCounter.year.desc(), ArchiveCounter.month.desc())
+        return (await session.execute(stmt)).all()
+
+    @staticmethod
+    @AsyncDatabase.database_session
+    async def reset_counts(*, session: AsyncSession) -> int:
+        # full recount, replaces all counters in one transaction
+        stmts: tuple[Select, ...] = (
+            select(
+                Content.parent_url,
+                literal(ResourceCounter.TOTAL),
+                func.count()
+            ).group_by(Content.parent_url),
+            select(
+                Content.parent_url, Content.category_id, func.count()
+            ).where(
+                Content.category_id.is_not(None)
+            ).group_by(Content.parent_url, Content.category_id),
+            select(
+                Content.parent_url, ResourceTag.tag_id, func.count()
+            ).join(
+                ResourceTag, ResourceTag.resource_id == Content.id
+            ).group_by(Content.parent_url, ResourceTag.tag_id)
+        )
+        year, month = (
+            extract('year', Content.created_time),
+            extract('month', Content.created_time)
+        )
+        archive_stmt: Select = (
+            select(Content.parent_url, year, month, func.count())
+            .where(Content.created_time.is_not(None))
+            .group_by(Content.parent_url, year, month)
+        )
+        public = ResourceDao.readable(Content, ReadScope())
+
+        counters = []
+        for public_only in (False, True):
+            for stmt in stmts:
+                if public_only:
+                    stmt = stmt.where(public)
+                for folder_url, tag_id, count in await session.execute(
+                    stmt.where(Content.parent_url.is_not(None))
+                ):
+                    counters.append(ResourceCounter(
+                        folder_url=folder_url,
+                        tag_id=tag_id,
+                        public_only=public_only,
+                        count=count
+                    ))
+
+            stmt = archive_stmt.where(public) if public_only else archive_stmt
+            for row in await session.execute(
+                stmt.where(Content.parent_url.is_not(None))
+            ):
+                counters.append(ArchiveCounter(
+                    folder_url=row[0],
+                    year=int(row[1]),
+                    month=int(row[2]),
+                    public_only=public_only,
+                    count=row[3]
+                ))
+
+        await session.execute(delete(ResourceCounter))
+        await session.execute(delete(ArchiveCounter))
+        session.add_all(counters)
+        await session.commit()
+        return len(counters)
@@ -0,0 +1,54 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LRUCache:
+    """
+    In-process least recently used cache with a time to live per entry,
+    meant for hot read paths where a Redis round trip is too much.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.__data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.__data)
+
+    def peek(self, key: Hashable) -> Any | None:
+        # lookup without touching recency or hit/miss statistics
+        if (entry := self.__data.get(key)) is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self.__data[key]
+            return None
+        return entry[1]
+
+    def get(self, key: Hashable) -> Any | None:
+        if (value := self.peek(key)) is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None):
+        if (ttl := ttl if ttl is not None else self.ttl) <= 0:
+            return
+        expire_time = time.monotonic() + ttl
+        self.__data[key] = (expire_time, value)
+        self.__data.move_to_end(key)
+        while len(self.__data) > self.maxsize:
+            self.__data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        self.__data.pop(key, None)
+
+    def clear(self):
+        self.__data.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {'size': len(self), 'hits': self.hits, 'misses': self.misses}
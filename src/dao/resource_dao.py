@@ -1,26 +1,77 @@
-from typing import Sequence, Type
+from datetime import datetime
+from typing import AsyncIterator, NamedTuple, Sequence, Type
 
-from sqlalchemy import func, select, Select, Table
+from sqlalchemy import (
+    ColumnElement, extract, func, or_, Row, select, Select, Table, update
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .async_database import AsyncDatabase
-from models import PostCategory, PostTag, Resource
+from models import (
+    Content, PostCategory, PostTag, Resource, ResourceTag, Tag
+)
 from schemas import ResourceQuery
 
 
+class ReadScope(NamedTuple):
+    """
+    Who reads a listing, None user_id for anonymous,
+    admins are not scoped at all.
+    """
+    user_id: int | None = None
+    role_ids: tuple[int, ...] = ()
+
+    @property
+    def class_key(self) -> str:
+        # readers of one class always see the same rows
+        return 'public' if self.user_id is None else f'user:{self.user_id}'
+
+
 class ResourceDao:
+    @staticmethod
+    def readable(
+        obj_class: Table | Type,
+        read_scope: ReadScope,
+        operation_mask: int = 1
+    ) -> ColumnElement[bool]:
+        """
+        ResourceService.check_permission as a predicate,
+        permission digits are owner, group and public from high to low
+        """
+        permission = func.coalesce(obj_class.permission, 0)
+
+        def allows(digit) -> ColumnElement[bool]:
+            return digit.op('&')(operation_mask) != 0
+
+        conditions = [allows(permission % 10)]
+        if len(read_scope.role_ids) > 0:
+            conditions.append(
+                obj_class.group_id.in_(read_scope.role_ids) &
+                allows(permission // 10 % 10)
+            )
+        if read_scope.user_id is not None:
+            conditions.append(
+                (obj_class.owner_id == read_scope.user_id) &
+                allows(permission // 100 % 10)
+            )
+        return or_(*conditions)
+
     @staticmethod
     @AsyncDatabase.database_session
     async def get_sub_resources(
         parent_url: str | None = None,
         resource_query: ResourceQuery = ResourceQuery(),
         obj_class: Table | Type = Resource,
+        read_scope: ReadScope | None = None,
         *, session: AsyncSession
     ) -> Sequence[any]:
         stmt: Select = select(obj_class).order_by(
             obj_class.updated_time.desc()
         )
 
+        if read_scope is not None:
+            stmt = stmt.where(ResourceDao.readable(obj_class, read_scope))
+
         if parent_url is not None:
             stmt = stmt.where(obj_class.parent_url == parent_url)
 
@@ -34,6 +85,12 @@ class ResourceDao:
                 PostTag.name == resource_query.tag_name
             ))
 
+        time_column = getattr(obj_class, resource_query.time_field)
+        if resource_query.start_time is not None:
+            stmt = stmt.where(time_column >= resource_query.start_time)
+        if resource_query.end_time is not None:
+            stmt = stmt.where(time_column < resource_query.end_time)
+
         if resource_query.page_size != 0:
             # res = res.offset(page_idx * page_size).limit(page_size)
             stmt = stmt.slice(
@@ -49,10 +106,14 @@ class ResourceDao:
         parent_url: str | None = None,
         resource_query: ResourceQuery = ResourceQuery(),
         obj_class: Table | Type = Resource,
+        read_scope: ReadScope | None = None,
         *, session: AsyncSession
     ) -> int:
         stmt: Select = select(func.count()).select_from(obj_class)
 
+        if read_scope is not None:
+            stmt = stmt.where(ResourceDao.readable(obj_class, read_scope))
+
         if parent_url is not None:
             stmt = stmt.where(obj_class.parent_url == parent_url)
 
@@ -66,4 +127,136 @@ class ResourceDao:
                 PostTag.name == resource_query.tag_name
             ))
 
+        time_column = getattr(obj_class, resource_query.time_field)
+        if resource_query.start_time is not None:
+            stmt = stmt.where(time_column >= resource_query.start_time)
+        if resource_query.end_time is not None:
+            stmt = stmt.where(time_column < resource_query.end_time)
+
         return await session.scalar(stmt)
+
+    @staticmethod
+    @AsyncDatabase.database_session
+    async def get_tag_counts(
+        parent_url: str,
+        tag_class: Type[Tag] = PostTag,
+        read_scope: ReadScope = ReadScope(),
+        *, session: AsyncSession
+    ) -> Sequence[Row]:
+        # counted live for readers the counters are not kept for
+        count = func.count().label('count')
+        stmt: Select = select(tag_class.id, tag_class.name, count)
+        if tag_class is PostCategory:
+            stmt = stmt.join(Content, Content.category_id == tag_class.id)
+        else:
+            stmt = stmt.join(
+                ResourceTag, ResourceTag.tag_id == tag_class.id
+            ).join(Content, Content.id == ResourceTag.resource_id)
+        stmt = stmt.where(
+            Content.parent_url == parent_url,
+            ResourceDao.readable(Content, read_scope)
+        ).group_by(
+            tag_class.id, tag_class.name
+        ).order_by(count.desc(), tag_class.name)
+        return (await session.execute(stmt)).all()
+
+    @staticmethod
+    @AsyncDatabase.database_session
+    async def get_archive_counts(
+        parent_url: str,
+        read_scope: ReadScope = ReadScope(),
+        *, session: AsyncSession
+    ) -> Sequence[Row]:
+        year = extract('year', Content.created_time).label('year')
+        month = extract('month', Content.created_time).label('month')
+        stmt: Select = select(
+            year, month, func.count().label('count')
+        ).where(
+            Content.parent_url == parent_url,
+            Content.created_time.is_not(None),
+            ResourceDao.readable(Content, read_scope)
+        ).group_by(year, month).order_by(year.desc(), month.desc())
+        return (await session.execute(stmt)).all()
+
+    @staticmethod
+    async def stream_index_rows(
+        parent_url: str,
+        updated_after: datetime | None = None,
+        chunk_size: int = 1000
+    ) -> AsyncIterator[Sequence[Row]]:
+        """
+        Server side cursor over contents in primary key order,
+        yields chunks of indexed columns only, bodies are never read.
+        """
+        stmt: Select = select(
+            Content.id,
+            Content.title,
+            Content.created_time,
+            Content.updated_time,
+            PostCategory.name.label('category')
+        ).outerjoin(
+            PostCategory, PostCategory.id == Content.category_id
+        ).where(
+            Content.parent_url == parent_url
+        ).order_by(Content.id).execution_options(yield_per=chunk_size)
+
+        if updated_after is not None:
+            stmt = stmt.where(Content.updated_time > updated_after)
+
+        async with AsyncDatabase.new_session() as session:
+            result = await session.stream(stmt)
+            async for rows in result.partitions():
+                yield rows
+
+    @staticmethod
+    @AsyncDatabase.database_session
+    async def get_tag_names(
+        content_ids: list[int],
+        *, session: AsyncSession
+    ) -> dict[int, list[str]]:
+        stmt: Select = select(ResourceTag.resource_id, PostTag.name).join(
+            PostTag, PostTag.id == ResourceTag.tag_id
+        ).where(ResourceTag.resource_id.in_(content_ids))
+        tag_names: dict[int, list[str]] = dict()
+        for content_id, name in await session.execute(stmt):
+            tag_names.setdefault(content_id, []).append(name)
+        return tag_names
+
+    @staticmethod
+    @AsyncDatabase.database_session
+    async def get_content_bodies(
+        after_id: int = 0,
+        limit: int = 100,
+        *, session: AsyncSession
+    ) -> Sequence[Row]:
+        # keyset paging on primary key, only (id, content) columns loaded
+        stmt: Select = select(Content.id, Content.content).where(
+            Content.id > after_id
+        ).order_by(Content.id).limit(limit)
+        return (await session.execute(stmt)).all()
+
+    @staticmethod
+    @AsyncDatabase.database_session
+    async def get_content_bodies_by_ids(
+        content_ids: list[int],
+        *, session: AsyncSession
+    ) -> Sequence[Row]:
+        stmt: Select = select(Content.id, Content.content).where(
+            Content.id.in_(content_ids)
+        )
+        return (await session.execute(stmt)).all()
+
+    @staticmethod
+    @AsyncDatabase.database_session
+    async def update_content_bodies(
+        bodies: dict[int, bytes],
+        *, session: AsyncSession
+    ):
+        for content_id, body in bodies.items():
+            await session.execute(
+                update(Content)
+                .where(Content.id == content_id)
+                .values(content=body)
+                .execution_options(synchronize_session=False)
+            )
+        await session.commit()
@@ -0,0 +1,23 @@
+from typing import Sequence
+
+from sqlalchemy import select, Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .async_database import AsyncDatabase
+from models import Subscriber
+
+
+class SubscriberDao:
+    @staticmethod
+    @AsyncDatabase.database_session
+    async def get_subscribers(
+        after_id: int = 0,
+        limit: int = 500,
+        *, session: AsyncSession
+    ) -> Sequence[Subscriber]:
+        # keyset page in id order, the id is the resume checkpoint
+        stmt: Select = select(Subscriber).where(
+            Subscriber.active.is_(True),
+            Subscriber.id > after_id
+        ).order_by(Subscriber.id).limit(limit)
+        return (await session.scalars(stmt)).all()
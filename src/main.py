@@ -6,12 +6,24 @@ import uvicorn
 from anyio import Path
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
 from apis import router
 from config import Config, logger
 from dao import AsyncDatabase, AsyncRedis
-from service import schedule_jobs, SqlAdmin
+from service import (
+    AlgoliaService,
+    CodecService,
+    HTTPService,
+    ImageService,
+    MailService,
+    RenderService,
+    RevocationService,
+    SchedulerService,
+    schedule_jobs,
+    SqlAdmin,
+    StaticFileServer,
+    TaskService
+)
 
 
 app = FastAPI(version='1.0.0')
@@ -25,7 +37,17 @@ async def startup():
     await Config.init_config()
     await asyncio.gather(
         AsyncDatabase.init_database(),
-        AsyncRedis.init_redis()
+        AsyncRedis.init_redis(),
+        AlgoliaService.init(),
+        CodecService.init(),
+        HTTPService.init(),
+        ImageService.init(),
+        MailService.init(),
+        RenderService.init()
+    )
+    await asyncio.gather(  # after redis
+        RevocationService.init(),
+        TaskService.init()
     )
     await SqlAdmin.init(app)
     schedule_jobs()
@@ -36,7 +58,7 @@ async def startup():
     app.include_router(router)
     app.mount(
         f'/{Config.static.root_path}',
-        StaticFiles(directory=Config.static.root_path),
+        StaticFileServer(directory=Config.static.root_path),
         name=Config.static.root_path
     )
     app.add_middleware(CORSMiddleware, **Config.middleware.__dict__)
@@ -44,7 +66,17 @@ async def startup():
 
 @app.on_event('shutdown')
 async def shutdown():
-    await asyncio.gather(AsyncRedis.close_connection(), AsyncDatabase.close())
+    await SchedulerService.close()  # releases the lock, before redis
+    await TaskService.close()  # drains into the services below
+    await asyncio.gather(
+        AsyncRedis.close_connection(),
+        AsyncDatabase.close(),
+        AlgoliaService.close(),
+        HTTPService.close(),
+        ImageService.close(),
+        MailService.close(),
+        RevocationService.close()
+    )
     logger.info('see u later')
 
 
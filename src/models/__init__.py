@@ -1,13 +1,16 @@
 from .base_table import Base, BaseTable
 from .alembic import AlembicBase, AlembicVersion
+from .counter import ArchiveCounter, ResourceCounter
 from .relations import ResourceTag, RolePermission, UserRole
 from .resources import Content, Folder, Resource
+from .subscriber import Subscriber
 from .sys_user import SysPermission, SysRole, SysUser
 from .tag import PostCategory, PostTag, Tag
 
 __all__ = [
     'AlembicBase',
     'AlembicVersion',
+    'ArchiveCounter',
     'Base',
     'BaseTable',
     'Content',
@@ -16,9 +19,11 @@ __all__ = [
     'PostTag',
     'Tag',
     'Resource',
+    'ResourceCounter',
     'ResourceTag',
     'RolePermission',
     'ResourceTag',
+    'Subscriber',
     'SysPermission',
     'SysRole',
     'SysUser',
@@ -7,7 +7,7 @@ AlembicBase = declarative_base()
 
 class AlembicVersion(AlembicBase):
     __tablename__ = 'alembic_version'
-    ALEMBIC_VERSION: str = '5f1533ae3bf3'
+    ALEMBIC_VERSION: str = 'c4f7a92e1d63'
     version_num = Column(String(32), primary_key=True, nullable=False)
 
     def __init__(self):
@@ -0,0 +1,28 @@
+from sqlalchemy import Boolean, Column, Integer, String
+
+from .base_table import Base
+
+
+class ResourceCounter(Base):
+    """
+    Maintained count of contents under a folder, keyed by tag id,
+    categories share the id sequence of tags through the tag table,
+    the folder total uses tag id TOTAL. Rows with public_only count
+    the publicly readable contents only, the others count all.
+    """
+    TOTAL: int = 0
+
+    __tablename__ = 'resource_counter'
+    folder_url = Column(String(255), primary_key=True)
+    tag_id = Column(Integer, primary_key=True, comment='0 for folder total')
+    public_only = Column(Boolean, primary_key=True, default=False)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class ArchiveCounter(Base):
+    __tablename__ = 'archive_counter'
+    folder_url = Column(String(255), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    month = Column(Integer, primary_key=True)
+    public_only = Column(Boolean, primary_key=True, default=False)
+    count = Column(Integer, nullable=False, default=0)
@@ -2,7 +2,7 @@ from datetime import datetime
 from types import MappingProxyType
 
 from sqlalchemy import (
-    Column, DateTime, ForeignKey, Integer, LargeBinary, String
+    Column, DateTime, ForeignKey, Index, Integer, LargeBinary, String
 )
 from sqlalchemy.orm import relationship
 
@@ -34,12 +34,13 @@ class Resource(BaseTable):
     url = Column(String(255), unique=True, nullable=False)
     this_url = Column(String(255), comment='For concat after rename')
 
-    owner_id = Column(Integer, ForeignKey('sys_user.id'))
+    owner_id = Column(Integer, ForeignKey('sys_user.id'), index=True)
     owner = relationship("SysUser", back_populates="resources")
 
     group_id = Column(
         Integer,
         ForeignKey('sys_role.id'),
+        index=True,
         comment='Sys role as group'
     )
     group = relationship("SysRole", back_populates="resources")
@@ -49,6 +50,7 @@ class Resource(BaseTable):
     created_time = Column(
         DateTime,
         default=datetime.now,
+        index=True,
         comment="create time"
     )
 
@@ -56,6 +58,7 @@ class Resource(BaseTable):
         DateTime,
         default=datetime.now,
         onupdate=datetime.now,
+        index=True,
         comment="update time"
     )
 
@@ -82,6 +85,14 @@ class Resource(BaseTable):
         # 'polymorphic_identity': 'resource',
         'polymorphic_on': type
     }
+    __table_args__ = (
+        # folder listing in update order, permission filtered on the way
+        Index(
+            'ix_resource_parent_url_updated_time',
+            'parent_url',
+            'updated_time'
+        ),
+    )
 
 
 class Folder(Resource):
@@ -125,6 +136,12 @@ class Content(Resource):
     )
 
     sub_title = Column(String(255), nullable=True, comment="content summary")
+    published_time = Column(
+        DateTime,
+        nullable=True,
+        index=True,
+        comment="first time public on /post"
+    )
     content = Column(
         LargeBinary(length=65536),
         nullable=True,
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from sqlalchemy import Boolean, Column, DateTime, String
+
+from .base_table import BaseTable
+
+
+class Subscriber(BaseTable):
+    def __init__(
+        self,
+        email: str | None = None,
+        variant: str | None = 'html',
+        active: bool | None = True,
+        *args,
+        **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.email = email
+        self.variant = variant
+        self.active = active
+
+    def __str__(self):
+        return self.email
+
+    __tablename__ = 'subscriber'
+    email = Column(String(128), unique=True, nullable=False)
+    variant = Column(
+        String(16),
+        nullable=False,
+        default='html',
+        comment='digest template variant, html or text'
+    )
+    active = Column(Boolean, nullable=False, default=True)
+    created_time = Column(DateTime, default=datetime.now)
@@ -1,4 +1,5 @@
 from .algolia import AlgoliaPostIndex
+from .file import UrlBatchInput
 from .user import TokenResponse, UserInput, UserOutput
 from .query import ResourceQuery
 from .resource import (
@@ -8,7 +9,7 @@ from .resource import (
     FolderOutput,
     ResourcePreview
 )
-from .tag import ContentTags, TagContents, TagSchema
+from .tag import ContentTags, TagContents, TagCount, TagSchema
 from .third_party import WeatherSchema
 
 
@@ -22,8 +23,10 @@ __all__ = [
     'ResourcePreview',
     'ResourceQuery',
     'TagContents',
+    'TagCount',
     'TagSchema',
     'TokenResponse',
+    'UrlBatchInput',
     'UserInput',
     'UserOutput',
     'WeatherSchema'
@@ -2,6 +2,7 @@ from __future__ import annotations
 from datetime import datetime
 
 from pydantic import BaseModel
+from sqlalchemy import Row
 
 from models import Content
 
@@ -29,3 +30,15 @@ class AlgoliaPostIndex(BaseModel):
         if content.tags is not None:
             index.tags = [tag.name for tag in content.tags]
         return index
+
+    @classmethod
+    def parse_row(cls, row: Row, tags: list[str] | None = None):
+        # row of (id, title, created_time, updated_time, category)
+        return cls(
+            objectID=row.id,
+            title=row.title,
+            category=row.category or '',
+            tags=tags or [],
+            created_time=int(datetime.timestamp(row.created_time)),
+            updated_time=int(datetime.timestamp(row.updated_time))
+        )
@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+
+
+class UrlBatchInput(BaseModel):
+    # either remote image urls or a html body to localize images of
+    urls: list[str] = []
+    html: str = None
@@ -1,8 +1,17 @@
+from datetime import datetime
+from typing import Literal
+
 from pydantic import BaseModel
 
 
 class ResourceQuery(BaseModel):
     category_name: str = None
     tag_name: str = None
+    # [start_time, end_time) on the indexed time field
+    start_time: datetime = None
+    end_time: datetime = None
+    time_field: Literal[
+        'created_time', 'updated_time', 'published_time'  # content only
+    ] = 'created_time'
     page_idx: int = 0
     page_size: int = 0
@@ -16,6 +16,10 @@ class TagSchema(BaseModel):
     name: str = None
 
 
+class TagCount(TagSchema):
+    count: int = 0
+
+
 class ContentTags(BaseModel):
     content_id: int = None
     remove_tag_ids: list[int] = None
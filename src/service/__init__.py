@@ -1,43 +1,79 @@
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from datetime import datetime
+
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
 from .algolia_service import AlgoliaService
+from .codec_service import CodecService
+from .counter_service import CounterService
+from .file_service import FileService, UploadLimit
 from .http_service import HTTPService
+from .image_service import ImageService
 from .mail_service import MailService
 from .render_service import RenderService
 from .resource_service import ResourceService
+from .revocation_service import RevocationService
+from .scheduler_service import SchedulerService
 from .security_service import APIThrottle, RoleRequired, SecurityService
 from .sql_admin import SqlAdmin
+from .static_files import StaticFileServer
 from .tag_service import TagService
+from .task_service import TaskService
 from .user_service import UserService
 from config import logger
 
+# handlers of durable tasks, known to every process before startup
+for handler in (AlgoliaService.sync, MailService.deliver):
+    TaskService.register(handler)
+
 
 def schedule_jobs():
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(
-        MailService.daily_mail,
+    SchedulerService.add_job(
+        MailService.daily_digest,
         CronTrigger(hour=8, timezone='Asia/Shanghai')
     )
-    scheduler.add_job(
-        HTTPService.parse_bing_image_url,
+    SchedulerService.add_job(
+        HTTPService.refresh_bing_image_url,
         CronTrigger(hour=1, timezone='US/Pacific')
     )
-    scheduler.start()
-    logger.info('schedule jobs started')
+    SchedulerService.add_job(
+        AlgoliaService.reindex,
+        IntervalTrigger(hours=1),
+        kwargs={'incremental': True}  # edits missed by the sync queue
+    )
+    SchedulerService.add_job(
+        FileService.collect_garbage,
+        CronTrigger(hour=4, timezone='Asia/Shanghai')
+    )
+    SchedulerService.add_job(
+        CounterService.reconcile,
+        IntervalTrigger(hours=1),
+        next_run_time=datetime.now()  # fill counters on startup
+    )
+    SchedulerService.start()
+    logger.info('schedule jobs started, waiting for leadership')
 
 
 __all__ = [
     'APIThrottle',
     'AlgoliaService',
+    'CodecService',
+    'CounterService',
+    'FileService',
     'HTTPService',
+    'ImageService',
     'MailService',
     'RenderService',
     'ResourceService',
+    'RevocationService',
     'RoleRequired',
     'schedule_jobs',
+    'SchedulerService',
     'SecurityService',
     'SqlAdmin',
+    'StaticFileServer',
     'TagService',
+    'TaskService',
+    'UploadLimit',
     'UserService'
 ]
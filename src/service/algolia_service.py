@@ -1,61 +1,350 @@
 from __future__ import annotations
+import asyncio
+from collections import Counter
+from datetime import datetime
 from typing import Awaitable
 
 from algoliasearch.search_index_async import SearchClient
 
-from config import Config
-from dao import AsyncDatabase, BaseDao
-from models import Content
+from config import Config, logger
+from dao import AsyncRedis, LRUCache, RedisKey, ResourceDao
 from schemas import AlgoliaPostIndex
 
 
 class AlgoliaService:
-    @staticmethod
-    async def save_contents(contents: list[AlgoliaPostIndex]):
+    """
+    Index writes are queued and coalesced per objectID, the last
+    upsert or delete within the debounce window wins, then the whole
+    queue is sent as one batch by a single flush task at a time, its
+    result shared by everything coalesced into it.
+    """
+    FACETS: list[str] = ['category', 'tags']
+
+    __client: SearchClient | None = None
+    # objectID -> object to upsert, None to delete
+    __pending: dict[str, dict | None] = dict()
+    __batch_sent: asyncio.Future | None = None  # of the pending batch
+    __flush_task: asyncio.Task | None = None
+    __flush_lock: asyncio.Lock = asyncio.Lock()
+    __stats: dict[str, int] = {
+        'flushes': 0,
+        'operations': 0,
+        'retries': 0,
+        'failures': 0,
+        'prefix_hits': 0,
+        'coalesced': 0
+    }
+    __cache: LRUCache = LRUCache()
+    __searches: dict[tuple, asyncio.Future] = dict()
+    __generation: int = 0
+
+    @classmethod
+    async def init(cls):
         if Config.algolia is None:
             return
-        async with SearchClient.create(
+        cls.__cache = LRUCache(
+            Config.algolia.cache_size, Config.algolia.cache_ttl
+        )
+        cls.__client = SearchClient.create(
             Config.algolia.app_id,
             Config.algolia.admin_key
-        ) as client:
-            index = client.init_index(Config.algolia.index_name)
-            # return algoliasearch.responses.IndexingResponse
-            await index.save_objects_async([
-               idx.dict() for idx in contents
-            ])
+        )
 
-    @staticmethod
-    async def delete_contents(object_ids: list[int]):
+    @classmethod
+    async def close(cls):
+        if cls.__client is None:
+            return
+        if cls.__flush_task is not None:
+            # a batch in flight is put back into the queue on cancel
+            cls.__flush_task.cancel()
+            await asyncio.gather(cls.__flush_task, return_exceptions=True)
+            cls.__flush_task = None
+        try:  # drain without waiting for the debounce
+            await asyncio.wait_for(cls.flush(), timeout=10)
+        except asyncio.TimeoutError:
+            logger.error(f'{len(cls.__pending)} algolia operations dropped')
+        await cls.__client.close_async()
+        cls.__client = None
+
+    @classmethod
+    def get_index(cls):
+        if cls.__client is None:
+            cls.__client = SearchClient.create(
+                Config.algolia.app_id,
+                Config.algolia.admin_key
+            )
+        return cls.__client.init_index(Config.algolia.index_name)
+
+    @classmethod
+    def stats(cls) -> dict[str, int | dict]:
+        return {
+            'queue_depth': len(cls.__pending),
+            **cls.__stats,
+            'search_cache': cls.__cache.stats()
+        }
+
+    @classmethod
+    def enqueue(
+        cls,
+        operations: dict[str, dict | None]
+    ) -> asyncio.Future | None:
+        # :return: future of the batch sending them, False if re-queued
         if Config.algolia is None:
+            return None
+        cls.__pending.update(operations)
+        if cls.__batch_sent is None:
+            cls.__batch_sent = asyncio.get_running_loop().create_future()
+        if cls.__flush_task is None or cls.__flush_task.done():
+            cls.__flush_task = asyncio.create_task(cls.debounced_flush())
+        return cls.__batch_sent
+
+    @classmethod
+    async def debounced_flush(cls):
+        delay = Config.algolia.debounce
+        while len(cls.__pending) > 0:  # or queued during the flush
+            await asyncio.sleep(delay)
+            # wait out a longer outage before the next batch of retries
+            delay = Config.algolia.debounce if await cls.flush() else (
+                Config.algolia.retry_backoff *
+                2 ** (Config.algolia.max_retries + 1)
+            )
+
+    @classmethod
+    async def flush(cls) -> bool:
+        # :return: False if the batch failed and was re-queued
+        # one batch in flight, an older one never lands after a newer
+        async with cls.__flush_lock:
+            return await cls.send_batch()
+
+    @classmethod
+    async def send_batch(cls) -> bool:
+        batch, cls.__pending = cls.__pending, dict()
+        batch_sent, cls.__batch_sent = cls.__batch_sent, None
+        if len(batch) == 0:
+            if batch_sent is not None:
+                batch_sent.set_result(True)
+            return True
+        sent = False
+        requests = [
+            {'action': 'updateObject', 'body': body}
+            if body is not None else
+            {'action': 'deleteObject', 'body': {'objectID': object_id}}
+            for object_id, body in batch.items()
+        ]
+        try:
+            for attempt in range(Config.algolia.max_retries + 1):
+                try:
+                    await cls.get_index().batch_async(requests)
+                    sent = True
+                    cls.invalidate_searches()
+                    cls.__stats['flushes'] += 1
+                    cls.__stats['operations'] += len(requests)
+                    return True
+                except Exception as e:
+                    if attempt == Config.algolia.max_retries:
+                        logger.error(f'algolia batch failed: {e}')
+                        cls.__stats['failures'] += 1
+                        break
+                    cls.__stats['retries'] += 1
+                    await asyncio.sleep(
+                        Config.algolia.retry_backoff * 2 ** attempt
+                    )
+        finally:
+            if not sent:
+                # failed or cancelled, keep unless superseded meanwhile
+                for object_id, body in batch.items():
+                    cls.__pending.setdefault(object_id, body)
+            if batch_sent is not None:
+                batch_sent.set_result(sent)
+        return False
+
+    @classmethod
+    async def sync(cls, operations: dict[str, dict | None]):
+        """
+        Durable task of index writes, done once the debounced batch
+        they are coalesced into is sent, failed to be retried otherwise
+        :param operations: objectID -> object to upsert, None to delete
+        """
+        if (batch_sent := cls.enqueue(operations)) is None:
             return
-        async with SearchClient.create(
-            Config.algolia.app_id,
-            Config.algolia.admin_key
-        ) as client:
-            index = client.init_index(Config.algolia.index_name)
-            await index.delete_objects_async(object_ids)
+        # shared by every waiter, a cancelled one must not cancel it
+        if not await asyncio.shield(batch_sent):
+            raise RuntimeError('algolia batch re-queued')
 
     @staticmethod
-    async def search_content(keyword: str) -> dict:
+    def normalize(keyword: str) -> str:
+        return ' '.join(keyword.lower().split())
+
+    @classmethod
+    async def search_content(
+        cls,
+        keyword: str,
+        page: int = 0,
+        hits_per_page: int = 20,
+        category: str | None = None,
+        tag: str | None = None
+    ) -> dict:
+        """
+        Search results are cached per normalized query, page and facet
+        filter until the index changes or the ttl expires, concurrent
+        identical searches share one request, and type-ahead queries
+        are answered from an exhaustive cached result of their prefix.
+        """
         if Config.algolia is None:
             return dict()
-        async with SearchClient.create(
-            Config.algolia.app_id,
-            Config.algolia.admin_key
-        ) as client:
-            index = client.init_index(Config.algolia.index_name)
-            results: dict | Awaitable = await index.search_async(keyword)
-            while isinstance(results, Awaitable):
-                results = await results
+        key = (cls.normalize(keyword), page, hits_per_page, category, tag)
+        if (results := cls.__cache.get(key)) is not None:
+            return results
+        if page == 0 and (results := cls.refine_prefix(key)) is not None:
+            cls.__stats['prefix_hits'] += 1
+            cls.__cache.set(key, results)
+            return results
+        if (future := cls.__searches.get(key)) is not None:
+            cls.__stats['coalesced'] += 1
+            return await asyncio.shield(future)
+
+        generation, loop = cls.__generation, asyncio.get_running_loop()
+        future = cls.__searches[key] = loop.create_future()
+        try:
+            results = await cls.query_index(*key)
+            if generation == cls.__generation:  # not stale by a write
+                cls.__cache.set(key, results)
+            future.set_result(results)
             return results
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved, waiters re-raise it
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            cls.__searches.pop(key, None)
+
+    @classmethod
+    async def query_index(
+        cls,
+        query: str,
+        page: int,
+        hits_per_page: int,
+        category: str | None,
+        tag: str | None
+    ) -> dict:
+        request_options = {
+            'page': page,
+            'hitsPerPage': hits_per_page,
+            'facets': cls.FACETS
+        }
+        facet_filters = []
+        if category is not None:
+            facet_filters.append(f'category:{category}')
+        if tag is not None:
+            facet_filters.append(f'tags:{tag}')
+        if len(facet_filters) > 0:
+            request_options['facetFilters'] = facet_filters
+
+        results: dict | Awaitable = await cls.get_index().search_async(
+            query, request_options
+        )
+        while isinstance(results, Awaitable):
+            results = await results
+        return results
+
+    @classmethod
+    def refine_prefix(cls, key: tuple) -> dict | None:
+        """
+        Words of a longer query only narrow the hits down, so a cached
+        prefix result holding all its hits in one page is filtered
+        locally, an approximation of the index matching.
+        """
+        query, _, *options = key
+        for end in range(len(query) - 1, 0, -1):
+            prefix = cls.__cache.peek((query[:end], 0, *options))
+            if prefix is None:
+                continue
+            if prefix.get('nbHits', 0) > len(prefix.get('hits', [])):
+                return None  # shorter prefixes have more hits
+            words = query.split()
+            hits = [
+                hit for hit in prefix['hits']
+                if all(word in cls.searchable_text(hit) for word in words)
+            ]
+            return {
+                **prefix,
+                'query': query,
+                'hits': hits,
+                'nbHits': len(hits),
+                'nbPages': 1 if len(hits) > 0 else 0,
+                'facets': cls.count_facets(hits)
+            }
+        return None
 
     @staticmethod
-    @AsyncDatabase.use_database
-    async def refresh_all_contents() -> int:
+    def searchable_text(hit: dict) -> str:
+        return ' '.join([
+            hit.get('title') or '',
+            hit.get('category') or '',
+            *(hit.get('tags') or [])
+        ]).lower()
+
+    @classmethod
+    def count_facets(cls, hits: list[dict]) -> dict[str, dict[str, int]]:
+        facets = {facet: Counter() for facet in cls.FACETS}
+        for hit in hits:
+            if hit.get('category'):
+                facets['category'][hit['category']] += 1
+            facets['tags'].update(hit.get('tags') or [])
+        return {facet: dict(counter) for facet, counter in facets.items()}
+
+    @classmethod
+    def invalidate_searches(cls):
+        cls.__generation += 1
+        cls.__cache.clear()
+
+    @classmethod
+    async def reindex(cls, incremental: bool = False) -> int:
+        """
+        Stream /post contents from a cursor and push them chunk by chunk
+        in parallel, incremental mode only pushes contents updated after
+        the watermark of the last successful reindex.
+        :return: number of contents pushed
+        """
         if Config.algolia is None:
             return 0
-        contents = await BaseDao.select(Content(parent_url='/post'), Content)
-        await AlgoliaService.save_contents(
-            [AlgoliaPostIndex.parse_content(c) for c in contents]
-        )
-        return len(contents)
+        redis = await AsyncRedis.get_connection()
+        updated_after = None
+        if incremental and (
+            watermark := await redis.get(RedisKey.ALGOLIA_WATERMARK)
+        ) is not None:
+            updated_after = datetime.fromisoformat(watermark.decode())
+        # contents updated while streaming are caught by the next run
+        started_time = datetime.now()
+
+        semaphore = asyncio.Semaphore(Config.algolia.reindex_concurrency)
+        tasks, count = [], 0
+
+        async def push(objects: list[dict]):
+            try:
+                await cls.get_index().save_objects_async(objects)
+            finally:
+                semaphore.release()
+
+        async for rows in ResourceDao.stream_index_rows(
+            '/post', updated_after, Config.algolia.batch_size
+        ):
+            tag_names = await ResourceDao.get_tag_names(
+                [row.id for row in rows]
+            )
+            objects = [
+                AlgoliaPostIndex.parse_row(row, tag_names.get(row.id)).dict()
+                for row in rows
+            ]
+            await semaphore.acquire()  # bounds chunks held in memory
+            tasks.append(asyncio.create_task(push(objects)))
+            count += len(objects)
+        await asyncio.gather(*tasks)
+        if count > 0:
+            cls.invalidate_searches()
+
+        await redis.set(RedisKey.ALGOLIA_WATERMARK, started_time.isoformat())
+        logger.info(f'{count} contents reindexed since {updated_after}')
+        return count
@@ -0,0 +1,182 @@
+import time
+
+import zstandard
+from anyio import Path
+
+from config import Config, logger
+from dao import ResourceDao
+
+
+class CodecService:
+    """
+    Post bodies are kept as zstd frames from database through redis,
+    legacy raw html rows are told apart by the zstd frame magic number.
+    Every trained dictionary is kept as {dict_id}.dict so that frames
+    compressed before a re-training can still be decompressed,
+    the newest dictionary is the one used for compression.
+    """
+    MAGIC: bytes = b'\x28\xb5\x2f\xfd'
+    ENCODING: str = 'zstd'
+
+    __dictionaries: dict[int, zstandard.ZstdCompressionDict] = dict()
+    __current: zstandard.ZstdCompressionDict | None = None
+    __stats: dict[str, int | float] = {
+        'encoded': 0,
+        'decoded': 0,
+        'raw_bytes': 0,
+        'encoded_bytes': 0,
+        'encode_cpu_seconds': 0.0,
+        'decode_cpu_seconds': 0.0
+    }
+
+    @classmethod
+    async def init(cls):
+        path = Path(Config.codec.dictionary_dir)
+        if not await path.exists():
+            return
+        newest, newest_mtime = None, 0.0
+        async for file in path.glob('*.dict'):
+            dictionary = zstandard.ZstdCompressionDict(
+                await file.read_bytes()
+            )
+            cls.__dictionaries[dictionary.dict_id()] = dictionary
+            if (mtime := (await file.stat()).st_mtime) > newest_mtime:
+                newest, newest_mtime = dictionary, mtime
+        cls.__current = newest
+        logger.info(f'{len(cls.__dictionaries)} zstd dictionaries loaded')
+
+    @classmethod
+    def is_encoded(cls, data: bytes | None) -> bool:
+        return data is not None and data[:4] == cls.MAGIC
+
+    @classmethod
+    def is_dictless(cls, data: bytes) -> bool:
+        # only frames without dictionary can be decoded by clients
+        return zstandard.get_frame_parameters(data).dict_id == 0
+
+    @classmethod
+    def accepts(cls, accept_encoding: str | None) -> bool:
+        if accept_encoding is None:
+            return False
+        return cls.ENCODING in (
+            coding.split(';')[0].strip()
+            for coding in accept_encoding.lower().split(',')
+        )
+
+    @classmethod
+    def encode(cls, data: bytes | str | None) -> bytes | None:
+        if isinstance(data, str):
+            data = data.encode()
+        if data is None or cls.is_encoded(data):
+            return data  # idempotent for ORM objects already encoded
+        begin = time.thread_time()
+        encoded = zstandard.ZstdCompressor(
+            level=Config.codec.level,
+            dict_data=cls.__current
+        ).compress(data)
+        cls.__stats['encoded'] += 1
+        cls.__stats['raw_bytes'] += len(data)
+        cls.__stats['encoded_bytes'] += len(encoded)
+        cls.__stats['encode_cpu_seconds'] += time.thread_time() - begin
+        return encoded
+
+    @classmethod
+    def decode(cls, data: bytes | None) -> bytes | None:
+        if not cls.is_encoded(data):
+            return data
+        begin = time.thread_time()
+        dict_id = zstandard.get_frame_parameters(data).dict_id
+        if dict_id != 0 and dict_id not in cls.__dictionaries:
+            raise ValueError(f'zstd dictionary {dict_id} not found')
+        decoded = zstandard.ZstdDecompressor(
+            dict_data=cls.__dictionaries.get(dict_id)
+        ).decompress(data)
+        cls.__stats['decoded'] += 1
+        cls.__stats['decode_cpu_seconds'] += time.thread_time() - begin
+        return decoded
+
+    @classmethod
+    def stats(cls) -> dict[str, int | float]:
+        stats = dict(cls.__stats)
+        stats['ratio'] = (
+            stats['raw_bytes'] / stats['encoded_bytes']
+            if stats['encoded_bytes'] > 0 else 0.0
+        )
+        return stats
+
+    @classmethod
+    async def train_dictionary(cls, samples: list[bytes]) -> int:
+        """
+        :param samples: raw html bodies, zstd needs plenty of them
+        :return: id of the new dictionary, 0 if training failed
+        """
+        try:
+            dictionary = zstandard.train_dictionary(
+                Config.codec.dictionary_size, samples
+            )
+        except zstandard.ZstdError as e:
+            logger.warn(f'failed to train zstd dictionary: {e}')
+            return 0
+
+        path = Path(Config.codec.dictionary_dir)
+        await path.mkdir(parents=True, exist_ok=True)
+        await path.joinpath(f'{dictionary.dict_id()}.dict').write_bytes(
+            dictionary.as_bytes()
+        )
+        cls.__dictionaries[dictionary.dict_id()] = dictionary
+        cls.__current = dictionary
+        return dictionary.dict_id()
+
+    @classmethod
+    async def reencode_contents(cls, train: bool = False) -> dict:
+        """
+        One-off migration, (re-)encode all content rows batch by batch
+        with the current dictionary, optionally trained from the rows.
+        :return: report of bytes, ratio and cpu cost of the migration
+        """
+        batch_size = Config.codec.batch_size
+        if train:
+            samples, last_id = [], 0
+            while len(rows := await ResourceDao.get_content_bodies(
+                last_id, batch_size
+            )) > 0:
+                last_id = rows[-1].id
+                samples.extend(
+                    cls.decode(row.content) for row in rows
+                    if row.content is not None
+                )
+            await cls.train_dictionary(samples)
+
+        current_id = cls.__current.dict_id() if cls.__current else 0
+        report = {'rows': 0, 'raw_bytes': 0, 'encoded_bytes': 0}
+        begin, last_id = time.thread_time(), 0
+        while len(rows := await ResourceDao.get_content_bodies(
+            last_id, batch_size
+        )) > 0:
+            last_id, bodies = rows[-1].id, dict()
+            for row in rows:
+                if row.content is None:
+                    continue
+                if (
+                    cls.is_encoded(row.content) and
+                    zstandard.get_frame_parameters(
+                        row.content
+                    ).dict_id == current_id
+                ):
+                    continue
+                raw = cls.decode(row.content)
+                bodies[row.id] = cls.encode(raw)
+                report['raw_bytes'] += len(raw)
+                report['encoded_bytes'] += len(bodies[row.id])
+            report['rows'] += len(bodies)
+            if len(bodies) > 0:
+                await ResourceDao.update_content_bodies(bodies)
+
+        report['dictionary_id'] = current_id
+        report['cpu_seconds'] = time.thread_time() - begin
+        report['ratio'] = (
+            report['raw_bytes'] / report['encoded_bytes']
+            if report['encoded_bytes'] > 0 else 0.0
+        )
+        logger.info(f'contents re-encoded: {report}')
+        return report
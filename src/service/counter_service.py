@@ -0,0 +1,138 @@
+from collections import Counter
+from typing import Type
+
+from config import logger
+from dao import ContentState, CounterDao, ReadScope, ResourceDao
+from models import PostTag, ResourceCounter, Tag
+from schemas import ResourceQuery, TagCount
+
+
+class CounterService:
+    """
+    Content counts per (folder, category), (folder, tag) and
+    (folder, year, month) are kept by applying the difference between
+    a content's counter keys before and after each change,
+    periodically reconciled by a full recount. Each key is counted
+    for all readers and, if the content is public, for anonymous ones.
+    """
+    @staticmethod
+    def counter_keys(
+        state: ContentState | None
+    ) -> list[tuple[str, int, bool]]:
+        if state is None or state.parent_url is None:
+            return []
+        tag_ids = [ResourceCounter.TOTAL]
+        if state.category_id is not None:
+            tag_ids.append(state.category_id)
+        tag_ids.extend(set(state.tag_ids))
+        return [
+            (state.parent_url, tag_id, public_only)
+            for public_only in ((False, True) if state.public else (False,))
+            for tag_id in tag_ids
+        ]
+
+    @staticmethod
+    def archive_keys(
+        state: ContentState | None
+    ) -> list[tuple[str, int, int, bool]]:
+        if (
+            state is None or
+            state.parent_url is None or
+            state.created_time is None
+        ):
+            return []
+        return [
+            (
+                state.parent_url,
+                state.created_time.year,
+                state.created_time.month,
+                public_only
+            )
+            for public_only in ((False, True) if state.public else (False,))
+        ]
+
+    @staticmethod
+    async def find_content_state(content_id: int) -> ContentState | None:
+        # None if the resource is not a content
+        return await CounterDao.get_content_state(content_id)
+
+    @staticmethod
+    async def stage_changes(
+        old_state: ContentState | None,
+        new_state: ContentState | None
+    ):
+        deltas = Counter(CounterService.counter_keys(new_state))
+        deltas.subtract(Counter(CounterService.counter_keys(old_state)))
+        await CounterDao.stage_counts(dict(deltas))
+
+        deltas = Counter(CounterService.archive_keys(new_state))
+        deltas.subtract(Counter(CounterService.archive_keys(old_state)))
+        await CounterDao.stage_archive_counts(dict(deltas))
+
+    @staticmethod
+    def can_count(resource_query: ResourceQuery) -> bool:
+        # a single dimension per counter, combined filters are queried
+        return (
+            resource_query.start_time is None and
+            resource_query.end_time is None and (
+                resource_query.category_name is None or
+                resource_query.tag_name is None
+            )
+        )
+
+    @staticmethod
+    async def find_count(
+        parent_url: str,
+        resource_query: ResourceQuery = ResourceQuery(),
+        public_only: bool = False
+    ) -> int:
+        return await CounterDao.get_count(
+            parent_url, resource_query, public_only
+        )
+
+    @staticmethod
+    async def find_tag_counts(
+        parent_url: str,
+        tag_class: Type[Tag] = PostTag,
+        read_scope: ReadScope | None = None
+    ) -> list[TagCount]:
+        # counters are kept for admins and anonymous readers only
+        if read_scope is not None and read_scope.user_id is not None:
+            rows = await ResourceDao.get_tag_counts(
+                parent_url, tag_class, read_scope
+            )
+        else:
+            rows = await CounterDao.get_tag_counts(
+                parent_url, tag_class, read_scope is not None
+            )
+        return [
+            TagCount(id=row.id, name=row.name, count=row.count)
+            for row in rows
+        ]
+
+    @staticmethod
+    async def find_archive(
+        parent_url: str,
+        read_scope: ReadScope | None = None
+    ) -> dict[int, dict[int, int]]:
+        if read_scope is not None and read_scope.user_id is not None:
+            rows = await ResourceDao.get_archive_counts(parent_url, read_scope)
+        else:
+            rows = await CounterDao.get_archive_counts(
+                parent_url, read_scope is not None
+            )
+        archive: dict[int, dict[int, int]] = dict()
+        for row in rows:
+            archive.setdefault(int(row.year), dict())[int(row.month)] = (
+                row.count
+            )
+        return archive
+
+    @staticmethod
+    async def remove_folder(url: str):
+        await CounterDao.delete_folder_counts(url)
+
+    @staticmethod
+    async def reconcile():
+        count = await CounterDao.reset_counts()
+        logger.info(f'{count} resource counters reconciled')
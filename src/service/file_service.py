@@ -0,0 +1,339 @@
+from __future__ import annotations
+import asyncio
+import hashlib
+import html
+import os
+import re
+import time
+import uuid
+from typing import AsyncIterator
+
+import anyio
+from anyio import Path, to_thread
+from fastapi import HTTPException, status, UploadFile
+
+from .codec_service import CodecService
+from .http_service import HTTPService
+from config import Config, logger
+from dao import ResourceDao
+
+
+def list_files(folder: str) -> list[tuple[str, os.stat_result]]:
+    # runs in a thread, regular files of a folder with their stat
+    if not os.path.isdir(folder):
+        return []
+    with os.scandir(folder) as entries:
+        return [
+            (entry.path, entry.stat(follow_symlinks=False))
+            for entry in entries if entry.is_file(follow_symlinks=False)
+        ]
+
+
+class UploadLimit:
+    """
+    Byte budget and write concurrency shared by all files of a request,
+    every file is additionally capped by Config.static.max_file_size.
+    """
+    def __init__(
+        self,
+        max_request_size: int | None = None,
+        max_concurrent_writes: int | None = None
+    ):
+        self.remaining = (
+            max_request_size if max_request_size is not None
+            else Config.static.max_request_size
+        )
+        self.semaphore = asyncio.Semaphore(
+            max_concurrent_writes if max_concurrent_writes is not None
+            else Config.static.max_concurrent_writes
+        )
+
+    def check_request_size(self, content_length: str | int | None):
+        # early rejection from header, streamed bytes are still counted
+        if content_length is None:
+            return
+        if int(content_length) > self.remaining:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail='upload exceeds request size limit'
+            )
+
+    def consume(self, size: int, filename: str):
+        self.remaining -= size
+        if self.remaining < 0:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f'request size limit exceeded at {filename}'
+            )
+
+
+class FileService:
+    IMAGE_SRC_PATTERN: re.Pattern = re.compile(
+        r'<img\b[^>]*?\bsrc\s*=\s*["\']?(https?://[^"\'\s>]+)',
+        re.IGNORECASE
+    )
+
+    @staticmethod
+    async def content_path(content_id: str | int) -> Path:
+        path = Path(f'{Config.static.content_path}/{content_id}')
+        await path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    @staticmethod
+    async def iter_chunks(
+        file: bytes | UploadFile | AsyncIterator[bytes],
+        chunk_size: int | None = None
+    ) -> AsyncIterator[bytes]:
+        chunk_size = chunk_size or Config.static.chunk_size
+        if isinstance(file, bytes):
+            view = memoryview(file)
+            for offset in range(0, len(view), chunk_size):
+                yield view[offset:offset + chunk_size]
+            return
+        if not isinstance(file, UploadFile):  # e.g. HTTPService.stream
+            async for chunk in file:
+                yield chunk
+            return
+        while chunk := await file.read(chunk_size):
+            yield chunk
+
+    @staticmethod
+    async def store_object(temp_path: Path, file_path: Path, digest: str):
+        """
+        Every distinct payload is kept once under object_path by digest,
+        content files are hard links to it, so the link count is
+        the reference count of the object. Identical re-uploads are
+        no-op and filesystems without hard links get a plain copy.
+        """
+        if await file_path.exists():
+            return
+        object_path = Path(Config.static.object_path).joinpath(digest)
+        await object_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            for source, target in (
+                (temp_path, object_path),
+                (object_path, file_path)
+            ):
+                try:
+                    await target.hardlink_to(source)
+                except FileExistsError:
+                    pass  # stored before or by a concurrent upload
+        except OSError:
+            await temp_path.replace(file_path)
+
+    @staticmethod
+    async def save_file(
+        file: bytes | UploadFile | AsyncIterator[bytes],
+        path: Path,
+        filename: str,
+        limit: UploadLimit | None = None
+    ) -> dict[str, str]:
+        """
+        Stream the payload into a temp file of the target folder
+        in fixed size chunks and hash it on the way, the file is then
+        named after its digest so identical bytes are stored once.
+        :param file: payload, UploadFile or chunks, read chunk by chunk
+        :param path:
+        Path object of expected parent folder, without leading/tailing slash
+        :param filename: original file name with suffix
+        :param limit: size and concurrency limit shared in a request
+        :return: {
+            "name": "original filename",
+            "path": "real filename with relative path",
+            "digest": "sha256 hex digest of the payload"
+        }
+        """
+        limit = limit if limit is not None else UploadLimit()
+        temp_path = path.joinpath(f'.{uuid.uuid4().hex}.part')
+        digest, size = hashlib.sha256(), 0
+
+        async with limit.semaphore:
+            try:
+                async with await anyio.open_file(temp_path, 'wb') as f:
+                    async for chunk in FileService.iter_chunks(file):
+                        size += len(chunk)
+                        if size > Config.static.max_file_size:
+                            raise HTTPException(
+                                status_code=(
+                                    status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+                                ),
+                                detail=f'{filename} exceeds file size limit'
+                            )
+                        limit.consume(len(chunk), filename)
+                        digest.update(chunk)
+                        await f.write(chunk)
+
+                file_path = path.joinpath('{digest}.{suffix}'.format(
+                    digest=digest.hexdigest(),
+                    suffix=filename.split('.')[-1]
+                ))
+                await FileService.store_object(
+                    temp_path, file_path, digest.hexdigest()
+                )
+            finally:
+                await temp_path.unlink(missing_ok=True)
+
+        # Path.__fspath__()/__str__() aka original Path._path
+        return {
+            'name': filename,
+            'path': file_path.__fspath__(),
+            'digest': digest.hexdigest()
+        }
+
+    @staticmethod
+    def find_image_urls(body: str) -> list[str]:
+        # remote img sources in order of appearance without duplicates
+        return list(dict.fromkeys(
+            html.unescape(url)
+            for url in FileService.IMAGE_SRC_PATTERN.findall(body)
+        ))
+
+    @staticmethod
+    def replace_image_urls(body: str, mapping: dict[str, str]) -> str:
+        def replace(match: re.Match) -> str:
+            url = html.unescape(match.group(1))
+            if url not in mapping:
+                return match.group(0)
+            # the pattern ends with the url, keep the tag before it
+            return match.group(0)[:match.start(1) - match.start()] + (
+                mapping[url]
+            )
+
+        return FileService.IMAGE_SRC_PATTERN.sub(replace, body)
+
+    @staticmethod
+    async def save_urls(
+        urls: list[str],
+        path: Path,
+        limit: UploadLimit | None = None
+    ) -> tuple[dict[str, dict[str, str]], dict[str, str]]:
+        """
+        Download remote files concurrently into path, every download is
+        streamed by HTTPService.stream and deduplicated by save_file.
+        :param limit: allowing batch_concurrency writes at least, or
+        opened downloads wait for a write slot while timing out
+        :return: ({url: save_file result}, {url: failure reason})
+        """
+        limit = limit if limit is not None else UploadLimit(
+            max_concurrent_writes=Config.http.batch_concurrency
+        )
+        semaphore = asyncio.Semaphore(Config.http.batch_concurrency)
+        saved, failed = dict(), dict()
+
+        async def save_url(url: str):
+            async with semaphore:
+                try:
+                    async with asyncio.timeout(Config.http.url_timeout):
+                        async with HTTPService.stream(url) as chunks:
+                            saved[url] = await FileService.save_file(
+                                chunks,
+                                path,
+                                url.split('?')[0].split('/')[-1],
+                                limit
+                            )
+                except FileNotFoundError:
+                    failed[url] = 'not found'
+                except TimeoutError:
+                    failed[url] = 'timeout'
+                except HTTPException as e:
+                    failed[url] = e.detail
+                except Exception as e:
+                    failed[url] = f'{e.__class__.__name__}: {e}'
+
+        await asyncio.gather(*(save_url(url) for url in dict.fromkeys(urls)))
+        return saved, failed
+
+    @staticmethod
+    async def collect_garbage() -> dict[str, int]:
+        """
+        Scheduled reconciliation of static files, nothing is removed
+        on the request path. Files of numeric content folders that are
+        not referenced by the content body, objects no longer linked by
+        any content file and variants of removed images are deleted once
+        older than the grace period, so pending uploads of a draft
+        survive. Bytes are reclaimed when the last link goes.
+        :return: report of removed files and reclaimed bytes
+        """
+        static = Config.static
+        deadline = time.time() - static.gc_grace_period
+        semaphore = asyncio.Semaphore(static.gc_concurrency)
+        report = {'files': 0, 'objects': 0, 'variants': 0, 'bytes': 0}
+
+        async def remove(path: str, stat_result: os.stat_result, key: str):
+            # ctime as well, linking an old object is a fresh upload
+            if max(stat_result.st_mtime, stat_result.st_ctime) > deadline:
+                return
+            async with semaphore:
+                try:
+                    await Path(path).unlink()
+                except FileNotFoundError:
+                    return
+            report[key] += 1
+            if stat_result.st_nlink == 1:
+                report['bytes'] += stat_result.st_size
+
+        def decode_bodies(rows) -> dict[int, bytes]:
+            return {
+                row.id: CodecService.decode(row.content) or b''
+                for row in rows
+            }
+
+        folders = sorted(
+            int(name) for name in await to_thread.run_sync(
+                os.listdir, static.content_path
+            ) if name.isdigit()
+        )
+        for i in range(0, len(folders), static.gc_batch_size):
+            content_ids = folders[i:i + static.gc_batch_size]
+            bodies = await to_thread.run_sync(
+                decode_bodies,
+                await ResourceDao.get_content_bodies_by_ids(content_ids)
+            )
+            tasks = []
+            for content_id in content_ids:
+                body = bodies.get(content_id, b'')  # deleted content
+                for path, stat_result in await to_thread.run_sync(
+                    list_files, f'{static.content_path}/{content_id}'
+                ):
+                    if os.path.basename(path).encode() not in body:
+                        tasks.append(remove(path, stat_result, 'files'))
+            await asyncio.gather(*tasks)
+
+            for content_id in content_ids:
+                if content_id in bodies:
+                    continue
+                folder = Path(f'{static.content_path}/{content_id}')
+                try:
+                    if (await folder.stat()).st_mtime < deadline:
+                        await folder.rmdir()
+                except OSError:
+                    pass  # not empty yet
+
+        await asyncio.gather(*(
+            remove(path, stat_result, 'objects')
+            for path, stat_result in await to_thread.run_sync(
+                list_files, static.object_path
+            ) if stat_result.st_nlink == 1
+        ))
+
+        variant_folders = await to_thread.run_sync(
+            lambda: os.listdir(Config.image.cache_path)
+            if os.path.isdir(Config.image.cache_path) else []
+        )
+        tasks = []
+        for name in variant_folders:
+            stems = {
+                os.path.basename(path).split('.')[0]
+                for path, _ in await to_thread.run_sync(
+                    list_files, f'{static.content_path}/{name}'
+                )
+            }
+            for path, stat_result in await to_thread.run_sync(
+                list_files, f'{Config.image.cache_path}/{name}'
+            ):
+                if os.path.basename(path).split('.')[0] not in stems:
+                    tasks.append(remove(path, stat_result, 'variants'))
+        await asyncio.gather(*tasks)
+
+        logger.info(f'static garbage collected: {report}')
+        return report
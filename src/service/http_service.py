@@ -1,10 +1,108 @@
+import asyncio
+import json
 import re
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable
 
 import aiohttp
 
+from config import Config, logger
 from dao import AsyncRedis, RedisKey
 
 
+class CachedSource:
+    """
+    Third party data cached in Redis with its fetch time, fresh for ttl
+    and refreshed in background once refresh_ahead of the ttl is left.
+    One fetch is in flight per process, requests wait for it at most
+    source_timeout and fall back to the last known good value. After
+    breaker_failures failures in a row the upstream is not called for
+    breaker_reset seconds, then one fetch probes it again.
+    """
+    def __init__(
+        self,
+        name: str,
+        fetch: Callable[[], Awaitable[Any]],
+        ttl: float
+    ):
+        self.name = name
+        self.fetch = fetch
+        self.ttl = ttl
+        self.failures = 0
+        self.open_until = 0.0
+        self.__fetching: asyncio.Task | None = None
+        self.__stats: dict[str, int] = {
+            'hits': 0,
+            'fetches': 0,
+            'failures': 0,
+            'stale_hits': 0,
+            'rejected': 0
+        }
+
+    def stats(self) -> dict[str, int | bool]:
+        return {
+            **self.__stats,
+            'circuit_open': time.monotonic() < self.open_until
+        }
+
+    async def get(self) -> Any:
+        """
+        :raise Exception: the fetch failed and nothing was cached
+        """
+        redis = await AsyncRedis.get_connection()
+        entry = await redis.get(RedisKey.third_party(self.name))
+        if entry is not None:
+            entry = json.loads(entry)
+            age = time.time() - entry['fetched_time']
+            if age < self.ttl:
+                self.__stats['hits'] += 1
+                if age > self.ttl * (1 - Config.http.refresh_ahead):
+                    self.refresh()
+                return entry['value']
+        try:  # the fetch goes on after a timeout, for the next request
+            return await asyncio.wait_for(
+                asyncio.shield(self.refresh()), Config.http.source_timeout
+            )
+        except Exception as e:
+            if entry is None:
+                raise
+            self.__stats['stale_hits'] += 1
+            logger.warn(f'{self.name} served stale: {e!r}')
+            return entry['value']
+
+    def refresh(self) -> asyncio.Task:
+        if self.__fetching is None or self.__fetching.done():
+            self.__fetching = asyncio.create_task(self.load())
+            # retrieved, so no one waiting is not an error
+            self.__fetching.add_done_callback(
+                lambda task: task.cancelled() or task.exception()
+            )
+        return self.__fetching
+
+    async def load(self) -> Any:
+        if time.monotonic() < self.open_until:
+            self.__stats['rejected'] += 1
+            raise ConnectionError(f'{self.name} circuit open')
+        self.__stats['fetches'] += 1
+        try:
+            value = await self.fetch()
+        except Exception:
+            self.__stats['failures'] += 1
+            self.failures += 1
+            if self.failures >= Config.http.breaker_failures:
+                self.open_until = time.monotonic() + Config.http.breaker_reset
+            raise
+        self.failures = 0
+        redis = await AsyncRedis.get_connection()
+        await redis.set(
+            RedisKey.third_party(self.name),
+            json.dumps({'value': value, 'fetched_time': time.time()}),
+            ex=Config.http.stale_ttl
+        )
+        return value
+
+
 class HTTPService:
     """
     city code on https://github.com/baichengzhou/weather.api/
@@ -12,41 +110,143 @@ class HTTPService:
     """
     WEATHER_URL: str = 'http://t.weather.itboy.net/api/weather/city/101020100'
 
+    # one keep-alive pool with DNS cache for all outbound calls
+    __session: aiohttp.ClientSession | None = None
+    __sources: dict[str, CachedSource] = dict()
+
+    @classmethod
+    async def init(cls):
+        cls.__session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=Config.http.limit,
+                limit_per_host=Config.http.limit_per_host,
+                ttl_dns_cache=Config.http.dns_cache_ttl,
+                keepalive_timeout=Config.http.keepalive_timeout
+            ),
+            timeout=aiohttp.ClientTimeout(
+                total=Config.http.total_timeout,
+                sock_connect=Config.http.connect_timeout,
+                sock_read=Config.http.read_timeout
+            ),
+            raise_for_status=False
+        )
+
+    @classmethod
+    async def close(cls):
+        if cls.__session is not None:
+            await cls.__session.close()
+            cls.__session = None
+
+    @classmethod
+    def stats(cls) -> dict[str, dict[str, int | bool]]:
+        return {name: x.stats() for name, x in cls.__sources.items()}
+
+    @classmethod
+    def get_source(
+        cls,
+        name: str,
+        fetch: Callable[[], Awaitable[Any]],
+        ttl: float
+    ) -> CachedSource:
+        if (source := cls.__sources.get(name)) is None:
+            source = cls.__sources[name] = CachedSource(name, fetch, ttl)
+        return source
+
     @classmethod
-    async def get_weather(cls) -> dict | None:
-        async with aiohttp.ClientSession() as client:
-            async with client.get(cls.WEATHER_URL) as response:
-                if response.status != 200:
-                    return None
-                return await response.json()
+    async def get_session(cls) -> aiohttp.ClientSession:
+        # jobs or scripts may call before startup
+        if cls.__session is None or cls.__session.closed:
+            await cls.init()
+        return cls.__session
 
     @staticmethod
-    async def get_image(url: str) -> bytes:
+    async def iter_response(
+        response: aiohttp.ClientResponse,
+        max_size: int | None = None
+    ) -> AsyncIterator[bytes]:
+        max_size = max_size or Config.http.max_response_size
+        if (response.content_length or 0) > max_size:
+            raise ValueError(f'{response.url} exceeds response size limit')
+        size = 0
+        async for chunk in response.content.iter_chunked(
+            Config.static.chunk_size
+        ):
+            size += len(chunk)
+            if size > max_size:
+                raise ValueError(f'{response.url} exceeds response size limit')
+            yield chunk
+
+    @classmethod
+    async def read(
+        cls,
+        response: aiohttp.ClientResponse,
+        max_size: int | None = None
+    ) -> bytes:
+        return b''.join([
+            chunk async for chunk in cls.iter_response(response, max_size)
+        ])
+
+    @classmethod
+    @asynccontextmanager
+    async def stream(cls, url: str) -> AsyncIterator[AsyncIterator[bytes]]:
+        """
+        Size capped chunks of a response body, read while consumed
+        :raise FileNotFoundError: status is not 200
+        """
+        session = await cls.get_session()
+        async with session.get(url) as response:
+            if response.status != 200:
+                raise FileNotFoundError
+            yield cls.iter_response(response)
+
+    @classmethod
+    async def get_weather(cls) -> dict:
+        return await cls.get_source(
+            'weather', cls.fetch_weather, Config.http.weather_ttl
+        ).get()
+
+    @classmethod
+    async def fetch_weather(cls) -> dict:
+        session = await cls.get_session()
+        async with session.get(cls.WEATHER_URL) as response:
+            response.raise_for_status()
+            return json.loads(await cls.read(response))
+
+    @classmethod
+    async def get_image(cls, url: str) -> bytes:
         # TODO: parse url parameters
-        async with aiohttp.ClientSession() as client:
-            async with client.get(url) as response:
-                if response.status != 200:
-                    raise FileNotFoundError
-                return await response.read()
+        async with cls.stream(url) as chunks:
+            return b''.join([chunk async for chunk in chunks])
 
     BING_URL: str = 'https://www.bing.com'
     BING_IMAGE_PATTERN: str = r'(?<=href=")/th\?id=.+?\.jpg'
 
+    @classmethod
+    def bing_source(cls) -> CachedSource:
+        return cls.get_source(
+            'bing_image_url', cls.parse_bing_image_url, Config.http.bing_ttl
+        )
+
+    @classmethod
+    async def bing_image_url(cls) -> str:
+        return await cls.bing_source().get()
+
+    @classmethod
+    async def refresh_bing_image_url(cls) -> str:
+        # the image changes daily, earlier than the ttl runs out
+        return await cls.bing_source().refresh()
+
     @classmethod
     async def parse_bing_image_url(cls) -> str:
-        redis = await AsyncRedis.get_connection()
-        async with aiohttp.ClientSession() as client:
-            async with client.get(cls.BING_URL) as response:
-                if response.status != 200:
-                    raise FileNotFoundError
-                image_url: str | None = re.search(
-                    cls.BING_IMAGE_PATTERN,
-                    (await response.read()).decode(
-                        encoding=response.get_encoding()
-                    )
-                ).group()
-                if image_url is None:
-                    return 'failed to get bing image url'
-                url = f'{cls.BING_URL}{image_url.__str__()}'
-                await redis.set(RedisKey.BING_IMAGE_URL, url)
-                return url
+        session = await cls.get_session()
+        async with session.get(cls.BING_URL) as response:
+            response.raise_for_status()
+            match = re.search(
+                cls.BING_IMAGE_PATTERN,
+                (await cls.read(response)).decode(
+                    encoding=response.get_encoding()
+                )
+            )
+            if match is None:
+                raise ValueError('bing image url not found')
+            return f'{cls.BING_URL}{match.group()}'
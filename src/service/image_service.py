@@ -0,0 +1,192 @@
+from __future__ import annotations
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from anyio import Path, to_thread
+from fastapi import HTTPException, status
+from PIL import Image, ImageOps
+
+from .task_service import TaskService
+from config import Config, logger
+
+
+def render_variant(
+    source: str,
+    target: str,
+    width: int,
+    fmt: str,
+    quality: int
+) -> int:
+    """
+    Runs in a worker process, never upscale and keep the aspect ratio.
+    :return: size of the generated file
+    """
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((width, image.height))
+        if image.mode not in ('RGB', 'RGBA'):
+            has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+        temp = f'{target}.{os.getpid()}.part'
+        image.save(temp, format=fmt.upper(), quality=quality)
+    os.replace(temp, target)
+    return os.path.getsize(target)
+
+
+def evict_variants(root: str, budget: int) -> int:
+    """
+    Runs in a thread, mtime is the LRU clock as hits touch the file,
+    drop least recently used variants until the cache is under budget.
+    :return: cache size after eviction
+    """
+    files = []
+    for parent, _, names in os.walk(root):
+        for name in names:
+            stat = os.stat(path := os.path.join(parent, name))
+            files.append((stat.st_mtime, stat.st_size, path))
+    size = sum(file[1] for file in files)
+    for _, file_size, path in sorted(files):
+        if size <= budget:
+            break
+        os.remove(path)
+        size -= file_size
+    return size
+
+
+class ImageService:
+    """
+    Resized and re-encoded variants of uploaded images are generated
+    on a process pool, eagerly at upload and lazily on first request,
+    and kept in a disk cache with a total size budget.
+    """
+    SUFFIXES: tuple[str, ...] = ('jpg', 'jpeg', 'png', 'webp', 'bmp')
+
+    __executor: ProcessPoolExecutor | None = None
+    __pending: dict[str, asyncio.Future] = dict()
+    __size: int = 0
+    __formats: list[str] = []
+
+    @classmethod
+    async def init(cls):
+        Image.init()
+        cls.__formats = [
+            fmt for fmt in Config.image.formats
+            if fmt.upper() in Image.SAVE
+        ]
+        # spawn: forking a threaded event loop process is unsafe
+        cls.__executor = ProcessPoolExecutor(
+            max_workers=Config.image.workers,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+        await Path(Config.image.cache_path).mkdir(parents=True, exist_ok=True)
+        cls.__size = await to_thread.run_sync(
+            evict_variants, Config.image.cache_path, Config.image.cache_size
+        )
+        logger.info(f'image variants {cls.__formats} enabled')
+
+    @classmethod
+    async def close(cls):
+        if cls.__executor is not None:
+            cls.__executor.shutdown(wait=False, cancel_futures=True)
+
+    @classmethod
+    def is_image(cls, path: Path) -> bool:
+        return path.suffix[1:].lower() in cls.SUFFIXES
+
+    @classmethod
+    def variant_urls(cls, path: Path) -> dict[str, str]:
+        """
+        :param path: stored image under content path
+        :return: {"480.webp": "file/image/...?width=480&format=webp"}
+        """
+        relative = path.relative_to(Config.static.content_path).as_posix()
+        return {
+            f'{width}.{fmt}': f'file/image/{relative}'
+            f'?width={width}&format={fmt}'
+            for width in Config.image.widths
+            for fmt in cls.__formats
+        }
+
+    @classmethod
+    def attach_variants(cls, res: dict) -> dict:
+        # add variant urls to a save_file result, generated in background
+        path = Path(res['path'])
+        if cls.__executor is None or not cls.is_image(path):
+            return res
+        res['variants'] = cls.variant_urls(path)
+        for width in Config.image.widths:
+            for fmt in cls.__formats:
+                TaskService.submit(cls.get_variant(path, width, fmt))
+        return res
+
+    @classmethod
+    async def resolve(cls, relative_path: str, width: int, fmt: str) -> Path:
+        if width not in Config.image.widths or fmt not in cls.__formats:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f'unsupported variant {width}.{fmt}'
+            )
+        root = await Path(Config.static.content_path).resolve()
+        source = await root.joinpath(relative_path).resolve()
+        if root not in source.parents or not cls.is_image(source):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='invalid image path'
+            )
+        if not await source.exists():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f'{relative_path} not found'
+            )
+        return await cls.get_variant(source, width, fmt)
+
+    @classmethod
+    async def get_variant(cls, source: Path, width: int, fmt: str) -> Path:
+        root = await Path(Config.static.content_path).resolve()
+        source = await source.resolve()
+        target = Path(Config.image.cache_path).joinpath(
+            source.parent.relative_to(root),
+            f'{source.stem}.w{width}.{fmt}'
+        )
+        key = target.__fspath__()
+
+        if await target.exists():
+            await to_thread.run_sync(os.utime, key)  # LRU touch
+            return target
+        if (future := cls.__pending.get(key)) is not None:
+            await asyncio.shield(future)  # single flight per variant
+            return target
+
+        loop = asyncio.get_running_loop()
+        future = cls.__pending[key] = loop.create_future()
+        try:
+            await target.parent.mkdir(parents=True, exist_ok=True)
+            cls.__size += await loop.run_in_executor(
+                cls.__executor,
+                render_variant,
+                source.__fspath__(),
+                key,
+                width,
+                fmt,
+                Config.image.quality
+            )
+            future.set_result(target)
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved, waiters re-raise it
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            cls.__pending.pop(key, None)
+
+        if cls.__size > Config.image.cache_size:
+            # evict down to 90% so eviction is not run on every miss
+            cls.__size = await to_thread.run_sync(
+                evict_variants,
+                Config.image.cache_path,
+                Config.image.cache_size * 9 // 10
+            )
+        return target
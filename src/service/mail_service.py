@@ -1,19 +1,90 @@
 import asyncio
 import datetime
+import itertools
+import json
 from email.mime.text import MIMEText
 from email.utils import formataddr, parseaddr
-from smtplib import SMTP
-from threading import Thread
+from typing import NamedTuple
 
 import aiosmtplib
 
-from .http_service import HTTPService
 from .render_service import RenderService
+from .task_service import TaskService
 from config import Config, logger
-from schemas import WeatherSchema
+from dao import AsyncRedis, ReadScope, RedisKey, ResourceDao, SubscriberDao
+from models import Content
+from schemas import ResourcePreview, ResourceQuery
+
+
+class OutgoingMail(NamedTuple):
+    # ordered by priority then sequence, unique, never compared further
+    priority: int
+    sequence: int
+    attempt: int
+    recipients: list[str]
+    message: MIMEText
+    # resolved with the recipients given up on, if someone waits
+    delivered: asyncio.Future | None = None
+    failed: tuple[str, ...] = ()
 
 
 class MailService:
+    """
+    Mails are put into a bounded outbox and sent by a small pool of
+    long-lived authenticated connections, lower priority first,
+    so verification codes are not stuck behind bulk mail.
+    """
+    URGENT, BULK = 0, 10
+    # digest variant -> template, MIME subtype
+    DIGEST_VARIANTS: dict[str, tuple[str, str]] = {
+        'html': ('digest.html', 'html'),
+        'text': ('digest.txt', 'plain')
+    }
+
+    __outbox: asyncio.PriorityQueue | None = None
+    __workers: list[asyncio.Task] = []
+    __retry_tasks: set[asyncio.Task] = set()
+    __sequence = itertools.count()
+    __stats: dict[str, int] = {
+        'sent': 0,
+        'retries': 0,
+        'failures': 0,
+        'dropped': 0,
+        'connections': 0
+    }
+
+    @classmethod
+    async def init(cls):
+        if Config.mail is None:
+            return
+        cls.__outbox = asyncio.PriorityQueue(Config.mail.queue_size)
+        cls.__workers = [
+            asyncio.create_task(cls.work())
+            for _ in range(Config.mail.pool_size)
+        ]
+
+    @classmethod
+    async def close(cls):
+        if cls.__outbox is None:
+            return
+        try:  # send what is queued, retries still waiting are lost
+            await asyncio.wait_for(cls.__outbox.join(), timeout=10)
+        except asyncio.TimeoutError:
+            logger.error(f'{cls.__outbox.qsize()} mails dropped')
+        for task in [*cls.__workers, *cls.__retry_tasks]:
+            task.cancel()
+        await asyncio.gather(
+            *cls.__workers, *cls.__retry_tasks, return_exceptions=True
+        )
+        cls.__outbox, cls.__workers = None, []
+
+    @classmethod
+    def stats(cls) -> dict[str, int]:
+        return {
+            'queue_depth': 0 if cls.__outbox is None else cls.__outbox.qsize(),
+            **cls.__stats
+        }
+
     @classmethod
     def format_addr(cls, addr: str):
         name, addr = parseaddr(addr)
@@ -24,11 +95,38 @@ class MailService:
         cls,
         recipients: list[str],
         subject: str | None = None,
-        message: str | None = None
-    ):
+        message: str | None = None,
+        priority: int = BULK
+    ) -> bool:
+        """
+        Queue a mail without waiting for it to be sent
+        :return: False if not queued, the outbox is full
+        """
         if Config.mail is None:
-            return
+            return False
+        if cls.__outbox is None:  # jobs or scripts may call before startup
+            await cls.init()
+        try:
+            cls.__outbox.put_nowait(OutgoingMail(
+                priority,
+                next(cls.__sequence),
+                0,
+                recipients,
+                cls.compose(recipients, subject, message)
+            ))
+        except asyncio.QueueFull:
+            cls.__stats['dropped'] += 1
+            logger.error(f'mail outbox full, mail to {recipients} dropped')
+            return False
+        return True
 
+    @classmethod
+    def compose(
+        cls,
+        recipients: list[str],
+        subject: str | None,
+        message: str | None
+    ) -> MIMEText:
         msg = MIMEText(message, 'html', _charset='utf-8')
         try:
             msg['From'] = cls.format_addr(Config.mail.username)
@@ -36,73 +134,248 @@ class MailService:
             msg['subject'] = subject
         except Exception as e:
             logger.error('failed compose email', e)
+        return msg
+
+    @classmethod
+    async def deliver(
+        cls,
+        recipients: list[str],
+        subject: str | None = None,
+        message: str | None = None
+    ):
+        # durable task, done once the server accepted every recipient
+        if Config.mail is None:
+            return
+        delivered = await cls.send_bulk(
+            recipients, cls.compose(recipients, subject, message)
+        )
+        if len(failed := await delivered) > 0:
+            raise aiosmtplib.SMTPException(f'failed to mail {failed}')
+
+    @classmethod
+    async def send_bulk(
+        cls,
+        recipients: list[str],
+        msg: MIMEText
+    ) -> asyncio.Future:
+        """
+        Queue one message to many recipients in a single transaction,
+        waits for room in the outbox instead of dropping
+        :return: future of the recipients finally failed
+        """
+        if cls.__outbox is None:
+            await cls.init()
+        delivered = asyncio.get_running_loop().create_future()
+        await cls.__outbox.put(OutgoingMail(
+            cls.BULK, next(cls.__sequence), 0, recipients, msg, delivered
+        ))
+        return delivered
 
+    @classmethod
+    async def connect(cls) -> aiosmtplib.SMTP:
         smtp = aiosmtplib.SMTP(
             hostname=Config.mail.host,
             port=Config.mail.port,
             start_tls=False,
-            use_tls=False
+            use_tls=False,
+            timeout=Config.mail.timeout
         )
-        try:
-            await smtp.connect()
+        await smtp.connect()
+        if Config.mail.start_tls:
             await smtp.starttls()
+        if Config.mail.password:
             await smtp.login(Config.mail.username, Config.mail.password)
-            await smtp.send_message(recipients=recipients, message=msg)
-        except aiosmtplib.SMTPException as e:
-            logger.warn('failed to send mail', e)
+        cls.__stats['connections'] += 1
+        return smtp
+
+    @staticmethod
+    def is_permanent(e: Exception) -> bool:
+        # 5xx replies, e.g. unknown recipient, fail again when retried
+        if isinstance(e, aiosmtplib.SMTPRecipientsRefused):
+            return all(x.code >= 500 for x in e.recipients)
+        return isinstance(e, aiosmtplib.SMTPResponseException) and (
+            e.code >= 500
+        )
+
+    @classmethod
+    async def work(cls):
+        smtp: aiosmtplib.SMTP | None = None
+        try:
+            while True:
+                try:
+                    mail: OutgoingMail = await asyncio.wait_for(
+                        cls.__outbox.get(), timeout=Config.mail.idle_timeout
+                    )
+                except asyncio.TimeoutError:
+                    # quit before the server drops the idle connection
+                    if smtp is not None and smtp.is_connected:
+                        await smtp.quit()
+                    smtp = None
+                    continue
+                try:
+                    if smtp is None or not smtp.is_connected:
+                        smtp = await cls.connect()
+                    errors, _ = await smtp.send_message(
+                        mail.message, recipients=mail.recipients
+                    )
+                    cls.__stats['sent'] += 1
+                    if len(errors) > 0:  # the others were accepted
+                        permanent = [
+                            recipient for recipient, response
+                            in errors.items() if response.code >= 500
+                        ]
+                        cls.retry(
+                            mail._replace(failed=(*mail.failed, *permanent)),
+                            [x for x in errors if x not in permanent]
+                        )
+                    else:
+                        cls.finish(mail)
+                except (aiosmtplib.SMTPException, OSError) as e:
+                    if smtp is not None:
+                        smtp.close()  # unknown state, start over
+                    smtp = None
+                    if cls.is_permanent(e):
+                        cls.retry(mail._replace(
+                            failed=(*mail.failed, *mail.recipients)
+                        ), [], e)
+                    else:
+                        cls.retry(mail, mail.recipients, e)
+                except Exception as e:
+                    # e.g. a mail composed without headers, never sendable
+                    logger.error(f'failed to send mail: {e!r}')
+                    cls.retry(mail._replace(
+                        failed=(*mail.failed, *mail.recipients)
+                    ), [], e)
+                finally:
+                    cls.__outbox.task_done()
         finally:
-            smtp.close()
+            if smtp is not None:
+                smtp.close()
+
+    @staticmethod
+    def finish(mail: OutgoingMail):
+        if mail.delivered is not None and not mail.delivered.done():
+            mail.delivered.set_result(list(mail.failed))
 
     @classmethod
-    def send_mail(
+    def retry(
         cls,
+        mail: OutgoingMail,
         recipients: list[str],
-        subject: str | None = None,
-        message: str | None = None
+        e: Exception | None = None
     ):
-        if Config.mail is None:
+        # send again to those recipients later, the rest are done
+        if len(recipients) > 0 and mail.attempt >= Config.mail.max_retries:
+            mail = mail._replace(failed=(*mail.failed, *recipients))
+            recipients = []
+        if len(mail.failed) > 0:
+            cls.__stats['failures'] += 1
+            logger.warn(f'failed to send mail to {mail.failed}: {e}')
+        if len(recipients) == 0:
+            cls.finish(mail)
             return
-        msg = MIMEText(message, 'html', _charset='utf-8')
-        try:
-            msg['From'] = cls.format_addr(Config.mail.username)
-            msg['To'] = cls.format_addr(recipients[0])
-            msg['subject'] = subject
-            msg['subject'] = subject
-        except Exception as e:
-            logger.error('failed compose email', e)
+        cls.__stats['retries'] += 1
 
-        smtp = SMTP(host=Config.mail.host, port=Config.mail.port)
-        try:
-            smtp.starttls()
-            smtp.login(
-                user=Config.mail.username,
-                password=Config.mail.password
-            )
-            smtp.sendmail(
-                from_addr=Config.mail.username,
-                to_addrs=recipients,
-                msg=msg.as_string()
-            )
-        except Exception as e:
-            logger.warn('failed to send mail', e)
-        finally:
-            smtp.close()
+        async def put_later():
+            await asyncio.sleep(Config.mail.retry_backoff * 2 ** mail.attempt)
+            await cls.__outbox.put(mail._replace(
+                attempt=mail.attempt + 1, recipients=recipients
+            ))
+
+        task = asyncio.create_task(put_later())
+        cls.__retry_tasks.add(task)
+        task.add_done_callback(cls.__retry_tasks.discard)
 
     @classmethod
-    def send_email_thread(cls, *args, **kwargs):
-        thread = Thread(target=cls.send_mail, args=args, kwargs=kwargs)
-        thread.start()
+    async def daily_digest(cls) -> int:
+        """
+        Mail posts published since the last digest to subscribers,
+        a page of subscribers at a time. The window and the last
+        subscriber id done are checkpointed in Redis, so a run
+        interrupted by a restart resumes from the page it was on.
+        :return: number of subscribers mailed
+        """
+        if Config.mail is None:
+            return 0
+        redis = await AsyncRedis.get_connection()
+        if (checkpoint := await redis.get(RedisKey.DIGEST_CHECKPOINT)) is None:
+            watermark = await redis.get(RedisKey.DIGEST_WATERMARK)
+            until = datetime.datetime.now()
+            since = until - datetime.timedelta(days=1) if watermark is None \
+                else datetime.datetime.fromisoformat(watermark.decode())
+            checkpoint = {
+                'since': since.isoformat(),
+                'until': until.isoformat(),
+                'after_id': 0
+            }
+            await redis.set(RedisKey.DIGEST_CHECKPOINT, json.dumps(checkpoint))
+        else:
+            checkpoint = json.loads(checkpoint)
+            logger.info(f'digest resumed after subscriber {checkpoint}')
+
+        posts = [
+            ResourcePreview.init(x)
+            for x in await ResourceDao.get_sub_resources(
+                '/post',
+                ResourceQuery(
+                    start_time=datetime.datetime.fromisoformat(
+                        checkpoint['since']
+                    ),
+                    end_time=datetime.datetime.fromisoformat(
+                        checkpoint['until']
+                    ),
+                    time_field='published_time'  # drafts predate it
+                ),
+                Content,
+                ReadScope()  # a digest is public
+            )
+        ]
+        count = 0
+        if len(posts) > 0:
+            subject = f'{len(posts)} new posts on {Config.mail.site_url}'
+            messages: dict[str, MIMEText] = dict()
+            for variant, (template, subtype) in cls.DIGEST_VARIANTS.items():
+                msg = MIMEText(
+                    await RenderService.digest(template, posts),
+                    subtype,
+                    _charset='utf-8'
+                )
+                msg['From'] = cls.format_addr(Config.mail.username)
+                msg['To'] = 'undisclosed-recipients:;'
+                msg['Subject'] = subject
+                messages[variant] = msg
+            count = await cls.fan_out(messages, checkpoint, redis)
+
+        await redis.set(RedisKey.DIGEST_WATERMARK, checkpoint['until'])
+        await redis.delete(RedisKey.DIGEST_CHECKPOINT)
+        logger.info(f'digest of {len(posts)} posts mailed to {count}')
+        return count
 
     @classmethod
-    async def daily_mail(cls):
-        try:
-            weather = WeatherSchema.parse_obj(await HTTPService.get_weather())
-            message = RenderService.daily_mail(weather)
-        except Exception as e:
-            logger.warn('failed to render or get weather')
-            message = e.__str__()
-        asyncio.create_task(MailService.send_mail_async(
-            ['iswangwr@outlook.com'],
-            f'Today is {datetime.datetime.today().date()}',
-            message
-        ))
+    async def fan_out(
+        cls,
+        messages: dict[str, MIMEText],
+        checkpoint: dict,
+        redis: AsyncRedis
+    ) -> int:
+        count, size = 0, Config.mail.rcpt_batch_size
+        while len(subscribers := await SubscriberDao.get_subscribers(
+            checkpoint['after_id'], Config.mail.digest_page_size
+        )) > 0:
+            recipients: dict[str, list[str]] = dict()
+            for subscriber in subscribers:
+                variant = subscriber.variant
+                if variant not in messages:
+                    variant = 'html'
+                recipients.setdefault(variant, []).append(subscriber.email)
+            deliveries = [
+                await cls.send_bulk(emails[i:i + size], messages[variant])
+                for variant, emails in recipients.items()
+                for i in range(0, len(emails), size)
+            ]
+            failed = sum(await asyncio.gather(*deliveries), [])
+            count += len(subscribers) - len(failed)
+
+            checkpoint['after_id'] = subscribers[-1].id
+            await redis.set(RedisKey.DIGEST_CHECKPOINT, json.dumps(checkpoint))
+        return count
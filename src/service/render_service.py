@@ -1,16 +1,91 @@
+import asyncio
+import time
 from datetime import datetime
 
-from fastapi.templating import Jinja2Templates
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    select_autoescape,
+    Template
+)
 
-from schemas import WeatherSchema
+from config import Config, logger
+from schemas import ResourcePreview, WeatherSchema
 
 
 class RenderService:
-    __templates = Jinja2Templates(directory="templates")
+    """
+    Templates are compiled once at startup, with the bytecode cached
+    on disk for the next start, and rendered asynchronously.
+    Every render is timed, templates once slower than
+    Config.render.slow_render are rendered in threads from then on.
+    """
+    __environment: Environment | None = None
+    # template name -> count, total and max seconds, offloaded
+    __stats: dict[str, dict[str, int | float | bool]] = dict()
 
     @classmethod
-    def daily_mail(cls, weather: WeatherSchema) -> str:
-        return cls.__templates.get_template('daily_mail.html').render(
+    def get_environment(cls) -> Environment:
+        if cls.__environment is None:
+            cls.__environment = Environment(
+                loader=FileSystemLoader(Config.render.template_path),
+                bytecode_cache=FileSystemBytecodeCache(
+                    Config.render.cache_path
+                ),
+                auto_reload=Config.render.auto_reload,
+                # plain text templates are not html escaped
+                autoescape=select_autoescape(default_for_string=True),
+                cache_size=-1,  # never evict a compiled template
+                enable_async=True
+            )
+        return cls.__environment
+
+    @classmethod
+    async def init(cls):
+        environment = cls.get_environment()
+
+        def compile_all() -> int:
+            names = environment.list_templates(extensions=['html', 'txt'])
+            for name in names:
+                environment.get_template(name)
+            return len(names)
+
+        count = await asyncio.to_thread(compile_all)
+        logger.info(f'{count} templates compiled')
+
+    @classmethod
+    def stats(cls) -> dict[str, dict[str, int | float | bool]]:
+        return cls.__stats
+
+    @classmethod
+    async def render(cls, name: str, **context) -> str:
+        template: Template = cls.get_environment().get_template(name)
+        stats = cls.__stats.setdefault(name, {
+            'count': 0, 'total': 0.0, 'max': 0.0, 'offloaded': False
+        })
+        start = time.perf_counter()
+        if stats['offloaded']:  # blocking render on its own loop
+            result = await asyncio.to_thread(template.render, **context)
+        else:
+            result = await template.render_async(**context)
+        elapsed = time.perf_counter() - start
+
+        stats['count'] += 1
+        stats['total'] += elapsed
+        stats['max'] = max(stats['max'], elapsed)
+        if not stats['offloaded'] and elapsed > Config.render.slow_render:
+            stats['offloaded'] = True
+            logger.warn(
+                f'{name} took {elapsed * 1000:.1f}ms on the event loop, '
+                f'rendered in threads from now on'
+            )
+        return result
+
+    @classmethod
+    async def daily_mail(cls, weather: WeatherSchema) -> str:
+        return await cls.render(
+            'daily_mail.html',
             city=weather.cityInfo.city,
             updated_time=weather.cityInfo.updateTime,
             type=weather.data.forecast[0].type,
@@ -22,10 +97,18 @@ class RenderService:
         )
 
     @classmethod
-    def two_fa_code(cls, two_fa_code: str) -> str:
-        return cls.__templates.get_template(
-            'two_fa_code.html'
-        ).render(
+    async def two_fa_code(cls, two_fa_code: str) -> str:
+        return await cls.render(
+            'two_fa_code.html',
             two_fa_code=two_fa_code,
             time=datetime.now().strftime('%c')
         )
+
+    @classmethod
+    async def digest(cls, template: str, posts: list[ResourcePreview]) -> str:
+        return await cls.render(
+            template,
+            posts=posts,
+            site_url=Config.mail.site_url,
+            date=datetime.now().date()
+        )
@@ -1,14 +1,13 @@
 import asyncio
-import os
 import uuid
 from datetime import datetime
 from typing import Type, Sequence
 
-from anyio import Path
 from fastapi import HTTPException, status
 
-from config import Config
-from dao import BaseDao, ResourceDao
+from .codec_service import CodecService
+from .counter_service import CounterService
+from dao import BaseDao, ContentState, CounterDao, ReadScope, ResourceDao
 from models import Content, Folder, Resource, ResourceTag
 from schemas import ResourceQuery, UserOutput
 
@@ -29,30 +28,64 @@ class ResourceService:
             resource.this_url = '/' + str(uuid.uuid4())
         resource.url = parent_url + resource.this_url
 
+        ResourceService.encode_content(resource)
+        if isinstance(resource, Content):
+            if resource.created_time is None:
+                resource.created_time = datetime.now()  # archive month
+            ResourceService.stamp_published(resource, resource.permission)
+            await CounterService.stage_changes(None, ContentState(
+                parent_url,
+                resource.category_id,
+                [tag.id for tag in resource.tags if tag.id is not None],
+                resource.created_time,
+                CounterDao.is_public(resource.permission)
+            ))
         return await BaseDao.insert(resource)
 
     @staticmethod
     async def find_resources(resource: Resource) -> list[Resource]:
         return await BaseDao.select(resource, resource.__class__)
 
+    @staticmethod
+    def read_scope(user: UserOutput | None) -> ReadScope | None:
+        # None for admin, who reads everything unfiltered
+        if user is None:
+            return ReadScope()
+        if any(role.name == 'admin' for role in user.roles or []):
+            return None
+        return ReadScope(
+            user.id, tuple(role.id for role in user.roles or [])
+        )
+
     @staticmethod
     async def find_sub_resources(
         parent_url: str | None = None,
         resource_query: ResourceQuery | None = ResourceQuery(),
-        obj_class: Type | None = Resource
+        obj_class: Type | None = Resource,
+        read_scope: ReadScope | None = None
     ) -> Sequence[Resource]:
         return await ResourceDao.get_sub_resources(
-            parent_url, resource_query, obj_class
+            parent_url, resource_query, obj_class, read_scope
         )
 
     @staticmethod
     async def find_sub_count(
         parent_url: str | None = None,
         resource_query: ResourceQuery | None = ResourceQuery(),
-        obj_class: Type | None = Resource
+        obj_class: Type | None = Resource,
+        read_scope: ReadScope | None = None
     ) -> int:
+        # counters hold totals for admins and anonymous readers only
+        if (
+            obj_class is Content and
+            CounterService.can_count(resource_query) and
+            (read_scope is None or read_scope.user_id is None)
+        ):
+            return await CounterService.find_count(
+                parent_url, resource_query, read_scope is not None
+            )
         return await ResourceDao.get_sub_resource_count(
-            parent_url, resource_query, obj_class
+            parent_url, resource_query, obj_class, read_scope
         )
 
     @staticmethod
@@ -73,6 +106,28 @@ class ResourceService:
         resource.url = resource.parent_url + resource.this_url
 
         resource.updated_time = datetime.now()
+        ResourceService.encode_content(resource)
+        if isinstance(resource, Content):
+            permission = vars(resource).get('permission')
+            ResourceService.stamp_published(
+                resource,
+                permission if permission is not None
+                else old_resources[0].permission,
+                old_resources[0].published_time
+            )
+        if (state := await CounterService.find_content_state(
+            resource.id
+        )) is not None:
+            # unloaded or omitted category is left unchanged by update
+            category_id = vars(resource).get('category_id')
+            permission = vars(resource).get('permission')
+            await CounterService.stage_changes(state, state._replace(
+                parent_url=resource.parent_url,
+                category_id=category_id if category_id is not None
+                else state.category_id,
+                public=CounterDao.is_public(permission)
+                if permission is not None else state.public
+            ))
         res = await BaseDao.update(resource, resource.__class__)
 
         if resource.url != old_resources[0].url:
@@ -87,12 +142,40 @@ class ResourceService:
             await asyncio.gather(*tasks)
         return res
 
+    @staticmethod
+    def stamp_published(
+        content: Content,
+        permission: int | None,
+        published_time: datetime | None = None
+    ):
+        # drafts are moved to /post, created_time is the drafting time
+        if (
+            published_time is None and
+            content.parent_url == '/post' and
+            CounterDao.is_public(permission)
+        ):
+            content.published_time = datetime.now()
+
     @staticmethod
     async def remove_resource(resource: Resource) -> int:
+        if (state := await CounterService.find_content_state(
+            resource.id
+        )) is not None:
+            await CounterService.stage_changes(state, None)
+        else:
+            folders = await BaseDao.select(Folder(id=resource.id), Folder)
+            for folder in folders:
+                await CounterService.remove_folder(folder.url)
         return await BaseDao.delete(resource, Resource)
 
     @staticmethod
     async def reset_content_tags(content: Content):
+        if (state := await CounterService.find_content_state(
+            content.id
+        )) is not None:
+            await CounterService.stage_changes(state, state._replace(
+                tag_ids=[x.id for x in content.tags]
+            ))
         await BaseDao.delete_all(
             [ResourceTag(resource_id=content.id)], ResourceTag
         )
@@ -106,21 +189,10 @@ class ResourceService:
             await BaseDao.insert_all(add_content_tags)
 
     @staticmethod
-    async def trim_files(content_id: int, attach_files: set[str]):
-        path = Path(f'{Config.static.content_path}/{content_id}')
-        if not await Path.exists(path):
-            return
-
-        async def handle_files(folder: Path):
-            tasks = []
-            async for file in folder.iterdir():
-                if attach_files is None or file.name not in attach_files:
-                    tasks.append(file.unlink(missing_ok=True))
-            await asyncio.gather(*tasks)
-            if len(os.listdir(folder.__fspath__())) == 0:
-                await folder.rmdir()
-
-        asyncio.create_task(handle_files(path))
+    def encode_content(resource: Resource):
+        # sub resources loaded by ORM never carry a raw input body
+        if isinstance(resource, Content) and 'content' in resource.__dict__:
+            resource.content = CodecService.encode(resource.content)
 
     @staticmethod
     def check_permission(
@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+from config import Config, logger
+from dao import AsyncRedis, BloomFilter, RedisKey
+
+
+class RevocationService:
+    """
+    Revoked token ids live in Redis until the token would expire.
+    Every worker mirrors them in a bloom filter kept in sync over
+    pub/sub, so Redis is asked only when the filter says maybe,
+    and the filter is rebuilt from Redis to forget expired ids.
+    """
+    __bloom: BloomFilter | None = None
+    __listen_task: asyncio.Task | None = None
+    __stats: dict[str, int] = {
+        'checks': 0,
+        'bloom_hits': 0,
+        'revoked_hits': 0
+    }
+
+    @classmethod
+    def new_filter(cls) -> BloomFilter:
+        return BloomFilter(
+            Config.jwt.revocation_capacity,
+            Config.jwt.revocation_error_rate
+        )
+
+    @classmethod
+    def get_filter(cls) -> BloomFilter:
+        if cls.__bloom is None:
+            cls.__bloom = cls.new_filter()
+        return cls.__bloom
+
+    @classmethod
+    async def init(cls):
+        cls.get_filter()
+        if Config.redis is not None:  # memory storage is per process
+            cls.__listen_task = asyncio.create_task(cls.listen())
+
+    @classmethod
+    async def close(cls):
+        if cls.__listen_task is not None:
+            cls.__listen_task.cancel()
+            await asyncio.gather(cls.__listen_task, return_exceptions=True)
+            cls.__listen_task = None
+
+    @classmethod
+    def stats(cls) -> dict[str, int]:
+        return {
+            **cls.__stats,
+            'filter_count': len(cls.get_filter()),
+            'filter_bytes': cls.get_filter().nbytes
+        }
+
+    @classmethod
+    async def revoke(cls, jti: str | None, expire_time: float):
+        """
+        :param jti: token id, tokens without one cannot be revoked
+        :param expire_time: exp claim, nothing to revoke after it
+        """
+        if jti is None or (ttl := int(expire_time - time.time()) + 1) <= 0:
+            return
+        redis = await AsyncRedis.get_connection()
+        await redis.set(RedisKey.revoked_token(jti), '1', ex=ttl)
+        cls.get_filter().add(jti)  # at once, before the broadcast lands
+        if Config.redis is not None:
+            await redis.publish(RedisKey.REVOKED_TOKEN_CHANNEL, jti)
+
+    @classmethod
+    async def is_revoked(cls, jti: str | None) -> bool:
+        cls.__stats['checks'] += 1
+        if jti is None or jti not in cls.get_filter():
+            return False
+        cls.__stats['bloom_hits'] += 1
+        redis = await AsyncRedis.get_connection()
+        if await redis.get(RedisKey.revoked_token(jti)) is None:
+            return False  # false positive or expired
+        cls.__stats['revoked_hits'] += 1
+        return True
+
+    @classmethod
+    async def rebuild(cls, redis: AsyncRedis):
+        bloom = cls.new_filter()
+        prefix_size = len(RedisKey.REVOKED_TOKEN_PATTERN) - 1
+        async for key in redis.scan_iter(
+            match=RedisKey.REVOKED_TOKEN_PATTERN, count=10000
+        ):
+            bloom.add(key[prefix_size:])
+        cls.__bloom = bloom
+        logger.info(f'{len(bloom)} revoked tokens loaded')
+
+    @classmethod
+    async def listen(cls):
+        while True:
+            redis = await AsyncRedis.get_connection()
+            pubsub = redis.pubsub()
+            try:
+                await pubsub.subscribe(RedisKey.REVOKED_TOKEN_CHANNEL)
+                # subscribed first, so nothing is missed while loading
+                await cls.rebuild(redis)
+                rebuilt_time = time.monotonic()
+                while True:
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=1
+                    )
+                    if message is not None:
+                        cls.get_filter().add(message['data'])
+                    if (
+                        time.monotonic() - rebuilt_time >
+                        Config.jwt.revocation_rebuild_interval
+                    ):
+                        await cls.rebuild(redis)
+                        rebuilt_time = time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f'token revocation sync lost: {e}')
+                await asyncio.sleep(5)
+            finally:
+                await pubsub.reset()
@@ -0,0 +1,139 @@
+import asyncio
+import functools
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Callable
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.base import BaseTrigger
+
+from config import Config, logger
+from dao import AsyncRedis, RedisKey
+
+
+class SchedulerService:
+    """
+    Every worker schedules the jobs but only the one holding the
+    leader lock runs them, the others keep the scheduler paused.
+    The lock expires lock_ttl after its holder stops renewing it,
+    then another worker takes over, and jobs missed in the gap run
+    within the misfire grace time. A job may run twice around a
+    failover, so jobs must be safe to repeat.
+    """
+    __scheduler: AsyncIOScheduler | None = None
+    __election_task: asyncio.Task | None = None
+    __owner = f'{uuid.uuid4().hex}:{os.getpid()}'
+    __is_leader = False
+
+    @classmethod
+    def get_scheduler(cls) -> AsyncIOScheduler:
+        if cls.__scheduler is None:
+            cls.__scheduler = AsyncIOScheduler(job_defaults={
+                'coalesce': True,
+                'misfire_grace_time': Config.scheduler.lock_ttl * 2
+            })
+        return cls.__scheduler
+
+    @classmethod
+    def add_job(cls, func: Callable, trigger: BaseTrigger, **kwargs):
+        job_id = func.__qualname__
+
+        @functools.wraps(func)
+        async def run(*args, **kw):
+            start_time, start = datetime.now(), time.perf_counter()
+            status, error = 'success', None
+            try:
+                return await func(*args, **kw)
+            except Exception as e:
+                status, error = 'error', repr(e)
+                raise
+            finally:
+                await cls.record(job_id, {
+                    'start_time': start_time.isoformat(),
+                    'duration': time.perf_counter() - start,
+                    'status': status,
+                    'error': error,
+                    'owner': cls.__owner
+                })
+
+        cls.get_scheduler().add_job(
+            run, trigger, id=job_id, replace_existing=True, **kwargs
+        )
+
+    @classmethod
+    async def record(cls, job_id: str, run: dict):
+        try:
+            redis = await AsyncRedis.get_connection()
+            history = await redis.hget(RedisKey.JOB_HISTORY, job_id)
+            history = [] if history is None else json.loads(history)
+            history = [run, *history][:Config.scheduler.history_size]
+            await redis.hset(RedisKey.JOB_HISTORY, job_id, json.dumps(history))
+        except Exception as e:
+            logger.error(f'failed to record run of {job_id}: {e}')
+
+    @classmethod
+    def start(cls):
+        # paused until elected, jobs added later are paused too
+        cls.get_scheduler().start(paused=True)
+        cls.__election_task = asyncio.create_task(cls.elect())
+
+    @classmethod
+    async def close(cls):
+        if cls.__election_task is not None:
+            cls.__election_task.cancel()
+            await asyncio.gather(cls.__election_task, return_exceptions=True)
+            cls.__election_task = None
+        if cls.__scheduler is not None and cls.__scheduler.running:
+            cls.__scheduler.shutdown(wait=False)
+        if cls.__is_leader:  # hand over at once instead of after the ttl
+            cls.__is_leader = False
+            redis = await AsyncRedis.get_connection()
+            await redis.release_lock(RedisKey.SCHEDULER_LEADER, cls.__owner)
+
+    @classmethod
+    async def elect(cls):
+        ttl = Config.scheduler.lock_ttl
+        while True:
+            try:
+                redis = await AsyncRedis.get_connection()
+                if cls.__is_leader:
+                    is_leader = await redis.renew_lock(
+                        RedisKey.SCHEDULER_LEADER, cls.__owner, ttl
+                    )
+                else:
+                    is_leader = await redis.acquire_lock(
+                        RedisKey.SCHEDULER_LEADER, cls.__owner, ttl
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # the lock may expire meanwhile, step down to be safe
+                logger.error(f'scheduler leader election failed: {e}')
+                is_leader = False
+            if is_leader != cls.__is_leader:
+                cls.__is_leader = is_leader
+                if is_leader:
+                    cls.get_scheduler().resume()
+                    logger.info(f'scheduler leader {cls.__owner}')
+                else:
+                    cls.get_scheduler().pause()
+                    logger.warn(f'scheduler leadership lost {cls.__owner}')
+            await asyncio.sleep(ttl / 3)
+
+    @classmethod
+    async def stats(cls) -> dict:
+        redis = await AsyncRedis.get_connection()
+        history = {
+            job.id: json.loads(
+                await redis.hget(RedisKey.JOB_HISTORY, job.id) or '[]'
+            )
+            for job in cls.get_scheduler().get_jobs()
+        }
+        return {
+            'is_leader': cls.__is_leader,
+            'owner': cls.__owner,
+            'history': history
+        }
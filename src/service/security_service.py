@@ -1,6 +1,10 @@
 import asyncio
+import hashlib
 import jwt
+import math
 import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 import bcrypt
@@ -18,8 +22,9 @@ from fastapi.security import OAuth2PasswordBearer
 
 from .mail_service import MailService
 from .render_service import RenderService
-from config import Config, CustomHeaders, logger, Status
-from dao import AsyncRedis, BaseDao, RedisKey
+from .revocation_service import RevocationService
+from config import Config, CustomHeaders, logger, RateLimitPolicy, Status
+from dao import AsyncRedis, BaseDao, LRUCache, RedisKey
 from models import SysUser
 from schemas import TokenResponse, UserInput, UserOutput
 
@@ -37,18 +42,18 @@ async def optional_login_required(
     if access_token is None:
         return None
     try:
-        data = SecurityService.verify_jwt_token(
+        return await SecurityService.verify_user_token(
             access_token, Config.jwt.key
         )
     except jwt.ExpiredSignatureError:
-        data = SecurityService.verify_jwt_token(
+        user_output = await SecurityService.verify_user_token(
             refresh_token, Config.jwt.key
         )
         response.headers[CustomHeaders.TOKEN_NEED_REFRESH] = 'true'
+        return user_output
     except Exception as e:
         logger.warn(e)
         return None
-    return UserOutput(**data)
 
 
 async def login_required(
@@ -68,13 +73,12 @@ async def verify_2fa_token(
     if two_fa_token is None:
         return None
     try:
-        data = SecurityService.verify_jwt_token(
+        return await SecurityService.verify_user_token(
             two_fa_token, Config.two_fa.jwt_key
         )
     except Exception as e:
         logger.warn(e)
         return None
-    return UserOutput(**data)
 
 
 async def check_2fa_code(
@@ -98,27 +102,25 @@ async def check_2fa_code(
                 status_code=Status.HTTP_442_2FA_FAILED,
                 detail='totp mismatch, please try again'
             )
-        asyncio.create_task(redis.delete(  # success
+        await redis.delete(  # success
             RedisKey.totp_key(user_output.username)
-        ))
+        )
     elif isinstance(existed_code, bytes):
         if existed_code.decode() != two_fa_code:
             raise HTTPException(
                 status_code=Status.HTTP_442_2FA_FAILED,
                 detail='otp mismatch, please try again'
             )
-        asyncio.create_task(redis.delete(  # success
+        await redis.delete(  # success
             RedisKey.two_fa_code(user_output.username)
-        ))
+        )
     else:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail='no available otp, please contact system admin'
         )
     # success
-    asyncio.create_task(redis.delete(
-        RedisKey.need_2fa(user_output.username)
-    ))
+    await redis.delete(RedisKey.need_2fa(user_output.username))
     return user_output
 
 
@@ -126,24 +128,67 @@ class SecurityService:
     ACCESS_TIMEOUT_HOUR, REFRESH_TIMEOUT_HOUR = 1, 24 * 7
     TWO_FA_TIMEOUT_MINUTE = 5
 
+    oauth2_scheme: callable = oauth2_scheme_optional
     optional_login_required: callable = optional_login_required
     login_required: callable = login_required
     check_2fa_code: callable = check_2fa_code
     verify_2fa_token: callable = verify_2fa_token
 
-    @staticmethod
-    def get_password_hash(plain_password: bytes) -> bytes | None:
+    # (jwt key, token digest) -> UserOutput or (error class, message)
+    __token_cache: LRUCache | None = None
+    __hash_executor: ThreadPoolExecutor | None = None
+    __hash_pending: int = 0
+
+    @classmethod
+    async def run_hashing(cls, function: callable, *args) -> any:
+        """
+        bcrypt releases the GIL, so it runs on a small dedicated pool
+        instead of blocking the event loop. Calls beyond the pool and
+        its bounded queue are refused with 429 at once.
+        """
+        if cls.__hash_pending >= Config.password.max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail='too many password checks, please retry later',
+                headers={'Retry-After': '1'}
+            )
+        if cls.__hash_executor is None:
+            cls.__hash_executor = ThreadPoolExecutor(
+                max_workers=Config.password.workers,
+                thread_name_prefix='bcrypt'
+            )
+        cls.__hash_pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                cls.__hash_executor, function, *args
+            )
+        finally:
+            cls.__hash_pending -= 1
+
+    @classmethod
+    async def get_password_hash(cls, plain_password: bytes) -> bytes | None:
         if plain_password is None:
             return None
-        return bcrypt.hashpw(plain_password, bcrypt.gensalt())
+        return await cls.run_hashing(
+            bcrypt.hashpw,
+            plain_password,
+            bcrypt.gensalt(Config.password.rounds)
+        )
 
     @classmethod
-    def verify_password(
+    async def verify_password(
         cls,
         plain_password: bytes,
         password_hash: bytes
     ) -> bool:
-        return bcrypt.checkpw(plain_password, password_hash)
+        return await cls.run_hashing(
+            bcrypt.checkpw, plain_password, password_hash
+        )
+
+    @staticmethod
+    def need_rehash(password_hash: bytes) -> bool:
+        # $2b$12$..., cost factor changed since the hash was made
+        return int(password_hash.split(b'$')[2]) != Config.password.rounds
 
     @staticmethod
     def verify_jwt_token(jwt_token: str | bytes, key: str) -> dict[str, any]:
@@ -153,6 +198,70 @@ class SecurityService:
             algorithms=[Config.jwt.algorithm]
         )
 
+    @classmethod
+    async def verify_user_token(
+        cls,
+        jwt_token: str | bytes | None,
+        key: str
+    ) -> UserOutput:
+        """
+        Verified tokens are cached by digest until they expire and
+        invalid ones for a short while, so a token sent again and again
+        by a client is decoded and checked once, only the revocation
+        is checked on every call.
+        :raise jwt.InvalidTokenError: e.g. jwt.ExpiredSignatureError
+        """
+        if jwt_token is None:
+            raise jwt.DecodeError('token is missing')
+        if cls.__token_cache is None:
+            cls.__token_cache = LRUCache(Config.jwt.token_cache_size)
+        if isinstance(jwt_token, str):
+            jwt_token = jwt_token.encode()
+        cache_key = (key, hashlib.sha256(jwt_token).digest())
+
+        if (cached := cls.__token_cache.get(cache_key)) is None:
+            try:
+                data = cls.verify_jwt_token(jwt_token, key)
+            except jwt.InvalidTokenError as e:
+                cls.__token_cache.set(
+                    cache_key,
+                    (e.__class__, str(e)),
+                    Config.jwt.negative_cache_ttl
+                )
+                raise
+            cached = (UserOutput(**data), data.get('jti'), data['exp'])
+            cls.__token_cache.set(cache_key, cached, data['exp'] - time.time())
+        if isinstance(cached[0], type):  # new instance, no traceback
+            raise cached[0](cached[1])
+
+        user_output, jti, expire_time = cached
+        if await RevocationService.is_revoked(jti):
+            # revoked for good, skip the lookup until it expires anyway
+            cls.__token_cache.set(
+                cache_key,
+                (jwt.InvalidTokenError, 'token revoked'),
+                expire_time - time.time()
+            )
+            raise jwt.InvalidTokenError('token revoked')
+        return user_output
+
+    @classmethod
+    async def revoke_tokens(cls, *jwt_tokens: str | bytes | None):
+        # signed by us and not yet expired, otherwise nothing to revoke
+        for jwt_token in jwt_tokens:
+            if jwt_token is None:
+                continue
+            try:
+                data = cls.verify_jwt_token(jwt_token, Config.jwt.key)
+            except jwt.InvalidTokenError:
+                continue
+            await RevocationService.revoke(data.get('jti'), data['exp'])
+
+    @classmethod
+    def clear_token_cache(cls):
+        if cls.__token_cache is not None:
+            cls.__token_cache.clear()
+
     @staticmethod
     def create_jwt_token(user_info: UserOutput, key: str, **kwargs) -> bytes:
         """
@@ -163,6 +272,7 @@ class SecurityService:
         """
         data = user_info.dict()
         data['exp'] = datetime.utcnow() + timedelta(**kwargs)
+        data['jti'] = secrets.token_urlsafe(16)  # id to revoke it by
         return jwt.encode(
             payload=data,
             key=key,
@@ -193,21 +303,22 @@ class SecurityService:
     ):
         two_fa_code = str(secrets.randbelow(1000000)).zfill(6)
         logger.info(f'2fa code for {user_output.username} is {two_fa_code}')
-        two_fa_page = RenderService.two_fa_code(two_fa_code)
-        asyncio.create_task(MailService.send_mail_async(
+        two_fa_page = await RenderService.two_fa_code(two_fa_code)
+        await MailService.send_mail_async(
             [user_output.email],
             subject=f'verification code for {user_output.username}',
-            message=two_fa_page
-        ))
+            message=two_fa_page,
+            priority=MailService.URGENT
+        )
         '''
         2fa_code and 2fa_token both has an expiration of 5 minutes
         users can refresh 2fa_code one time per 30 seconds according
         to api throttle imposed on /login, total expiration is 10min.
         '''
-        asyncio.create_task(redis.set(
+        await redis.set(
             RedisKey.two_fa_code(user_output.username),
             two_fa_code, ex=300
-        ))
+        )
 
     @classmethod
     def user_input_validation(cls, username: str, password: bytes):
@@ -236,12 +347,20 @@ class SecurityService:
             )
         sys_user: SysUser = sys_users[0]
 
-        if cls.verify_password(password, sys_user.password_hash) is False:
+        if await cls.verify_password(
+            password, sys_user.password_hash
+        ) is False:
             await redis.set(RedisKey.need_2fa(username), 'True')
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail='password mismatch'
             )
+        if cls.need_rehash(sys_user.password_hash):
+            # only the plain password at hand can be hashed again
+            await BaseDao.update(SysUser(
+                id=sys_user.id,
+                password_hash=await cls.get_password_hash(password)
+            ), SysUser)
         '''
         1. First login success, nothing happens
         2. Login failed, set need_2fa
@@ -316,28 +435,63 @@ class RoleRequired:
 
 
 class APIThrottle:
-    def __init__(self, throttle: int | None = 30):
-        self.throttle = throttle
+    """
+    Rate limit per path, method and client ip in one atomic round trip.
+    Token bucket refills limit tokens per period and holds up to
+    limit + burst, sliding window admits limit + burst requests
+    in any period.
+    """
+    def __init__(
+        self,
+        period: float = 30,
+        limit: int = 1,
+        burst: int = 0,
+        policy: RateLimitPolicy = RateLimitPolicy.TOKEN_BUCKET
+    ):
+        self.period = period
+        self.limit = limit
+        self.allowance = limit + burst
+        self.policy = policy
 
     async def __call__(
         self,
         request: Request,
+        response: Response,
         redis: AsyncRedis = Depends(AsyncRedis.get_connection)
     ):
         key = RedisKey.throttle(
             request.url.path,
             request.method,
-            request.client.host
+            request.client.host,
+            self.policy
         )
-        if await redis.get(key) is not None:
+        if self.policy == RateLimitPolicy.SLIDING_WINDOW:
+            rate_limit = await redis.sliding_window(
+                key, self.period, self.allowance
+            )
+        else:
+            rate_limit = await redis.token_bucket(
+                key, self.limit / self.period, self.allowance
+            )
+
+        headers = {
+            CustomHeaders.RATE_LIMIT_LIMIT: str(self.allowance),
+            CustomHeaders.RATE_LIMIT_REMAINING: str(rate_limit.remaining),
+            CustomHeaders.RATE_LIMIT_RESET: str(
+                math.ceil(rate_limit.reset_after)
+            )
+        }
+        if not rate_limit.allowed:
             message = 'too frequent {method} to {path} from {host}'.format(
                 method=request.method,
                 path=request.url.path,
                 host=request.client.host
             )
+            headers['Retry-After'] = str(math.ceil(rate_limit.retry_after))
             # HTTP 429 Too Many Requests
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail=message
+                detail=message,
+                headers=headers
             )
-        asyncio.create_task(redis.set(key, '0', ex=self.throttle))
+        response.headers.update(headers)
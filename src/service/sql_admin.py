@@ -12,6 +12,7 @@ from models import (
     Content,
     PostCategory,
     PostTag,
+    Subscriber,
     SysRole,
     SysUser
 )
@@ -84,7 +85,7 @@ class SysUserAdmin(ModelView, model=SysUser):
         model: any,
         is_created: bool
     ) -> None:
-        data['password_hash'] = SecurityService.get_password_hash(
+        data['password_hash'] = await SecurityService.get_password_hash(
             hashlib.sha256(data['password_hash'].encode()).hexdigest().encode()
         )
 
@@ -111,6 +112,26 @@ class PostTagAdmin(ModelView, model=PostTag):
     form_columns = column_list
 
 
+class SubscriberAdmin(ModelView, model=Subscriber):
+    name = "Subscriber"
+    name_plural = "Subscribers"
+    icon = "fa-solid fa-envelope"
+    can_view_details = False
+
+    column_list = [
+        Subscriber.email,
+        Subscriber.variant,
+        Subscriber.active,
+        Subscriber.created_time
+    ]
+    column_details_list = column_list
+    form_columns = [
+        Subscriber.email,
+        Subscriber.variant,
+        Subscriber.active
+    ]
+
+
 class SqlAdmin(AuthenticationBackend):
     __admin: Admin = None
     __lock: Lock = Lock()
@@ -130,12 +151,15 @@ class SqlAdmin(AuthenticationBackend):
         return True
 
     async def logout(self, request: Request) -> bool:
+        await SecurityService.revoke_tokens(
+            request.session.get('access_token')
+        )
         request.session.clear()
         return True
 
     async def authenticate(self, request: Request) -> bool:
         try:
-            SecurityService.verify_jwt_token(
+            await SecurityService.verify_user_token(
                 request.session.get('access_token'),
                 Config.jwt.key
             )
@@ -160,7 +184,8 @@ class SqlAdmin(AuthenticationBackend):
             PostCategoryAdmin,
             PostTagAdmin,
             SysUserAdmin,
-            SysRoleAdmin
+            SysRoleAdmin,
+            SubscriberAdmin
         ):
             cls.__admin.add_view(view)
         cls.__lock.release()
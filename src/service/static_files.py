@@ -0,0 +1,258 @@
+from __future__ import annotations
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from email.utils import formatdate
+from mimetypes import guess_type
+
+import anyio
+from anyio import to_thread
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles, PathLike
+from starlette.types import Receive, Scope, Send
+
+from config import Config
+
+
+# content addressed names from FileService and ImageService
+DIGEST_NAME = re.compile(r'^[0-9a-f]{64}(\.|$)')
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def hash_file(path: str, chunk_size: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ETagCache:
+    """
+    Strong ETags are content hashes, computed once per file version
+    identified by (device, inode, mtime, size) and kept in a LRU.
+    """
+    __etags: OrderedDict[tuple, str] = OrderedDict()
+
+    @classmethod
+    async def get_etag(cls, path: str, stat_result: os.stat_result) -> str:
+        name = os.path.basename(path)
+        if DIGEST_NAME.match(name):
+            return f'"{name[:64]}"'  # named by its own hash already
+
+        key = (
+            stat_result.st_dev,
+            stat_result.st_ino,
+            stat_result.st_mtime_ns,
+            stat_result.st_size
+        )
+        if (etag := cls.__etags.get(key)) is not None:
+            cls.__etags.move_to_end(key)
+            return etag
+        etag = '"{}"'.format(await to_thread.run_sync(
+            hash_file, path, Config.static.chunk_size
+        ))
+        cls.__etags[key] = etag
+        while len(cls.__etags) > Config.static.etag_cache_size:
+            cls.__etags.popitem(last=False)
+        return etag
+
+
+class RangeFileResponse(Response):
+    """
+    File response with strong ETag, conditional requests and
+    single byte ranges, streamed with the ASGI zero-copy extension
+    when the server offers it.
+    """
+    chunk_size = 256 * 1024
+
+    def __init__(
+        self,
+        path: str,
+        stat_result: os.stat_result,
+        method: str,
+        media_type: str | None = None,
+        headers: dict[str, str] | None = None,
+        etag_suffix: str = ''
+    ):
+        self.path = path
+        self.stat_result = stat_result
+        self.status_code = 200
+        self.send_header_only = method.upper() == 'HEAD'
+        self.media_type = media_type or guess_type(path)[0] or 'text/plain'
+        self.background = None
+        self.etag_suffix = etag_suffix
+        self.init_headers(headers)
+
+    @staticmethod
+    def parse_range(header: str, size: int) -> tuple[int, int] | None:
+        """
+        :return: inclusive (first, last) byte,
+        None to ignore the header and send the whole file,
+        multiple ranges are answered with the whole file as allowed
+        """
+        if (match := RANGE_HEADER.match(header.strip())) is None:
+            return None
+        first, last = match.groups()
+        if first == '' and last == '':
+            return None
+        if first == '':  # suffix range, the last N bytes
+            return max(size - int(last), 0), size - 1
+        if int(first) >= size:
+            raise ValueError('range not satisfiable')
+        last = size - 1 if last == '' else min(int(last), size - 1)
+        if last < int(first):
+            return None
+        return int(first), last
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        request_headers = Headers(scope=scope)
+        size = self.stat_result.st_size
+        etag = await ETagCache.get_etag(self.path, self.stat_result)
+        if self.etag_suffix:  # per encoding, still a strong validator
+            etag = f'{etag[:-1]}{self.etag_suffix}"'
+        self.headers['etag'] = etag
+        self.headers['last-modified'] = formatdate(
+            self.stat_result.st_mtime, usegmt=True
+        )
+        self.headers['accept-ranges'] = 'bytes'
+
+        if_none_match = request_headers.get('if-none-match')
+        if if_none_match is not None and (
+            if_none_match.strip() == '*' or
+            etag in [x.strip() for x in if_none_match.split(',')]
+        ):
+            await self.send_head(send, 304, 0)
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        byte_range = None
+        range_header = request_headers.get('range')
+        if_range = request_headers.get('if-range')
+        if range_header is not None and (if_range in (None, etag)):
+            try:
+                byte_range = self.parse_range(range_header, size)
+            except ValueError:
+                self.headers['content-range'] = f'bytes */{size}'
+                await self.send_head(send, 416, 0)
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+
+        if byte_range is None:
+            first, count = 0, size
+            await self.send_head(send, 200, size)
+        else:
+            first, count = byte_range[0], byte_range[1] - byte_range[0] + 1
+            self.headers['content-range'] = (
+                f'bytes {byte_range[0]}-{byte_range[1]}/{size}'
+            )
+            await self.send_head(send, 206, count)
+
+        if self.send_header_only or count == 0:
+            await send({'type': 'http.response.body', 'body': b''})
+        elif 'http.response.zerocopysend' in scope.get('extensions', {}):
+            with open(self.path, 'rb') as f:
+                await send({
+                    'type': 'http.response.zerocopysend',
+                    'file': f,
+                    'offset': first,
+                    'count': count
+                })
+        else:
+            async with await anyio.open_file(self.path, 'rb') as f:
+                await f.seek(first)
+                while count > 0:
+                    chunk = await f.read(min(self.chunk_size, count))
+                    if not chunk:
+                        break  # truncated while sending
+                    count -= len(chunk)
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': count > 0
+                    })
+                if count > 0:
+                    await send({'type': 'http.response.body', 'body': b''})
+
+    async def send_head(self, send: Send, status_code: int, length: int):
+        self.status_code = status_code
+        if status_code == 304:
+            for key in ('content-type', 'content-encoding', 'accept-ranges'):
+                if key in self.headers:
+                    del self.headers[key]
+        else:
+            self.headers['content-length'] = str(length)
+        await send({
+            'type': 'http.response.start',
+            'status': status_code,
+            'headers': self.raw_headers
+        })
+
+
+class StaticFileServer(StaticFiles):
+    """
+    StaticFiles serving digest named files as immutable,
+    with byte ranges, strong ETags and precompressed siblings,
+    e.g. app.js.br or app.js.gz next to app.js.
+    """
+    ENCODINGS: tuple[tuple[str, str], ...] = (('br', '.br'), ('gzip', '.gz'))
+
+    @staticmethod
+    def accepted_encodings(accept_encoding: str) -> set[str]:
+        accepted = set()
+        for item in accept_encoding.split(','):
+            encoding, _, params = item.strip().partition(';')
+            if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00'):
+                accepted.add(encoding.strip().lower())
+        return accepted
+
+    def file_response(
+        self,
+        full_path: PathLike,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200
+    ) -> Response:
+        if status_code != 200:  # html 404 page
+            return super().file_response(
+                full_path, stat_result, scope, status_code
+            )
+
+        path = os.fspath(full_path)
+        headers = {'cache-control': (
+            f'public, max-age={Config.static.max_age}, immutable'
+            if DIGEST_NAME.match(os.path.basename(path))
+            else 'public, no-cache'
+        )}
+        media_type = guess_type(path)[0]
+        request_headers = Headers(scope=scope)
+        accepted = self.accepted_encodings(
+            request_headers.get('accept-encoding', '')
+        )
+
+        for encoding, suffix in self.ENCODINGS:
+            try:
+                sibling_stat = os.stat(path + suffix)
+            except OSError:
+                continue
+            headers['vary'] = 'Accept-Encoding'
+            if (
+                encoding in accepted and
+                'range' not in request_headers and
+                sibling_stat.st_mtime >= stat_result.st_mtime
+            ):
+                headers['content-encoding'] = encoding
+                return RangeFileResponse(
+                    path + suffix,
+                    sibling_stat,
+                    scope['method'],
+                    media_type,
+                    headers,
+                    etag_suffix=f'-{encoding}'
+                )
+
+        return RangeFileResponse(
+            path, stat_result, scope['method'], media_type, headers
+        )
@@ -0,0 +1,262 @@
+import asyncio
+import json
+import os
+import uuid
+from collections import deque
+from typing import Awaitable, Callable
+
+from redis.exceptions import ResponseError
+
+from config import Config, logger
+from dao import AsyncRedis, RedisKey
+
+
+class TaskService:
+    """
+    Cheap best-effort work, like cache fills, runs on a bounded pool
+    of workers in this process and is dropped when the pool is backed
+    up. Side effects that must happen are enqueued by handler name
+    on a Redis stream consumed by a group of every process and
+    acknowledged once done, so a task left by a failed attempt or a
+    dead process is claimed again after claim_idle seconds, up to
+    max_retries times before it is moved to a dead letter stream.
+    Without Redis durable tasks run on the local pool.
+    """
+    __queue: asyncio.Queue | None = None
+    __workers: list[asyncio.Task] = []
+    __consumers: list[asyncio.Task] = []
+    __unpooled: set[asyncio.Future] = set()
+    __handlers: dict[str, Callable[..., Awaitable]] = dict()
+    __consumer = f'{uuid.uuid4().hex}:{os.getpid()}'
+    __closing = False
+    __dead_letters: deque[dict] = deque(maxlen=1000)  # without redis
+    __stats: dict[str, int] = {
+        'submitted': 0,
+        'enqueued': 0,
+        'completed': 0,
+        'failures': 0,
+        'dropped': 0,
+        'retries': 0,
+        'dead_lettered': 0
+    }
+
+    @classmethod
+    def register(cls, handler: Callable[..., Awaitable]):
+        # durable tasks are stored by name, every process must know it
+        cls.__handlers[handler.__qualname__] = handler
+
+    @classmethod
+    async def init(cls):
+        cls.__closing = False
+        cls.__queue = asyncio.Queue(Config.task.queue_size)
+        cls.__workers = [
+            asyncio.create_task(cls.work())
+            for _ in range(Config.task.pool_size)
+        ]
+        if Config.redis is None:
+            return
+        redis = await AsyncRedis.get_connection()
+        try:
+            await redis.xgroup_create(
+                RedisKey.TASK_STREAM, RedisKey.TASK_GROUP, id='0',
+                mkstream=True
+            )
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):  # created by another process
+                raise
+        cls.__consumers = [
+            asyncio.create_task(cls.consume())
+            for _ in range(Config.task.consumers)
+        ]
+
+    @classmethod
+    async def close(cls):
+        if cls.__queue is None:
+            return
+        cls.__closing = True  # consumers stop after the current task
+        try:
+            await asyncio.wait_for(asyncio.gather(
+                cls.__queue.join(), *cls.__consumers
+            ), timeout=10)
+        except asyncio.TimeoutError:
+            # unacknowledged durable tasks are claimed by others later
+            logger.error(f'{cls.__queue.qsize()} local tasks dropped')
+        for task in [*cls.__workers, *cls.__consumers]:
+            task.cancel()
+        await asyncio.gather(
+            *cls.__workers, *cls.__consumers, return_exceptions=True
+        )
+        cls.__queue, cls.__workers, cls.__consumers = None, [], []
+
+    @classmethod
+    async def stats(cls) -> dict[str, int]:
+        stats = {
+            'queue_depth': 0 if cls.__queue is None else cls.__queue.qsize(),
+            **cls.__stats
+        }
+        if Config.redis is None:
+            stats['dead_letters'] = len(cls.__dead_letters)
+        else:
+            redis = await AsyncRedis.get_connection()
+            stats['stream_length'] = await redis.xlen(RedisKey.TASK_STREAM)
+            stats['dead_letters'] = await redis.xlen(
+                RedisKey.TASK_DEAD_LETTER
+            )
+        return stats
+
+    @classmethod
+    def submit(cls, task: Awaitable) -> bool:
+        """
+        Run a best-effort task on the local pool, safe to lose
+        :return: False if dropped, the pool is backed up
+        """
+        if cls.__queue is None or cls.__closing:
+            # scripts without startup, or a request finishing on shutdown
+            task = asyncio.ensure_future(task)
+            cls.__unpooled.add(task)  # referenced until done
+            task.add_done_callback(cls.done)
+            return True
+        try:
+            cls.__queue.put_nowait(task)
+        except asyncio.QueueFull:
+            if asyncio.iscoroutine(task):
+                task.close()  # never awaited on purpose
+            cls.__stats['dropped'] += 1
+            return False
+        cls.__stats['submitted'] += 1
+        return True
+
+    @classmethod
+    async def enqueue(cls, handler: Callable[..., Awaitable], **kwargs):
+        """
+        Queue a task that must happen, retried until it succeeds
+        :param handler: registered handler, called with kwargs
+        :param kwargs: json serializable arguments
+        """
+        name = handler.__qualname__
+        if name not in cls.__handlers:
+            raise KeyError(f'{name} is not a registered task')
+        cls.__stats['enqueued'] += 1
+        if Config.redis is None:
+            if cls.__queue is None:
+                await cls.init()
+            await cls.__queue.put(cls.run_locally(name, kwargs))
+            return
+        redis = await AsyncRedis.get_connection()
+        await redis.xadd(RedisKey.TASK_STREAM, {
+            'name': name,
+            'kwargs': json.dumps(kwargs)
+        })
+
+    @classmethod
+    def done(cls, task: asyncio.Future):
+        cls.__unpooled.discard(task)
+        if task.cancelled():
+            return
+        if (e := task.exception()) is not None:
+            cls.__stats['failures'] += 1
+            logger.error(f'background task failed: {e!r}')
+        else:
+            cls.__stats['completed'] += 1
+
+    @classmethod
+    async def work(cls):
+        while True:
+            task = await cls.__queue.get()
+            try:
+                await task
+                cls.__stats['completed'] += 1
+            except Exception as e:
+                cls.__stats['failures'] += 1
+                logger.error(f'background task failed: {e!r}')
+            finally:
+                cls.__queue.task_done()
+
+    @classmethod
+    async def run_locally(cls, name: str, kwargs: dict):
+        for attempt in range(Config.task.max_retries + 1):
+            try:
+                return await cls.__handlers[name](**kwargs)
+            except Exception as e:
+                if attempt == Config.task.max_retries:
+                    cls.dead_letter(name, kwargs, e)
+                    raise
+                cls.__stats['retries'] += 1
+                await asyncio.sleep(Config.task.retry_backoff * 2 ** attempt)
+
+    @classmethod
+    def dead_letter(cls, name: str, kwargs: dict, e: Exception):
+        cls.__stats['dead_lettered'] += 1
+        cls.__dead_letters.append(
+            {'name': name, 'kwargs': kwargs, 'error': repr(e)}
+        )
+        logger.error(f'task {name} dead lettered: {e!r}')
+
+    @classmethod
+    async def consume(cls):
+        while not cls.__closing:
+            try:
+                redis = await AsyncRedis.get_connection()
+                # tasks failed or left by dead consumers come first
+                _, messages, *_ = await redis.xautoclaim(
+                    RedisKey.TASK_STREAM,
+                    RedisKey.TASK_GROUP,
+                    cls.__consumer,
+                    Config.task.claim_idle * 1000,
+                    count=Config.task.pool_size
+                )
+                if len(messages) == 0:
+                    response = await redis.xreadgroup(
+                        RedisKey.TASK_GROUP,
+                        cls.__consumer,
+                        {RedisKey.TASK_STREAM: '>'},
+                        count=Config.task.pool_size,
+                        block=1000  # to notice closing
+                    )
+                    messages = response[0][1] if response else []
+                # together, handlers waiting on a shared batch coalesce
+                for result in await asyncio.gather(*(
+                    cls.handle(redis, message_id, fields)
+                    for message_id, fields in messages
+                ), return_exceptions=True):
+                    if isinstance(result, Exception):
+                        logger.error(f'task handling failed: {result!r}')
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f'task stream consumer failed: {e!r}')
+                await asyncio.sleep(5)
+
+    @classmethod
+    async def handle(
+        cls,
+        redis: AsyncRedis,
+        message_id: bytes,
+        fields: dict[bytes, bytes] | None
+    ):
+        if fields is not None:  # None if deleted while pending
+            name = fields[b'name'].decode()
+            kwargs = json.loads(fields[b'kwargs'])
+            try:
+                await cls.__handlers[name](**kwargs)
+                cls.__stats['completed'] += 1
+            except Exception as e:
+                cls.__stats['failures'] += 1
+                attempts = await redis.hincrby(
+                    RedisKey.TASK_ATTEMPTS, message_id, 1
+                )
+                if attempts <= Config.task.max_retries:
+                    cls.__stats['retries'] += 1
+                    return  # left pending, claimed again when idle
+                await redis.xadd(
+                    RedisKey.TASK_DEAD_LETTER,
+                    {**fields, 'error': repr(e)},
+                    maxlen=10000
+                )
+                cls.__stats['dead_lettered'] += 1
+                logger.error(f'task {name} dead lettered: {e!r}')
+        await redis.xack(
+            RedisKey.TASK_STREAM, RedisKey.TASK_GROUP, message_id
+        )
+        await redis.xdel(RedisKey.TASK_STREAM, message_id)
+        await redis.hdel(RedisKey.TASK_ATTEMPTS, message_id)
@@ -11,7 +11,7 @@ class UserService:
     ) -> UserOutput:
         sys_user = (await BaseDao.select(user_input, SysUser))[0]
 
-        assert SecurityService.verify_password(
+        assert await SecurityService.verify_password(
             user_input.password,
             sys_user.password_hash
         ) is True
@@ -23,7 +23,7 @@ class UserService:
         sys_user = SysUser(
             id=user_input.id,
             username=user_input.username,
-            password_hash=SecurityService.get_password_hash(
+            password_hash=await SecurityService.get_password_hash(
                 user_input.password
             ),
             email=user_input.email,
@@ -40,12 +40,9 @@ class UserService:
 
     @staticmethod
     async def modify_user(user_input: SysUser) -> UserOutput:
-        sys_user = (await BaseDao.select(
-            SysUser(id=user_input.id), SysUser
-        ))[0]
-
         if user_input.password_hash is not None:
-            sys_user.password_hash = SecurityService.get_password_hash(
+            # update copies every column set on user_input
+            user_input.password_hash = await SecurityService.get_password_hash(
                 user_input.password_hash
             )
 
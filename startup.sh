@@ -1,5 +1,6 @@
 #!/bin/bash                                                                                                            
 docker run \
     -v `pwd`/static:/fastapi/static \
+    -v `pwd`/assets/zstd:/fastapi/assets/zstd \
     -v `pwd`/assets/production_config.json:/fastapi/assets/config.json \
     --net=host --restart=always --name fastapi -d fastapi:latest
@@ -34,6 +34,15 @@ def test_modify_content(content_id: int):
     return response
 
 
+def test_get_content_html(content_id: int):
+    response = client.get(f'/content/{content_id}/html',
+                          headers={**AuthToken.headers,
+                                   'Accept-Encoding': 'zstd'})
+    print(response.headers)
+    assert response.status_code == 200
+    return response
+
+
 def test_delete_content(content_id: int):
     response = client.delete(f'content/{content_id}',
                              headers=AuthToken.headers)
@@ -45,6 +54,7 @@ def run_content_all_test():
     test_auth()
     r = test_add_content()
     test_modify_content(r.json())
+    test_get_content_html(r.json())
     test_delete_content(r.json())
 
 
@@ -31,6 +31,10 @@ def test_get_count():
     return client.get('/folder/count//post')
 
 
+def test_get_archive():
+    return client.get('/folder/archive/post')
+
+
 def run_folder_all_test():
     test_auth()
     r = test_add_category('/post', 'test category')
@@ -42,6 +46,9 @@ def run_folder_all_test():
     r = test_get_count()
     print(r.json())
     assert r.status_code == 200
+    r = test_get_archive()
+    print(r.json())
+    assert r.status_code == 200
 
 
 if __name__ == '__main__':
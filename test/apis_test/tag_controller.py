@@ -36,6 +36,13 @@ def test_modify_content(cat_name: str, tag_name: str):
                headers=AuthToken.headers)
 
 
+def test_tag_cloud(url: str):
+    response = client.get(f'/tag/cloud/{url}', headers=AuthToken.headers)
+    print(response.json())
+    assert response.status_code == 200
+    return response
+
+
 def run_tag_all_test():
     test_auth()
     tag_name = 'test tag name'
@@ -43,6 +50,7 @@ def run_tag_all_test():
     cat_name = 'test cat name'
     test_add_category(cat_name)
     test_modify_content(cat_name, tag_name)
+    test_tag_cloud('post')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,242 @@
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable
+
+import httpx
+from sqlalchemy import event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)
+)))
+sys.path.append(os.path.join(ROOT, 'src'))
+from dao import AsyncDatabase
+from seed import seed
+
+ADMIN_PASSWORD = 'benchmark'
+
+
+class RotatingClientTransport(httpx.ASGITransport):
+    # a client address per request, so logins are not rate limited
+    __addresses = itertools.count()
+
+    async def handle_async_request(self, request: httpx.Request):
+        n = next(self.__addresses)
+        self.client = (f'10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}', 0)
+        return await super().handle_async_request(request)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+def write_config(workdir: str, database: str | None, redis: str | None):
+    config = {
+        'admin': {
+            'username': 'admin',
+            'password': ADMIN_PASSWORD,
+            'email': 'admin@localhost',
+            'role': {'name': 'admin'},
+            'two_fa_enforced': False
+        },
+        'database': json.loads(database) if database else {
+            'drivername': 'sqlite+aiosqlite',
+            'database': os.path.join(workdir, 'benchmark.sqlite')
+        },
+        'folders': [
+            {'title': 'root', 'url': '', 'permission': 0},
+            {'title': 'post', 'url': '/post', 'parent_url': '',
+             'permission': 711}
+        ],
+        'jwt': {'key': 'benchmark', 'algorithm': 'HS256'},
+        'static': {
+            'root_path': 'static',
+            'content_path': 'static/content'
+        },
+        'two_fa': {'enforcement': False, 'jwt_key': 'benchmark 2fa'},
+        'render': {'template_path': os.path.join(ROOT, 'templates')}
+    }
+    if redis:  # FakeRedis otherwise
+        config['redis'] = json.loads(redis)
+    os.makedirs(os.path.join(workdir, 'assets'))
+    os.makedirs(os.path.join(workdir, 'static'))
+    with open(os.path.join(workdir, 'assets', 'config.json'), 'w') as f:
+        json.dump(config, f)
+
+
+def scenarios(
+    data: dict[str, list],
+    rng: random.Random
+) -> dict[str, Callable[[], tuple[str, str, dict]]]:
+    # scenario -> request factory of method, url and httpx kwargs
+    password = hashlib.sha256(ADMIN_PASSWORD.encode()).hexdigest()
+
+    def folder_query() -> dict:
+        query = {'page_idx': rng.randrange(10), 'page_size': 10}
+        if rng.random() < 0.3:
+            query['tag_name'] = rng.choice(data['tags'])
+        elif rng.random() < 0.3:
+            query['category_name'] = rng.choice(data['categories'])
+        return query
+
+    return {
+        'content': lambda: (
+            'GET', f'/content/{rng.choice(data["content_ids"])}', {}
+        ),
+        'folder_sub_content': lambda: (
+            'GET', f'/folder/sub_content{rng.choice(data["folders"])}',
+            {'params': folder_query()}
+        ),
+        'folder_count': lambda: (
+            'GET', f'/folder/count{rng.choice(data["folders"])}',
+            {'params': folder_query()}
+        ),
+        'tag_cloud': lambda: ('GET', '/tag/cloud/post', {}),
+        'category_cloud': lambda: ('GET', '/category/cloud/post', {}),
+        'tags': lambda: ('GET', '/tag', {}),
+        'login': lambda: ('POST', '/auth', {
+            'data': {'username': 'admin', 'password': password}
+        })
+    }
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    request: Callable[[], tuple[str, str, dict]],
+    requests: int,
+    concurrency: int,
+    queries: QueryCounter
+) -> dict:
+    latencies: list[float] = []
+    statuses: dict[int, int] = dict()
+    remaining = itertools.count()
+
+    async def worker():
+        while next(remaining) < requests:
+            method, url, kwargs = request()
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = \
+                statuses.get(response.status_code, 0) + 1
+
+    queries.count = 0
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {
+        'requests': requests,
+        'statuses': statuses,
+        'p50_ms': round(percentiles[49] * 1000, 3),
+        'p95_ms': round(percentiles[94] * 1000, 3),
+        'p99_ms': round(percentiles[98] * 1000, 3),
+        'throughput_rps': round(requests / elapsed, 1),
+        'queries_per_request': round(queries.count / requests, 2)
+    }
+
+
+def commit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args: argparse.Namespace):
+    workdir = tempfile.mkdtemp(prefix='blog-benchmark-')
+    write_config(workdir, args.database, args.redis)
+    os.chdir(workdir)  # the app reads assets/config.json from here
+    from main import app, shutdown, startup
+
+    await startup()
+    start = time.perf_counter()
+    rng = random.Random(args.seed)
+    data = await seed(
+        args.posts, args.tags, args.categories, args.folders, args.depth,
+        rng=rng
+    )
+    seed_seconds = time.perf_counter() - start
+
+    queries = QueryCounter()
+    engine = (await AsyncDatabase.get_engine()).sync_engine
+    event.listen(engine, 'before_cursor_execute', queries)
+
+    results = dict()
+    async with httpx.AsyncClient(
+        transport=RotatingClientTransport(app=app),
+        base_url='http://benchmark'
+    ) as client:
+        for name, request in scenarios(data, rng).items():
+            if args.scenarios and name not in args.scenarios:
+                continue
+            await run_scenario(  # warm up caches and connections
+                client, request, min(args.requests, 50),
+                args.concurrency, queries
+            )
+            results[name] = await run_scenario(
+                client, request, args.requests, args.concurrency, queries
+            )
+    event.remove(engine, 'before_cursor_execute', queries)
+    await shutdown()
+
+    report = {
+        'commit': commit(),
+        'python': platform.python_version(),
+        'database': engine.dialect.name,
+        'redis': 'redis' if args.redis else 'fake',
+        'concurrency': args.concurrency,
+        'seed': {
+            'posts': args.posts,
+            'tags': args.tags,
+            'categories': args.categories,
+            'folders': args.folders * args.depth,
+            'seconds': round(seed_seconds, 1)
+        },
+        'scenarios': results
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(os.path.join(ROOT, args.output), 'w') as f:
+            f.write(text)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='seed a blog and benchmark its endpoints in process'
+    )
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--tags', type=int, default=300)
+    parser.add_argument('--categories', type=int, default=100)
+    parser.add_argument('--folders', type=int, default=20)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--database', help='database config as json, sqlite by default'
+    )
+    parser.add_argument(
+        '--redis', help='redis config as json, FakeRedis by default'
+    )
+    parser.add_argument('--scenarios', nargs='*')
+    parser.add_argument('--output', help='json file, relative to the repo')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,97 @@
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from dao import AsyncDatabase
+from models import Content, Folder, PostCategory, PostTag
+from service import CodecService, CounterService
+
+
+PARAGRAPH = (
+    '<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do '
+    'eiusmod tempor incididunt ut labore et dolore magna aliqua.</p>'
+)
+
+
+def new_url(parent_url: str, this_url: str) -> tuple[str, str]:
+    return f'{parent_url}{this_url}', this_url
+
+
+async def seed(
+    posts: int = 5000,
+    tags: int = 300,
+    categories: int = 100,
+    folders: int = 20,
+    depth: int = 3,
+    private_ratio: float = 0.1,
+    rng: random.Random | None = None
+) -> dict[str, list]:
+    """
+    Posts spread over /post and a tree of nested folders under it,
+    each with a category, a few tags, a body of a few kilobytes and a
+    created time within the last three years, some of them private.
+    :return: ids and names to draw requests from
+    """
+    rng = rng or random.Random(0)
+    now = datetime.now()
+    async with AsyncDatabase.new_session() as session:
+        tag_rows = [PostTag(name=f'tag-{i}') for i in range(tags)]
+        category_rows = [
+            PostCategory(name=f'category-{i}') for i in range(categories)
+        ]
+        session.add_all([*tag_rows, *category_rows])
+
+        folder_urls = ['/post']
+        for i in range(folders):
+            parent_url = '/post'
+            for level in range(depth):
+                url, this_url = new_url(parent_url, f'/series-{i}-{level}')
+                folder = Folder(
+                    title=f'series-{i}-{level}',
+                    url=url,
+                    permission=711,
+                    parent_url=parent_url
+                )
+                folder.this_url, folder.owner_id = this_url, 1
+                session.add(folder)
+                folder_urls.append(parent_url := url)
+        await session.flush()
+
+        contents = []
+        for i in range(posts):
+            # most posts are on /post, the rest deeper in the tree
+            parent_url = '/post' if rng.random() < 0.6 \
+                else rng.choice(folder_urls)
+            url, this_url = new_url(parent_url, f'/{uuid.uuid4()}')
+            created_time = now - timedelta(seconds=rng.randrange(94608000))
+            content = Content(
+                title=f'post {i}',
+                url=url,
+                permission=700 if rng.random() < private_ratio else 711,
+                parent_url=parent_url,
+                content=CodecService.encode(
+                    PARAGRAPH * rng.randrange(5, 60)
+                )
+            )
+            content.this_url, content.owner_id = this_url, 1
+            content.sub_title = f'summary of post {i}'
+            content.created_time = created_time
+            content.updated_time = created_time + timedelta(
+                days=rng.randrange(30)
+            )
+            content.category_id = rng.choice(category_rows).id
+            content.tags = rng.sample(tag_rows, rng.randrange(1, 6))
+            session.add(content)
+            contents.append(content)
+            if i % 1000 == 999:
+                await session.flush()
+        await session.commit()
+
+        content_ids = [x.id for x in contents]
+    await CounterService.reconcile()
+    return {
+        'content_ids': content_ids,
+        'tags': [x.name for x in tag_rows],
+        'categories': [x.name for x in category_rows],
+        'folders': folder_urls
+    }
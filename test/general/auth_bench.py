@@ -0,0 +1,53 @@
+import asyncio
+import os
+import sys
+import time
+
+from fastapi import Response
+
+sys.path.append(os.path.join(os.getcwd(), 'src'))
+from config import Config, JWTConfig
+from schemas import UserOutput
+from schemas.user import RoleSchema
+from service import RoleRequired, SecurityService
+
+
+ROUNDS = 20000
+
+
+async def auth_chain(access_token: str) -> UserOutput:
+    # optional_login_required -> login_required -> RoleRequired
+    user_output = await SecurityService.optional_login_required(
+        Response(), access_token, None
+    )
+    user_output = await SecurityService.login_required(user_output)
+    return await RoleRequired('admin')(user_output)
+
+
+async def run(access_token: str, cached: bool) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        if not cached:
+            SecurityService.clear_token_cache()
+        await auth_chain(access_token)
+    return ROUNDS / (time.perf_counter() - start)
+
+
+async def main():
+    Config.jwt = JWTConfig(key='benchmark')
+    user_output = UserOutput(
+        id=1,
+        username='admin',
+        email='admin@localhost',
+        roles=[RoleSchema(id=1, name='admin')]
+    )
+    access_token = SecurityService.create_access_tokens(
+        user_output
+    ).access_token
+    for cached in (False, True):
+        rps = await run(access_token, cached)
+        print(f'{"cached" if cached else "uncached":<10}{rps:>12.1f} auth/s')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.getcwd(), 'src'))
+from config import Config, HTTPConfig
+from service.http_service import CachedSource
+
+
+class Upstream:
+    def __init__(self):
+        self.calls = 0
+        self.delay = 0.05
+        self.down = False
+
+    async def fetch(self) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.down:
+            raise ConnectionError('upstream down')
+        return f'value {self.calls}'
+
+
+async def main():
+    Config.redis = None
+    Config.http = HTTPConfig(
+        source_timeout=0.2, breaker_failures=2, breaker_reset=0.5
+    )
+    upstream = Upstream()
+    source = CachedSource('test', upstream.fetch, ttl=0.5)
+
+    # concurrent misses share one fetch
+    values = await asyncio.gather(*(source.get() for _ in range(50)))
+    assert set(values) == {'value 1'} and upstream.calls == 1
+
+    # a hit close to expiry answers at once and refreshes in background
+    await asyncio.sleep(0.45)
+    assert await source.get() == 'value 1'
+    await asyncio.sleep(0.1)
+    assert await source.get() == 'value 2' and upstream.calls == 2
+
+    # expired and the upstream hangs, the request does not
+    await asyncio.sleep(0.5)
+    upstream.delay = 1
+    start = time.perf_counter()
+    assert await source.get() == 'value 2'  # last known good
+    assert time.perf_counter() - start < 0.3
+
+    # failures open the circuit, the upstream is left alone
+    upstream.delay, upstream.down = 0, True
+    await asyncio.sleep(1)  # the hanging fetch gives up
+    for _ in range(5):
+        assert await source.get() == 'value 2'
+    assert upstream.calls == 4 and source.stats()['circuit_open']
+
+    # half open after the reset, one probe closes it again
+    upstream.down = False
+    await asyncio.sleep(0.5)
+    assert await source.get() == 'value 5'
+    assert not source.stats()['circuit_open']
+    print(source.stats())
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.join(os.getcwd(), 'src'))
+from config import Config, MailConfig
+from service import MailService
+
+
+class SMTPStandIn:
+    """
+    Just enough SMTP to accept mails on localhost, it records the
+    subjects in delivery order and can drop the first connections
+    in the middle of DATA.
+    """
+    def __init__(self, drop_connections: int = 0):
+        self.subjects: list[str] = []
+        self.recipients: list[list[str]] = []  # per transaction
+        self.connections = 0
+        self.drop_connections = drop_connections
+
+    async def handle(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter
+    ):
+        self.connections += 1
+        writer.write(b'220 localhost ESMTP stand-in\r\n')
+        while line := await reader.readline():
+            command = line.decode().strip().upper()
+            if command.startswith('EHLO'):
+                writer.write(b'250-localhost\r\n250 AUTH PLAIN LOGIN\r\n')
+            elif command.startswith('AUTH'):
+                writer.write(b'235 authenticated\r\n')
+            elif command.startswith('MAIL'):
+                self.recipients.append(recipients := [])
+                writer.write(b'250 ok\r\n')
+            elif command.startswith('RCPT'):
+                recipients.append(line.decode()[8:].strip())
+                writer.write(b'250 ok\r\n')
+            elif command == 'DATA':
+                if self.drop_connections > 0:
+                    self.drop_connections -= 1
+                    break
+                writer.write(b'354 end with .\r\n')
+                await writer.drain()
+                while (data := await reader.readline()) != b'.\r\n':
+                    if data.lower().startswith(b'subject:'):
+                        self.subjects.append(data[8:].decode().strip())
+                writer.write(b'250 queued\r\n')
+            elif command == 'QUIT':
+                writer.write(b'221 bye\r\n')
+                break
+            else:  # RSET, NOOP
+                writer.write(b'250 ok\r\n')
+            await writer.drain()
+        writer.close()
+
+
+async def main():
+    stand_in = SMTPStandIn(drop_connections=1)
+    server = await asyncio.start_server(stand_in.handle, '127.0.0.1', 0)
+    Config.mail = MailConfig(
+        host='127.0.0.1',
+        port=server.sockets[0].getsockname()[1],
+        username='blog@localhost',
+        password='password',
+        start_tls=False,
+        pool_size=1,
+        retry_backoff=0
+    )
+
+    for i in range(20):
+        await MailService.send_mail_async(['bulk@localhost'], f'bulk {i}', '')
+    await MailService.send_mail_async(
+        ['user@localhost'], '2fa', '', priority=MailService.URGENT
+    )
+    await asyncio.sleep(0.5)
+    await MailService.close()
+    server.close()
+
+    # the code jumped the queue, dropped once, then retried
+    # while the next mail was sent on the new connection
+    assert stand_in.subjects.index('2fa') <= 1, stand_in.subjects
+    assert sorted(stand_in.subjects) == sorted(
+        ['2fa', *(f'bulk {i}' for i in range(20))]
+    )
+    assert stand_in.connections == 2  # one reconnect after the drop
+    print(MailService.stats())
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -13,7 +13,9 @@ Config.mail = MailConfig(
 
 
 async def test():
-    await MailService.daily_mail()
+    await MailService.deliver(
+        ['iswangwr@outlook.com'], 'mail test', '<p>mail test</p>'
+    )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,34 @@
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.join(os.getcwd(), 'src'))
+from dao.async_redis import FakeRedis
+
+
+async def main():
+    redis = FakeRedis.get_instance()
+
+    # concurrent requests never take more than the burst
+    results = await asyncio.gather(*(
+        redis.token_bucket('bucket', rate=1, capacity=5)
+        for _ in range(50)
+    ))
+    assert sum(x.allowed for x in results) == 5
+    denied = next(x for x in results if not x.allowed)
+    assert denied.remaining == 0 and 0 < denied.retry_after <= 1
+    await asyncio.sleep(1)
+    assert (await redis.token_bucket('bucket', 1, 5)).allowed
+
+    results = await asyncio.gather(*(
+        redis.sliding_window('window', period=60, allowance=3)
+        for _ in range(10)
+    ))
+    assert sum(x.allowed for x in results) == 3
+    assert [x.remaining for x in results[:4]] == [2, 1, 0, 0]
+    assert all(0 < x.retry_after <= 60 for x in results[3:])
+    print('rate limit ok')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.getcwd(), 'src'))
+from config import Config
+from dao import AsyncDatabase, CounterDao, ReadScope, ResourceDao
+from models import Content, PostCategory, PostTag
+from schemas import ResourceQuery
+from service import CounterService, ResourceService
+
+
+# title -> permission, owner id, group id
+POSTS = {
+    'public': (711, 2, None),
+    'owner': (700, 2, None),
+    'group': (770, 3, 5),
+    'other owner': (700, 3, None),
+    'group denied': (700, 3, 5)
+}
+# reader -> titles readable, admins are not scoped
+READERS = {
+    'admin': (None, set(POSTS)),
+    'anonymous': (ReadScope(), {'public'}),
+    'owner': (ReadScope(2), {'public', 'owner'}),
+    'member': (ReadScope(4, (5,)), {'public', 'group'}),
+    'other owner': (
+        ReadScope(3, (5,)),
+        {'public', 'group', 'other owner', 'group denied'}
+    )
+}
+
+
+def init_config(workdir: str):
+    Config.load_json(
+        admin={
+            'username': 'admin',
+            'password': 'password',
+            'email': 'admin@localhost',
+            'role': {'name': 'admin'}
+        },
+        database={
+            'drivername': 'sqlite+aiosqlite',
+            'database': os.path.join(workdir, 'test.sqlite')
+        },
+        folders=[
+            {'title': 'root', 'url': '', 'permission': 0},
+            {'title': 'post', 'url': '/post', 'parent_url': '',
+             'permission': 711}
+        ],
+        jwt={'key': 'test'},
+        static={'root_path': workdir},
+        two_fa={'enforcement': False, 'jwt_key': 'test 2fa'}
+    )
+
+
+async def seed() -> dict[int, str]:
+    async with AsyncDatabase.new_session() as session:
+        tag, category = PostTag(name='shared'), PostCategory(name='shared')
+        contents = []
+        for title, (permission, owner_id, group_id) in POSTS.items():
+            content = Content(
+                title=title,
+                url=f'/post/{title}',
+                permission=permission,
+                parent_url='/post'
+            )
+            content.this_url = f'/{title}'
+            content.owner_id, content.group_id = owner_id, group_id
+            content.tags, content.category = [tag], category
+            contents.append(content)
+        session.add_all(contents)
+        await session.commit()
+        return {x.id: x.title for x in contents}
+
+
+async def main():
+    init_config(tempfile.mkdtemp())
+    await AsyncDatabase.init_database()
+    titles = await seed()
+    await CounterDao.reset_counts()
+
+    for reader, (read_scope, expected) in READERS.items():
+        rows = await ResourceDao.get_sub_resources(
+            '/post', ResourceQuery(), Content, read_scope
+        )
+        assert {titles[x.id] for x in rows} == expected, reader
+
+        pages, page_idx = [], 0
+        while len(page := await ResourceService.find_sub_resources(
+            '/post',
+            ResourceQuery(page_idx=page_idx, page_size=2),
+            Content,
+            read_scope
+        )) > 0:
+            assert len(page) <= 2
+            pages.extend(titles[x.id] for x in page)
+            page_idx += 1
+        assert len(pages) == len(expected) and set(pages) == expected
+
+        # counters for admins and anonymous, counted live otherwise
+        for query in (
+            ResourceQuery(),
+            ResourceQuery(tag_name='shared'),
+            ResourceQuery(category_name='shared')
+        ):
+            count = await ResourceService.find_sub_count(
+                '/post', query, Content, read_scope
+            )
+            assert count == len(expected), (reader, query, count)
+        for tag_class in (PostTag, PostCategory):
+            tag_counts = await CounterService.find_tag_counts(
+                '/post', tag_class, read_scope
+            )
+            assert [x.count for x in tag_counts] == [len(expected)], reader
+        archive = await CounterService.find_archive('/post', read_scope)
+        assert sum(
+            count for months in archive.values() for count in months.values()
+        ) == len(expected), reader
+        print(f'{reader:<12} reads {sorted(expected)}')
+    await AsyncDatabase.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.staticfiles import StaticFiles
+
+sys.path.append(os.path.join(os.getcwd(), 'src'))
+from config import Config, StaticResource
+from service import StaticFileServer
+
+
+REQUESTS = 2000
+CONCURRENCY = 32
+
+
+async def run(app: Starlette, url: str, headers: dict[str, str]) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url='http://bench'
+    ) as client:
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+
+        async def request():
+            async with semaphore:
+                response = await client.get(url, headers=headers)
+                assert response.status_code in (200, 206, 304)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(request() for _ in range(REQUESTS)))
+        return REQUESTS / (time.perf_counter() - start)
+
+
+async def main():
+    Config.static = StaticResource()
+    with tempfile.TemporaryDirectory() as directory:
+        digest_name = 'a' * 64 + '.bin'
+        for name, size in (('small.js', 4 * 1024), (digest_name, 8 << 20)):
+            with open(os.path.join(directory, name), 'wb') as f:
+                f.write(os.urandom(size))
+
+        apps = {
+            'StaticFiles': Starlette(routes=[
+                Mount('/static', StaticFiles(directory=directory))
+            ]),
+            'StaticFileServer': Starlette(routes=[
+                Mount('/static', StaticFileServer(directory=directory))
+            ])
+        }
+        etags = {}
+        for name, app in apps.items():
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app),
+                base_url='http://bench'
+            ) as client:
+                response = await client.get('/static/small.js')
+                etags[name] = response.headers['etag']
+
+        cases = {
+            'small file': ('/static/small.js', {}),
+            'large file': (f'/static/{digest_name}', {}),
+            'range 64KB': (
+                f'/static/{digest_name}', {'range': 'bytes=0-65535'}
+            ),
+            'revalidate': ('/static/small.js', None)
+        }
+        for case, (url, headers) in cases.items():
+            for name, app in apps.items():
+                if headers is None:
+                    request_headers = {'if-none-match': etags[name]}
+                else:
+                    request_headers = headers
+                rps = await run(app, url, request_headers)
+                print(f'{case:<12} {name:<18} {rps:>10.1f} req/s')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
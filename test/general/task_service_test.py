@@ -0,0 +1,46 @@
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.join(os.getcwd(), 'src'))
+from config import Config, TaskConfig
+from service import TaskService
+
+
+attempts: dict[str, int] = dict()
+
+
+async def flaky(key: str, failures: int):
+    attempts[key] = attempts.get(key, 0) + 1
+    if attempts[key] <= failures:
+        raise ConnectionError(f'{key} attempt {attempts[key]}')
+
+
+async def main():
+    Config.redis = None  # durable tasks fall back to the local pool
+    Config.task = TaskConfig(
+        pool_size=2, queue_size=4, max_retries=2, retry_backoff=0
+    )
+    TaskService.register(flaky)
+    await TaskService.init()
+
+    for _ in range(10):  # more than the pool holds at once
+        TaskService.submit(asyncio.sleep(0.01))
+    await TaskService.enqueue(flaky, key='recovers', failures=2)
+    await TaskService.enqueue(flaky, key='gives up', failures=5)
+    try:
+        await TaskService.enqueue(asyncio.sleep, delay=0)
+        raise AssertionError('unregistered task enqueued')
+    except KeyError:
+        pass
+    await TaskService.close()  # drains before returning
+
+    stats = await TaskService.stats()
+    print(stats)
+    assert stats['dropped'] == 10 - stats['submitted'] > 0
+    assert attempts == {'recovers': 3, 'gives up': 3}
+    assert stats['retries'] == 4 and stats['dead_lettered'] == 1
+
+
+if __name__ == '__main__':
+    asyncio.run(main())